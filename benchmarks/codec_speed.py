@@ -0,0 +1,57 @@
+"""
+Codec benchmark on typical 1-10 KB documents (encode + decode round trip)
+
+e.g.,
+    python -m benchmarks.codec_speed --sizes 1000,4000,10000
+"""
+import argparse
+import random
+import string
+import timeit
+
+from tesselite.codecs import CODECS, get_codec
+from tesselite.exceptions import ConfigurationException
+
+
+def document(size: int, seed: int = 0) -> dict:
+    """a json-like event of roughly `size` bytes once serialized"""
+    rng = random.Random(seed)
+    doc = {"uid": rng.randrange(10 ** 9), "type": "event", "source": "tesselite", "tags": [], "items": []}
+    while len(get_codec("json").encode(doc)) < size:
+        doc["items"].append({
+            "id": rng.randrange(10 ** 6),
+            "name": "".join(rng.choices(string.ascii_lowercase, k=12)),
+            "price": round(rng.uniform(0, 1000), 2),
+            "active": rng.random() > 0.5,
+        })
+    return doc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,4000,10000", help="approximate json sizes (bytes)")
+    parser.add_argument("--number", type=int, default=2000, help="round trips per run")
+    parser.add_argument("--repeat", type=int, default=5, help="runs, the fastest one is kept")
+    args = parser.parse_args()
+
+    codecs = {}
+    for name in CODECS:
+        try:
+            codecs[name] = get_codec(name)
+        except ConfigurationException as err:
+            print(f"skipping {name}: {err}")
+
+    for size in map(int, args.sizes.split(",")):
+        doc = document(size)
+        print(f"\n~{size} bytes document")
+        for name, codec in codecs.items():
+            raw = codec.encode(doc)
+            encode = min(timeit.repeat(lambda: codec.encode(doc), number=args.number, repeat=args.repeat))
+            decode = min(timeit.repeat(lambda: codec.decode(raw), number=args.number, repeat=args.repeat))
+            encode_us, decode_us = encode / args.number * 1e6, decode / args.number * 1e6
+            print(f"  {name:8} {len(raw):7} bytes | encode {encode_us:8.1f} us | decode {decode_us:8.1f} us | "
+                  f"round trip {len(raw) / (encode_us + decode_us):8.1f} MB/s")
+
+
+if __name__ == '__main__':
+    main()
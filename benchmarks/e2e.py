@@ -0,0 +1,236 @@
+"""
+End-to-end throughput and latency benchmark
+
+Drives pubsubFactory backends (e.g., memory, redis, redis-streams, gcp-pubsub) against the brokers of compose.yaml
+(for gcp-pubsub, point PUBSUB_EMULATOR_HOST to the emulator), sweeping message size, publisher/consumer
+count, publish batch size and gcp-pubsub client batching (max messages, max latency).
+
+e.g.,
+    python -m benchmarks.e2e run --broker redis --broker redis-streams --sizes 100,1000 --batches 0,100 \\
+        --output results.json
+    python -m benchmarks.e2e compare baseline.json results.json
+
+scenarios can also be driven from code (e.g., a pytest-benchmark fixture) with run_scenario().
+"""
+import argparse
+import itertools
+import json
+import platform
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+
+from tesselite.pubsub import pubsubFactory
+
+# message layout: <send time (ns)>:<padding>
+SEPARATOR = ":"
+
+
+@dataclass
+class Scenario:
+    broker: str
+    size: int = 100
+    publishers: int = 1
+    consumers: int = 1
+    batch: int = 0  # 0: publish one by one, else publish_many chunk size
+    messages: int = 10000  # per publisher
+    max_messages: int = 0  # gcp-pubsub client batching, 0: backend default
+    max_latency: float = 0.  # gcp-pubsub client batching (s), 0: backend default
+
+
+@dataclass
+class Result:
+    scenario: dict
+    published: int
+    received: int
+    expected: int
+    duration: float
+    throughput: float  # received msgs/sec
+    p50_ms: float
+    p99_ms: float
+    p999_ms: float
+
+
+def percentile(ordered: list, q: float) -> float:
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def fanout(broker: str) -> bool:
+    """every consumer gets every message (pub/sub), otherwise consumers share them (queues)"""
+    return broker.lower() in ("redis", "memory")
+
+
+def batching(scenario: Scenario) -> dict:
+    """publisher arguments of the client batching settings (gcp-pubsub only)"""
+    if scenario.broker.upper().replace("_", "-") != "GCP-PUBSUB":
+        return {}
+    return dict(max_messages=scenario.max_messages, max_latency=scenario.max_latency)
+
+
+def run_scenario(scenario: Scenario, timeout: float = 120, warmup: float = 1) -> Result:
+    backend = pubsubFactory(scenario.broker)
+    topic = f"tesselite-bench-{uuid.uuid4().hex[:8]}"
+    expected = scenario.messages * scenario.publishers * (scenario.consumers if fanout(scenario.broker) else 1)
+
+    latencies = []
+    lock = threading.Lock()
+    done = threading.Event()
+    stopping = threading.Event()
+
+    def callback(message):
+        if stopping.is_set():
+            # consume exits gracefully, its pubsub is closed
+            raise KeyboardInterrupt()
+        received = time.time_ns()
+        sent = int(message[:message.index(SEPARATOR)])
+        with lock:
+            latencies.append(received - sent)
+            if len(latencies) >= expected:
+                done.set()
+
+    def consume():
+        with backend(topic=topic, log_name="bench-consumer") as pubsub:
+            pubsub.consume(callback=callback, subscription=topic)
+
+    def messages():
+        for _ in range(scenario.messages):
+            header = f"{time.time_ns()}{SEPARATOR}"
+            yield header + "x" * max(0, scenario.size - len(header))
+
+    def publish():
+        with backend(topic=topic, log_name="bench-publisher", **batching(scenario)) as pubsub:
+            if scenario.batch:
+                pubsub.publish_many(messages(), chunk_size=scenario.batch)
+            else:
+                for msg in messages():
+                    pubsub.publish(msg)
+
+    consumers = [threading.Thread(target=consume, daemon=True) for _ in range(scenario.consumers)]
+    for thread in consumers:
+        thread.start()
+    time.sleep(warmup)
+
+    started = time.monotonic()
+    publishers = [threading.Thread(target=publish) for _ in range(scenario.publishers)]
+    for thread in publishers:
+        thread.start()
+    for thread in publishers:
+        thread.join()
+    done.wait(timeout=timeout)
+    duration = time.monotonic() - started
+
+    with lock:
+        ordered = sorted(latencies)
+    stop(backend, topic, consumers, stopping, timeout)
+    return Result(scenario=asdict(scenario), published=scenario.messages * scenario.publishers,
+                  received=len(ordered), expected=expected, duration=duration,
+                  throughput=len(ordered) / duration if duration else 0.,
+                  p50_ms=percentile(ordered, 0.5) / 1e6, p99_ms=percentile(ordered, 0.99) / 1e6,
+                  p999_ms=percentile(ordered, 0.999) / 1e6)
+
+
+def stop(backend, topic: str, consumers: list, stopping: threading.Event, timeout: float):
+    """
+    consumers stop on the next message they receive: stop messages are published until they are all gone
+    (consumers of a queue share messages), a scenario doesn't leave consumers polling behind it
+    """
+    stopping.set()
+    deadline = time.monotonic() + timeout
+    with backend(topic=topic, log_name="bench-stopper") as pubsub:
+        while any(thread.is_alive() for thread in consumers) and time.monotonic() < deadline:
+            pubsub.publish(f"{time.time_ns()}{SEPARATOR}stop")
+            for thread in consumers:
+                thread.join(0.1)
+    alive = sum(thread.is_alive() for thread in consumers)
+    if alive:
+        print(f"warning: {alive} consumer(s) of {topic} still running")
+
+
+def sweep(brokers, sizes, publishers, consumers, batches, messages, max_messages=(0,), max_latencies=(0.,)):
+    for broker, size, n_pub, n_con, batch, n_max, latency in itertools.product(
+            brokers, sizes, publishers, consumers, batches, max_messages, max_latencies):
+        yield Scenario(broker=broker, size=size, publishers=n_pub, consumers=n_con, batch=batch, messages=messages,
+                       max_messages=n_max, max_latency=latency)
+
+
+def report(result: Result):
+    s = result.scenario
+    print(f"{s['broker']:14} size={s['size']:<6} pub={s['publishers']:<2} con={s['consumers']:<2} "
+          f"batch={s['batch']:<4} max={s.get('max_messages', 0):<4} latency={s.get('max_latency', 0.):<5} "
+          f"| {result.throughput:10.0f} msg/s | p50={result.p50_ms:8.2f}ms "
+          f"p99={result.p99_ms:8.2f}ms p999={result.p999_ms:8.2f}ms | {result.received}/{result.expected}")
+
+
+def key(scenario: dict) -> tuple:
+    # results saved before gcp batching was swept: backend defaults
+    return tuple(scenario[field] for field in ("broker", "size", "publishers", "consumers", "batch")) + \
+        (scenario.get("max_messages", 0), scenario.get("max_latency", 0.))
+
+
+def compare(baseline: str, candidate: str):
+    with open(baseline) as before, open(candidate) as after:
+        old = {key(r["scenario"]): r for r in json.load(before)["results"]}
+        new = {key(r["scenario"]): r for r in json.load(after)["results"]}
+    for k in sorted(old.keys() & new.keys()):
+        o, n = old[k], new[k]
+        print(f"{' '.join(map(str, k)):40} throughput {o['throughput']:10.0f} -> {n['throughput']:10.0f} "
+              f"({(n['throughput'] / o['throughput'] - 1) * 100 if o['throughput'] else 0:+.1f}%) | "
+              f"p99 {o['p99_ms']:.2f} -> {n['p99_ms']:.2f} ms")
+
+
+def integers(value: str) -> list:
+    return [int(v) for v in value.split(",")]
+
+
+def floats(value: str) -> list:
+    return [float(v) for v in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="runs a sweep")
+    run.add_argument("--broker", action="append", help="repeatable (default: redis)")
+    run.add_argument("--sizes", type=integers, default=[100, 1000, 10000], help="message sizes (bytes)")
+    run.add_argument("--publishers", type=integers, default=[1])
+    run.add_argument("--consumers", type=integers, default=[1])
+    run.add_argument("--batches", type=integers, default=[0, 100], help="publish_many chunk sizes, 0: no batch")
+    run.add_argument("--messages", type=int, default=10000, help="per publisher")
+    run.add_argument("--max-messages", type=integers, default=[0],
+                     help="gcp-pubsub client batch sizes (messages), 0: backend default")
+    run.add_argument("--max-latencies", type=floats, default=[0.],
+                     help="gcp-pubsub client batch latencies (s), 0: backend default")
+    run.add_argument("--timeout", type=float, default=120, help="max wait for deliveries (s) per scenario")
+    run.add_argument("--output", help="json results")
+    diff = commands.add_parser("compare", help="compares two json results")
+    diff.add_argument("baseline")
+    diff.add_argument("candidate")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        compare(args.baseline, args.candidate)
+        return
+
+    results = []
+    for scenario in sweep(args.broker or ["redis"], args.sizes, args.publishers, args.consumers, args.batches,
+                          args.messages, args.max_messages, args.max_latencies):
+        result = run_scenario(scenario, timeout=args.timeout)
+        report(result)
+        results.append(asdict(result))
+    if args.output:
+        meta = dict(python=platform.python_version(), implementation=platform.python_implementation(),
+                    machine=platform.machine(), timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        try:
+            from importlib.metadata import version
+            meta["version"] = version("tesselite-pubsub")
+        except Exception:
+            meta["version"] = None
+        with open(args.output, "w") as f:
+            json.dump(dict(meta=meta, results=results), f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
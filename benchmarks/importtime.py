@@ -0,0 +1,56 @@
+"""
+Import-time benchmark (python -X importtime)
+
+e.g.,
+    python -m benchmarks.importtime --module tesselite.pubsub --budget-ms 50
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# heavy modules that must only be imported once a backend is selected (dotenv: once a setting is read)
+BACKEND_MODULES = ("redis", "google.cloud.pubsub_v1", "grpc", "dotenv")
+
+
+def importtime(module: str) -> dict:
+    """imports module in a fresh interpreter, returns {module: cumulative import time (us)}"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          env=env, capture_output=True, text=True, check=True)
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="tesselite.pubsub")
+    parser.add_argument("--repeat", type=int, default=5, help="runs, the fastest one is kept")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports displayed")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fails if the import is slower")
+    args = parser.parse_args()
+
+    runs = [importtime(args.module) for _ in range(args.repeat)]
+    best = min(runs, key=lambda timings: timings[args.module])
+    total_ms = best[args.module] / 1000
+
+    print(f"import {args.module}: {total_ms:.1f} ms (best of {args.repeat})")
+    for name, cumulative in sorted(best.items(), key=lambda item: -item[1])[1:args.top + 1]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    leaked = [name for name in BACKEND_MODULES if name in best]
+    if leaked:
+        print(f"FAIL: backend modules imported eagerly: {leaked}")
+        sys.exit(1)
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"FAIL: over budget ({args.budget_ms} ms)")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
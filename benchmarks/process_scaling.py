@@ -0,0 +1,84 @@
+"""
+CPU-bound callback scaling: a pool of threads (one GIL) vs worker processes fed through shared memory rings
+
+the callback parses and transforms ~size bytes json documents, payloads are submitted by a single reader
+(as consume does), throughput is measured from the first submit to the last result.
+
+e.g.,
+    python -m benchmarks.process_scaling --parallelism 1,2,4,8 --size 4000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+from benchmarks.codec_speed import document
+from tesselite.dispatch import Dispatcher
+from tesselite.processes import ProcessPool
+
+
+def transform(doc: dict) -> dict:
+    """a typical enrichment: per item computation, then re-serialization"""
+    for item in doc["items"]:
+        item["total"] = round(item["price"] * 1.2, 2)
+        item["label"] = item["name"].upper()
+    doc["total"] = sum(item["total"] for item in doc["items"])
+    return json.loads(json.dumps(doc))
+
+
+def callback(payload: str):
+    transform(json.loads(payload))
+
+
+def threads(payloads: list, workers: int) -> float:
+    started = time.perf_counter()
+    with Dispatcher(lambda payload: callback(payload.decode()), workers=workers, queue_size=1000) as dispatcher:
+        for payload in payloads:
+            dispatcher.submit(payload)
+    return len(payloads) / (time.perf_counter() - started)
+
+
+def processes(payloads: list, workers: int, context) -> float:
+    done = threading.Semaphore(0)
+    pool = ProcessPool(callback, workers, on_done=lambda context, error: done.release(), context=context)
+    pool.start()
+    try:
+        # warm up: worker processes are started
+        pool.submit(payloads[0])
+        done.acquire()
+        started = time.perf_counter()
+        for payload in payloads:
+            pool.submit(payload)
+        for _ in payloads:
+            done.acquire()
+        return len(payloads) / (time.perf_counter() - started)
+    finally:
+        pool.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parallelism", default="1,2,4,8", help="threads / processes counts")
+    parser.add_argument("--size", type=int, default=4000, help="approximate json size (bytes)")
+    parser.add_argument("--messages", type=int, default=5000, help="messages per run")
+    parser.add_argument("--start-method", default=None, help="multiprocessing start method (fork, spawn, ..)")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context(args.start_method)
+    payload = json.dumps(document(args.size)).encode()
+    payloads = [payload] * args.messages
+    print(f"{args.messages} messages of {len(payload)} bytes, {os.cpu_count()} cpu(s), "
+          f"start method: {context.get_start_method()}")
+    baseline = None
+    for count in map(int, args.parallelism.split(",")):
+        threaded = threads(payloads, count)
+        multiprocess = processes(payloads, count, context)
+        baseline = baseline if baseline else multiprocess
+        print(f"  {count:3} | threads {threaded:9.0f} msg/s | processes {multiprocess:9.0f} msg/s "
+              f"(x{multiprocess / baseline:.2f})")
+
+
+if __name__ == '__main__':
+    main()
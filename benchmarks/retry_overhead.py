@@ -0,0 +1,52 @@
+"""
+Success-path overhead of the connexion decorator
+
+e.g.,
+    python -m benchmarks.retry_overhead --number 1000000
+"""
+import argparse
+import timeit
+
+from tesselite.exceptions import connexion
+from tesselite.retry import CircuitBreaker, RetryBudget, RetryPolicy, policies
+
+
+def action():
+    return None
+
+
+@connexion(expected_errors=(ConnectionError,), operation="bench-default")
+def default_policy():
+    return None
+
+
+@connexion(expected_errors=(ConnectionError,), operation="bench-full")
+def full_policy():
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=1_000_000, help="calls per run")
+    parser.add_argument("--repeat", type=int, default=5, help="runs, the fastest one is kept")
+    args = parser.parse_args()
+
+    policies["bench-full"] = RetryPolicy(max_attempts=5, deadline=10, budget=RetryBudget(), breaker=CircuitBreaker())
+    candidates = {"bare call": action, "connexion (default policy)": default_policy,
+                  "connexion (budget + breaker)": full_policy}
+    try:
+        # the decorator connexion used to be built on
+        from retry import retry
+        candidates["retry.retry (legacy)"] = retry((ConnectionError,), delay=2, backoff=2, max_delay=20)(action)
+    except ImportError:
+        pass
+
+    baseline = None
+    for name, candidate in candidates.items():
+        best = min(timeit.repeat(candidate, number=args.number, repeat=args.repeat)) / args.number * 1e9
+        baseline = best if baseline is None else baseline
+        print(f"{name:32} {best:8.1f} ns/call  (+{best - baseline:.1f} ns)")
+
+
+if __name__ == '__main__':
+    main()
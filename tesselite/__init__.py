@@ -1,4 +1,5 @@
 # High-Level Setters
+import functools
 import logging
 import os
 import sys
@@ -8,6 +9,13 @@ from tesselite.exceptions import ConfigurationException
 APPLICATION_NAME = "tesselite"
 
 
+@functools.lru_cache(maxsize=None)
+def dotenv():
+    """loads the .env file (once)"""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
 class Logger(logging.Logger):
 
     def __init__(self, name=APPLICATION_NAME):
@@ -20,39 +28,78 @@ class Logger(logging.Logger):
         fmt = logging.Formatter('[%(name)s][%(levelname)s][%(asctime)s] %(message)s', datefmt='%Y-%m-%d %I:%M:%S')
         hdr.setFormatter(fmt)
         # load env vars
-        from dotenv import load_dotenv
-        load_dotenv()
+        dotenv()
         # set loglevel
         lvl = os.environ.get('LOGLEVEL', 'ERROR').upper()
         self.setLevel(lvl)
         self.addHandler(hdr)
 
 
-root_logger = Logger(APPLICATION_NAME)
+def __getattr__(name):
+    # the root logger loads the .env file: created on first use, not on import
+    if name == "root_logger":
+        globals()["root_logger"] = Logger(APPLICATION_NAME)
+        return globals()["root_logger"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def load(var):
     try:
         return os.environ[var]
     except KeyError:
-         root_logger.fatal(f"the env variable '{var}' is missing.")
+         __getattr__("root_logger").fatal(f"the env variable '{var}' is missing.")
          exit(1)
 
 
+class setting:
+    """
+    env variable resolved on first access, then cached
+    a setting without default is mandatory
+    """
+
+    def __init__(self, var: str, default=None, cast=str):
+        self._var = var
+        self._default = default
+        self._cast = cast
+
+    def __get__(self, obj, owner=None):
+        try:
+            return self._value
+        except AttributeError:
+            dotenv()
+            if self._default is None:
+                self._value = self._cast(load(self._var))
+            else:
+                self._value = self._cast(os.environ.get(self._var, self._default))
+            return self._value
+
+
 class RedisEnv:
-    from dotenv import load_dotenv
-    load_dotenv()
-    HOST = os.environ.get("REDIS_HOST", "localhost")
-    PORT = int(os.environ.get("REDIS_PORT", "6379"))
-    DB = int(os.environ.get("REDIS_DB", "0"))
-    PASSWORD = os.environ.get("REDIS_PASSWORD", "")
+    HOST = setting("REDIS_HOST", "localhost")
+    PORT = setting("REDIS_PORT", "6379", int)
+    DB = setting("REDIS_DB", "0", int)
+    PASSWORD = setting("REDIS_PASSWORD", "")
+    # streams only (0 = unbounded)
+    STREAM_MAXLEN = setting("REDIS_STREAM_MAXLEN", "0", int)
+    # cluster only: startup nodes (host:port,host:port,...), defaults to HOST:PORT
+    CLUSTER_NODES = setting("REDIS_CLUSTER_NODES", "")
+    # sharded only: servers of the hash ring (host:port or redis:// urls, comma separated), defaults to HOST:PORT
+    ENDPOINTS = setting("REDIS_ENDPOINTS", "")
     TOPIC_NAME = 'tesselite-pubsub'
+    SUBSCRIPTION_NAME = 'tesselite'
 
 
 class GCPEnv:
-    from dotenv import load_dotenv
-    load_dotenv()
-    GOOGLE_PROJECT = load('GOOGLE_PROJECT')
-    GOOGLE_APPLICATION_CREDENTIALS = load('GOOGLE_APPLICATION_CREDENTIALS')
+    GOOGLE_PROJECT = setting('GOOGLE_PROJECT')
+    GOOGLE_APPLICATION_CREDENTIALS = setting('GOOGLE_APPLICATION_CREDENTIALS')
+    # publisher batching (client defaults)
+    BATCH_MAX_MESSAGES = setting("GOOGLE_BATCH_MAX_MESSAGES", "100", int)
+    BATCH_MAX_BYTES = setting("GOOGLE_BATCH_MAX_BYTES", "1000000", int)
+    BATCH_MAX_LATENCY = setting("GOOGLE_BATCH_MAX_LATENCY", "0.01", float)
+    # subscriber flow control (client defaults)
+    FLOW_MAX_MESSAGES = setting("GOOGLE_FLOW_MAX_MESSAGES", "1000", int)
+    FLOW_MAX_BYTES = setting("GOOGLE_FLOW_MAX_BYTES", "104857600", int)
+    FLOW_MAX_LEASE_DURATION = setting("GOOGLE_FLOW_MAX_LEASE_DURATION", "3600", int)
+    SCHEDULER_WORKERS = setting("GOOGLE_SCHEDULER_WORKERS", "10", int)
     TOPIC_NAME = 'tesselite-pubsub'
     SUBSCRIPTION_NAME = 'tesselite'
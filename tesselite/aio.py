@@ -0,0 +1,207 @@
+"""
+Handle messaging (publish/consume) from asyncio code
+"""
+import abc
+import socket
+from itertools import islice
+from typing import AsyncIterator, Iterable, List, Union
+
+import redis
+import redis.asyncio
+
+from tesselite.codecs import Codec, get_codec
+from tesselite.compression import Compressor, compress, decompress, get_compressor
+from tesselite.deadletter import describe, unwrap
+from tesselite.exceptions import async_connexion
+from tesselite.framing import unpack
+from tesselite.message import Message
+from tesselite.metrics import PUBLISHED
+
+
+class AsyncPubsub(abc.ABC):
+    """
+    Publish messages into a Broker, without blocking the event loop
+    """
+
+    # tesselite.codecs.Codec, set by backends from their `codec` argument
+    codec = None
+    # tesselite.compression.Compressor, set by backends from their `compression` argument
+    compressor = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @abc.abstractmethod
+    async def open(self):
+        pass
+
+    @abc.abstractmethod
+    async def close(self):
+        pass
+
+    @abc.abstractmethod
+    async def publish(self, msg: str):
+        raise NotImplementedError()
+
+    async def publish_many(self, msgs: Iterable, chunk_size: int = 100) -> List:
+        """
+        publish a bunch of messages
+        default: one publish per message, backends may override with a batched path
+        """
+        return [await self.publish(msg) for msg in msgs]
+
+    @abc.abstractmethod
+    def subscribe(self, envelope: bool = False) -> AsyncIterator[str]:
+        """
+        async iterator over message payloads (tesselite.message.Message if envelope=True)
+        e.g.,
+            async for message in pubsub.subscribe():
+                print(message)
+        """
+        raise NotImplementedError()
+
+    def _encode(self, msg):
+        """serializes msg with the codec, if any"""
+        return self.codec.encode(msg) if self.codec else msg
+
+    def _payload(self, msg) -> bytes:
+        """broker message: serialized then compressed above the compressor threshold"""
+        data = self._encode(msg)
+        data = data.encode() if isinstance(data, str) else data
+        return compress(data, self.compressor) if self.compressor else data
+
+    def _unpack(self, raw: bytes) -> list:
+        """payloads carried by a broker message (dead letter header stripped, decompressed, frames unpacked)"""
+        return unpack(decompress(unwrap(raw)[0], self.compressor))
+
+    def _decode(self, raw: bytes):
+        """deserializes a payload with the codec, utf-8 decodes it otherwise"""
+        return self.codec.decode(raw) if self.codec else raw.decode()
+
+
+class AsyncRedisPubsub(AsyncPubsub):
+    """
+    redis.asyncio flavor: all publishers of a client share one connection pool
+    """
+
+    def __init__(self, topic: str, log_name: str = "redis-pubsub-async", max_connections: int = None,
+                 codec: Union[str, Codec] = None, compression: Union[str, Compressor] = None):
+        """
+        max_connections: connection pool size, unbounded by default
+        codec: serializes published objects and deserializes payloads
+            (json, orjson, msgpack, auto or a tesselite.codecs.Codec), None: str/bytes as is
+        compression: compresses payloads above a size threshold, payloads are decompressed automatically
+            (zlib, zstd, lz4, auto or a tesselite.compression.Compressor), None: no compression
+        """
+        from tesselite import Logger
+        self.logger = Logger(log_name)
+        from tesselite import RedisEnv
+        self.logger.debug("loading ..")
+        self._env = RedisEnv()
+        self._client = None
+        self._max_connections = max_connections
+        self.codec = get_codec(codec)
+        self.compressor = get_compressor(compression)
+        self._topic = topic if topic else self._env.TOPIC_NAME
+        self._published = PUBLISHED.labels(self._topic)
+        self.logger.debug("\n"
+                          "detected this config:\n"
+                          f"HOST: {self._env.HOST}\n"
+                          f"PORT: {self._env.PORT}\n"
+                          f"PASSWORD: ( "
+                          f"{'hidden' if self._env.PASSWORD else 'empty'} )")
+
+    @property
+    def topic(self):
+        return self._topic
+
+    @async_connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,))
+    async def open(self):
+        self.logger.debug("connecting ..")
+        self._client = redis.asyncio.Redis(host=self._env.HOST, port=self._env.PORT,
+                                           db=self._env.DB, password=self._env.PASSWORD,
+                                           max_connections=self._max_connections)
+        self.logger.debug("pinging ..")
+        await self._client.ping()
+        self.logger.info("ready.")
+
+    async def close(self):
+        await self._client.aclose()
+        self.logger.debug("terminated.")
+
+    @async_connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,))
+    async def publish(self, msg: str):
+        receivers = await self._client.publish(self._topic, self._payload(msg))
+        self._published.inc()
+        return receivers
+
+    async def publish_many(self, msgs: Iterable, chunk_size: int = 100) -> List[int]:
+        """
+        msgs: iterable of messages (str|bytes)
+        chunk_size: number of messages sent per pipeline round trip
+        returns the number of receivers of each message
+        """
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+        counts = []
+        msgs = iter(msgs)
+        while True:
+            chunk = list(islice(msgs, chunk_size))
+            if not chunk:
+                return counts
+            counts.extend(await self._publish_chunk(chunk))
+
+    @async_connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,), operation="publish")
+    async def _publish_chunk(self, chunk: list) -> List[int]:
+        async with self._client.pipeline(transaction=False) as pipe:
+            for msg in chunk:
+                pipe.publish(self._topic, self._payload(msg))
+            receivers = await pipe.execute()
+        self._published.inc(len(chunk))
+        return receivers
+
+    async def subscribe(self, envelope: bool = False) -> AsyncIterator[str]:
+        """
+        only events happening after subscription are received
+        frames are unpacked, compressed payloads decompressed
+        """
+        self.logger.debug("consuming ..")
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self._topic)
+        try:
+            async for message in pubsub.listen():
+                if message['type'] != 'message':
+                    continue
+                # a message that can't be unpacked or decoded is logged and skipped, the subscription goes on
+                try:
+                    payloads = self._unpack(message['data'])
+                    if envelope:
+                        items = [Message(payload, topic=message['channel'].decode(), codec=self.codec)
+                                 for payload in payloads]
+                    else:
+                        items = [self._decode(payload) for payload in payloads]
+                except Exception as err:
+                    self.logger.error(f"(decode) failed [{describe(err)}] => dropped")
+                    continue
+                for item in items:
+                    yield item
+        finally:
+            await pubsub.aclose()
+
+
+def asyncPubsubFactory(broker: str = "redis") -> type(AsyncRedisPubsub):
+    """creates an async publisher object
+    :type broker: str: broker backend.
+        supported:
+          - redis
+    """
+    if broker.upper() == "REDIS":
+        return AsyncRedisPubsub
+    else:
+        from tesselite import root_logger
+        root_logger.fatal(f"Broker type <{broker}> not available yet (asyncio).")
+        exit(1)
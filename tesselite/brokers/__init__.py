@@ -0,0 +1,3 @@
+"""
+Broker backends, imported on demand by pubsubFactory
+"""
@@ -0,0 +1,744 @@
+"""
+GCP Pub/Sub backend
+"""
+import contextlib
+import functools
+import math
+import threading
+from collections import OrderedDict
+from concurrent import futures
+from typing import Callable, Iterable, List, Union
+
+from google.api_core import exceptions as google_api_core_exceptions
+from google.cloud.pubsub_v1 import PublisherClient as google_publisher_client
+from google.cloud.pubsub_v1 import SubscriberClient as google_subscriber_client
+from google.cloud.pubsub_v1.subscriber.scheduler import ThreadScheduler as google_thread_scheduler
+from google.cloud.pubsub_v1.types import BatchSettings as google_batch_settings
+from google.cloud.pubsub_v1.types import FlowControl as google_flow_control
+from google.cloud.pubsub_v1.types import PublisherOptions as google_publisher_options
+
+from tesselite import GCPEnv
+from tesselite.codecs import Codec, get_codec
+from tesselite.compression import Compressor, get_compressor
+from tesselite.deadletter import DeadLetterWriter, describe, metadata
+from tesselite.dispatch import Lanes
+from tesselite.exceptions import ConfigurationException, connexion
+from tesselite.exceptions import MessageProcessingException, OrderingKeyPausedException, WorkerProcessException
+from tesselite.framing import Framer, FrameSettings
+from tesselite.message import Message
+from tesselite.metrics import PUBLISHED, instrument
+from tesselite.processes import ProcessPool
+from tesselite.pubsub import Pubsub
+from tesselite.registry import registry
+from tesselite.spool import Spool, Spooler
+
+# broker unavailable: spooled publishes
+CONNEXION_ERRORS = (google_api_core_exceptions.ServiceUnavailable, google_api_core_exceptions.DeadlineExceeded,
+                    google_api_core_exceptions.RetryError, futures.TimeoutError)
+
+# PublisherClient.publish arguments, other keyword arguments are message attributes
+_PUBLISH_ARGUMENTS = ("topic", "data", "ordering_key", "retry", "timeout")
+
+
+class _Lease:
+    """
+    ack ids held by a synchronous pull consumer (batch being processed, prefetched batch),
+    their ack deadline is extended when held, then every seconds/2 until released
+    """
+
+    def __init__(self, extend: Callable[[List[str], int], None], seconds: int, logger):
+        """
+        extend: function (ack_ids, seconds) => modify_ack_deadline
+        """
+        self._extend = extend
+        self._seconds = seconds
+        self._held = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.logger = logger
+        self._thread = threading.Thread(target=self._run, name="tesselite-lease", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stopped.set()
+        self._thread.join()
+        # still held (e.g., prefetched): redelivered right away
+        with self._lock:
+            ack_ids, self._held = list(self._held), set()
+        self._send(ack_ids, 0)
+
+    def hold(self, ack_ids: List[str]):
+        if ack_ids:
+            self._send(ack_ids, self._seconds)
+            with self._lock:
+                self._held.update(ack_ids)
+
+    def release(self, ack_ids: List[str]):
+        with self._lock:
+            self._held.difference_update(ack_ids)
+
+    def _send(self, ack_ids: List[str], seconds: int):
+        # request size limit: at most 1000 ack ids per call
+        for index in range(0, len(ack_ids), 1000):
+            try:
+                self._extend(ack_ids[index:index + 1000], seconds)
+            except Exception as err:
+                self.logger.error(f"(lease) ack deadline extension failed [{err.__class__.__name__}] => {err}")
+
+    def _run(self):
+        while not self._stopped.wait(self._seconds / 2):
+            with self._lock:
+                ack_ids = list(self._held)
+            if ack_ids:
+                self._send(ack_ids, self._seconds)
+
+
+class GCPPubSub(Pubsub):
+
+    def __init__(self, topic: str, log_name: str = "pubsub-gcp", blocking: bool = True,
+                 max_messages: int = None, max_bytes: int = None, max_latency: float = None,
+                 codec: Union[str, Codec] = None, frames: FrameSettings = None,
+                 compression: Union[str, Compressor] = None, spool: Union[str, Spool] = None,
+                 spool_timeout: float = 30, ordering: bool = False):
+        """
+        blocking: if False, publish returns the future instead of waiting for the message id
+        max_messages, max_bytes, max_latency: publisher batching, defaults to GCPEnv
+        codec: serializes published objects and deserializes payloads before callbacks
+            (json, orjson, msgpack, auto or a tesselite.codecs.Codec), None: str/bytes as is
+        compression: compresses payloads above a size threshold, consumers decompress them automatically
+            (zlib, zstd, lz4, auto or a tesselite.compression.Compressor), None: no compression
+        frames: if set, published messages are packed into frames (one pubsub message per frame)
+            e.g., frames=FrameSettings(max_bytes=64000, linger=0.005)
+        spool: directory (or tesselite.spool.Spool) where publishes are written while pubsub is unavailable,
+            then replayed in order once it answers again (publishes wait for their ids in that mode)
+        spool_timeout: max time (s) a publish waits for pubsub before being spooled
+        ordering: if True, messages published with a same key are delivered in order
+            (publisher message ordering, subscriptions created with message ordering)
+        """
+        from tesselite import Logger
+        self.logger = Logger(log_name)
+        self._topic_path = None
+        self.logger.debug("loading ..")
+        self._env = GCPEnv()
+        self._topic = topic if topic else self._env.TOPIC_NAME
+        self._published = PUBLISHED.labels(self._topic)
+        self._publisher_client = None
+        self._blocking = blocking
+        self._ordering = ordering
+        self.codec = get_codec(codec)
+        self.compressor = get_compressor(compression)
+        self._batch_settings = google_batch_settings(
+            max_messages=max_messages if max_messages else self._env.BATCH_MAX_MESSAGES,
+            max_bytes=max_bytes if max_bytes else self._env.BATCH_MAX_BYTES,
+            max_latency=max_latency if max_latency else self._env.BATCH_MAX_LATENCY,
+        )
+        # in-flight publishes (non-blocking mode)
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self.framer = Framer(self._publish_frame, frames, name=f"{log_name}-framer") if frames else None
+        self._spool_timeout = spool_timeout
+        if spool:
+            self.spooler = Spooler(Spool(spool) if isinstance(spool, str) else spool, send=self._send,
+                                   ping=self._ping, errors=CONNEXION_ERRORS, topic=self._topic, logger=self.logger)
+        self.logger.debug("\n"
+                         "detected this config:\n"
+                         f" - PROJECT: {self._env.GOOGLE_PROJECT}\n"
+                         f" - TOPIC: {self._topic}\n"
+                         f" - BATCH: {self._batch_settings}\n"
+                         f" - CREDENTIALS: ( "
+                         f"{ 'hidden' if self._env.GOOGLE_APPLICATION_CREDENTIALS else 'empty'} )")
+
+    @property
+    def topic(self):
+        return self._topic
+
+    def open(self):
+        # one publisher (and gRPC channel) per batching config, shared by all topics
+        self._publisher_client = registry.acquire(
+            self._publisher_key, lambda: google_publisher_client(
+                batch_settings=self._batch_settings,
+                publisher_options=google_publisher_options(enable_message_ordering=self._ordering)))
+        # set topic location
+        self._topic_path = self._publisher_client.topic_path(self._env.GOOGLE_PROJECT, self.topic)
+        # check topic
+        if self.spooler:
+            # doesn't wait for pubsub: publishes are spooled until the replay thread's ping answers
+            try:
+                self._ping()
+            except CONNEXION_ERRORS as err:
+                self.logger.warning(f"(spool) broker unavailable [{err.__class__.__name__}] => spooling")
+            self.spooler.start()
+        else:
+            self.check_topic()
+        self.logger.info("ready.")
+
+    def _ping(self):
+        # single attempt (spool): the topic is created if missing, like check_topic
+        try:
+            self._publisher_client.get_topic(topic=self._topic_path, retry=None, timeout=self._spool_timeout)
+        except google_api_core_exceptions.NotFound:
+            self.logger.info(f"creating new topic .. {self._topic_path}")
+            self._publisher_client.create_topic(name=self._topic_path, retry=None, timeout=self._spool_timeout)
+
+
+    def close(self):
+        if self._publisher_client:
+            if self.framer:
+                self.framer.close()
+            if self.spooler:
+                self.spooler.close()
+            self.flush()
+            registry.release(self._publisher_key, lambda client: client.stop())
+            self._publisher_client = None
+        self.logger.debug("terminated.")
+
+    @property
+    def _publisher_key(self) -> tuple:
+        return "gcp-publisher", self._env.GOOGLE_PROJECT, tuple(self._batch_settings), self._ordering
+
+    def _subscriber(self):
+        """shared subscriber client (and gRPC channel)"""
+        return registry.shared(("gcp-subscriber", self._env.GOOGLE_PROJECT),
+                               google_subscriber_client, lambda client: client.close())
+
+    def flush(self, timeout: float = None):
+        """
+        sends the pending frame (framed mode) and waits for all in-flight publishes
+        """
+        if self.framer:
+            self.framer.flush()
+        with self._pending_lock:
+            pending = list(self._pending)
+        if not pending:
+            return
+        self.logger.debug(f"flushing .. {len(pending)} message(s)")
+        done, not_done = futures.wait(pending, timeout=timeout)
+        if not_done:
+            self.logger.warning(f"flush timeout: {len(not_done)} message(s) still in flight")
+
+    def _track(self, future):
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._untrack)
+
+    def _untrack(self, future):
+        with self._pending_lock:
+            self._pending.discard(future)
+        err = future.exception()
+        if err:
+            self.logger.error(f"(publish) message lost [{err.__class__.__name__}] => {err}")
+
+    @connexion(
+        expected_errors=(google_api_core_exceptions.ServiceUnavailable,),
+        noisy_errors=(google_api_core_exceptions.AlreadyExists,),
+        operation="admin"
+    )
+    def check_topic(self, topic_path: str = None):
+        """
+        creates a new topic if it doesn't exist
+        in production, Terraform must create topics
+        topic_path: defaults to the topic of this publisher (e.g., a dead letter topic otherwise)
+        """
+        topic_path = topic_path if topic_path else self._topic_path
+        try:
+            self.logger.debug(f"checking  .. topic={topic_path}")
+            self._publisher_client.get_topic(topic=topic_path, retry=None)
+        except google_api_core_exceptions.NotFound:
+            self.logger.info(f"creating new topic .. {topic_path}")
+            self._publisher_client.create_topic(name=topic_path)
+        except:
+            raise
+
+    @connexion(
+        expected_errors=(google_api_core_exceptions.ServiceUnavailable,),
+        noisy_errors=(google_api_core_exceptions.AlreadyExists,),
+        operation="admin"
+    )
+    def check_subscription(self, subscriber_client: google_subscriber_client, subscription: str,
+                           dead_letter_topic: str = None, max_delivery_attempts: int = 5):
+        """
+        creates a new subscription if it doesn't exist
+        in production, Terraform must create subscriptions for better retention
+        dead_letter_topic: if set (topic path), pubsub forwards messages nacked max_delivery_attempts times (5-100)
+            to this topic, the dead letter policy of an existing subscription is updated if it differs
+            (the pubsub service account needs publisher on the topic and subscriber on the subscription)
+        """
+        # check topic
+        self.check_topic()
+        policy = None
+        if dead_letter_topic:
+            self.check_topic(dead_letter_topic)
+            policy = {"dead_letter_topic": dead_letter_topic, "max_delivery_attempts": max_delivery_attempts}
+        try:
+            self.logger.debug(f"checking subscription .. {subscription}")
+            resource = subscriber_client.get_subscription(subscription=subscription)
+            self.logger.debug(f"name={resource.name}, topic={resource.topic}")
+            if policy and (resource.dead_letter_policy.dead_letter_topic != dead_letter_topic or
+                           resource.dead_letter_policy.max_delivery_attempts != max_delivery_attempts):
+                self.logger.info(f"updating dead letter policy .. {subscription} => {dead_letter_topic} "
+                                 f"after {max_delivery_attempts} attempts")
+                subscriber_client.update_subscription(request={
+                    "subscription": {"name": subscription, "dead_letter_policy": policy},
+                    "update_mask": {"paths": ["dead_letter_policy"]}})
+            return
+        except (google_api_core_exceptions.NotFound, google_api_core_exceptions.InvalidArgument):
+            self.logger.info(f"registering new subscription .. {subscription}")
+            request = {"name": subscription, "topic": self._topic_path, "enable_message_ordering": self._ordering}
+            if policy:
+                request["dead_letter_policy"] = policy
+            subscriber_client.create_subscription(request=request)
+        except Exception as err:
+            self.logger.error(err, stack_info=True)
+            raise
+
+    @connexion(
+        expected_errors=(google_api_core_exceptions.ServiceUnavailable,),
+        noisy_errors=(google_api_core_exceptions.AlreadyExists,)
+    )
+    def publish(self, msg: str, key: str = None):
+        """
+        key: ordering key (ordering=True), messages of a same key are delivered in order
+            a failed publish pauses its key: later publishes of the key fail until resume(key)
+        """
+        if key is not None:
+            self._check_ordering()
+            call = self._publisher_client.publish(self._topic_path, self._payload(msg), ordering_key=key)
+            call.add_done_callback(self._paused(key))
+            self._published.inc()
+            if not self._blocking:
+                self._track(call)
+                return call
+            return self._ordered(call, key)
+        if self.framer:
+            # sent with its frame, see flush
+            self.framer.add(self._bytes(msg))
+            self._published.inc()
+            return None
+        if self.spooler:
+            ids = self.spooler.publish([self._payload(msg)])
+            self._published.inc()
+            return ids[0] if ids else None
+        call = self._publisher_client.publish(self._topic_path, self._payload(msg))
+        self._published.inc()
+        if not self._blocking:
+            self._track(call)
+            return call
+        return call.result()
+
+    def publish_many(self, msgs: Iterable, chunk_size: int = 100, key: Union[str, Callable] = None) -> List[str]:
+        """
+        publish a bunch of messages, the client batches them
+        key: ordering key (ordering=True), or a function msg => ordering key
+        returns the message ids (None per message if framed, frames are sent before returning)
+        """
+        if key is not None:
+            self._check_ordering()
+            calls, keys = [], []
+            for msg in msgs:
+                ordering_key = key(msg) if callable(key) else key
+                keys.append(ordering_key)
+                call = self._publisher_client.publish(self._topic_path, self._payload(msg), ordering_key=ordering_key)
+                call.add_done_callback(self._paused(ordering_key))
+                self._track(call)
+                calls.append(call)
+            self._published.inc(len(calls))
+            return [self._ordered(call, call_key) for call, call_key in zip(calls, keys)]
+        if self.framer:
+            ids = [self.publish(msg) for msg in msgs]
+            self.flush()
+            return ids
+        if self.spooler:
+            msgs = list(msgs)
+            ids = self.spooler.publish([self._payload(msg) for msg in msgs])
+            self._published.inc(len(msgs))
+            return ids if ids is not None else [None] * len(msgs)
+        calls = []
+        for msg in msgs:
+            call = self._publisher_client.publish(self._topic_path, self._payload(msg))
+            self._track(call)
+            calls.append(call)
+        self._published.inc(len(calls))
+        return [call.result() for call in calls]
+
+    def _check_ordering(self):
+        if not self._ordering:
+            raise ConfigurationException("ordering keys require ordering=True")
+        if self.framer or self.spooler:
+            raise ConfigurationException("ordering keys are not supported with frames or spool")
+
+    def resume(self, key: str):
+        """
+        resumes publishing on an ordering key paused by a failed publish
+        republish the failed messages first (in order) to keep the order of the key
+        """
+        self._publisher_client.resume_publish(self._topic_path, key)
+
+    @staticmethod
+    def _ordered(call, key: str) -> str:
+        # not retried in backoff: the key stays paused until resume(key)
+        try:
+            return call.result()
+        except Exception as err:
+            raise OrderingKeyPausedException(f"ordering key <{key}> paused [{describe(err)}]") from err
+
+    def _paused(self, key: str) -> Callable:
+        # the key stays paused: messages published after a lost one would break the order
+        def paused(future):
+            err = future.exception()
+            if err is not None:
+                self.logger.error(f"(publish) ordering key <{key}> paused [{err.__class__.__name__}] => {err}, "
+                                  f"resume(key) to publish it again")
+        return paused
+
+    def _publish_frame(self, frame: bytes):
+        if self.spooler:
+            self.spooler.publish([self._compress(frame)])
+            return
+        self._track(self._publisher_client.publish(self._topic_path, self._compress(frame)))
+
+    def _send(self, payloads: List[bytes]) -> List[str]:
+        # the client batches them, a failure is raised within spool_timeout
+        calls = [self._publisher_client.publish(self._topic_path, payload, timeout=self._spool_timeout)
+                 for payload in payloads]
+        return [call.result(timeout=self._spool_timeout) for call in calls]
+
+    @connexion(expected_errors=(google_api_core_exceptions.ServiceUnavailable,
+                                google_api_core_exceptions.RetryError),
+            noisy_errors = (google_api_core_exceptions.AlreadyExists, google_api_core_exceptions.NotFound, TimeoutError)
+    )
+    def consume(self, callback: Callable, subscription: str = None, deadLetter: str = None,
+                max_messages: int = None, max_bytes: int = None, max_lease_duration: int = None,
+                workers: int = None, legacy_flow_control: bool = True, envelope: bool = False,
+                batch: bool = False, lanes: int = 0, key: Callable = None, processes: int = 0,
+                streams: int = 1, dedicated_channels: bool = False, max_attempts: int = 5,
+                dead_letter_policy: bool = False, ring_bytes: int = 4 << 20):
+        """
+        callback: function called with message payload
+        deadLetter: is a backup topic where messages whose callback failed max_attempts times are pushed
+            (attributes: error metadata, see tesselite.deadletter), by a background publisher,
+            the message is acked once its dead letter is published, nacked (redelivered) before max_attempts
+            without deadLetter, a failed callback is retried in place (callback retry policy)
+        max_attempts: deliveries of a message before it is dead lettered
+            (delivery attempts of pubsub with a dead letter policy, counted by this consumer otherwise)
+        dead_letter_policy: if True, the subscription is given a pubsub dead letter policy
+            (deadLetter, max_attempts in 5-100): pubsub forwards failed messages itself, without error metadata
+        max_messages, max_bytes: max in-flight (leased, not yet acked) messages, defaults to GCPEnv
+        max_lease_duration: max time (s) a message is held before being redelivered, defaults to GCPEnv
+        workers: number of callback threads, defaults to GCPEnv
+        legacy_flow_control: if True, flow control is only enforced client side
+        envelope: if True, callback receives a tesselite.message.Message (raw payload, id, publish time,
+            attributes, ack/nack), messages not acked/nacked by the callback are acked on success
+        batch: if True, callback receives the list of messages of a frame (a list of one if not framed)
+        frames are unpacked: the callback is called once per message otherwise,
+        a frame is acked once all its messages are processed
+        lanes: if positive, callbacks run in serial lanes (threads) picked by key:
+            messages of a same key are processed in order, different keys in parallel
+        key: function called with what the callback receives (the first message if batch) => key,
+            defaults to the ordering key of the pubsub message (see publish), else its id (no order to keep)
+        processes: if positive, callbacks run in worker processes fed through shared memory
+            (CPU-bound callbacks: one GIL per process), the callback must be defined at module level,
+            a message is acked once its callback succeeded in a worker, nacked otherwise
+            (envelopes can't be acked/nacked by the callback in that mode),
+            consume raises WorkerProcessException if a worker process dies
+        ring_bytes: processes only, shared memory per worker process: a larger message fails (dead lettered
+            or dropped, not redelivered)
+        streams: number of parallel streaming pulls on the subscription,
+            max_messages, max_bytes and workers are split across them (totals stay the same)
+        dedicated_channels: if True, each stream has its own subscriber client (and gRPC channel)
+        """
+        if lanes and processes:
+            raise ConfigurationException("lanes and processes are exclusive")
+        if dead_letter_policy and not deadLetter:
+            raise ConfigurationException("dead_letter_policy requires a dead letter topic")
+        if dead_letter_policy and not 5 <= max_attempts <= 100:
+            raise ConfigurationException(f"pubsub max delivery attempts must be in [5, 100], got {max_attempts}")
+        if streams < 1:
+            raise ConfigurationException(f"streams must be positive, got {streams}")
+        self.logger.debug("consuming ..")
+        flow_control = google_flow_control(
+            max_messages=max_messages if max_messages else self._env.FLOW_MAX_MESSAGES,
+            max_bytes=max_bytes if max_bytes else self._env.FLOW_MAX_BYTES,
+            max_lease_duration=max_lease_duration if max_lease_duration else self._env.FLOW_MAX_LEASE_DURATION,
+        )
+        workers = workers if workers else self._env.SCHEDULER_WORKERS
+        instrumented = instrument(callback, self._topic, batch=batch)
+        self.logger.debug(f"flow control: {flow_control}, workers: {workers}, streams: {streams}")
+        # the budget of each stream
+        stream_flow_control = google_flow_control(
+            max_messages=math.ceil(flow_control.max_messages / streams),
+            max_bytes=math.ceil(flow_control.max_bytes / streams),
+            max_lease_duration=flow_control.max_lease_duration,
+        )
+        stream_workers = math.ceil(workers / streams)
+        dead_letter_path = self._publisher_client.topic_path(self._env.GOOGLE_PROJECT, deadLetter) \
+            if deadLetter else None
+        subscription_path = self._subscription_path(subscription)
+        # with a pubsub dead letter policy, failed messages are only nacked
+        writer = DeadLetterWriter(functools.partial(self._send_dead_letters, dead_letter_path), topic=self._topic,
+                                  logger=self.logger) if deadLetter and not dead_letter_policy else None
+        # message id => failures, without pubsub delivery attempts (no dead letter policy)
+        failures = OrderedDict()
+        failures_lock = threading.Lock()
+
+        def failed(message, error, permanent: bool = False):
+            """
+            counts the failure of a message, then redelivers it (nack) or dead letters it
+            permanent: the message can't succeed (e.g., too large for processes), it is not redelivered
+                (but with a pubsub dead letter policy, which only forwards redelivered messages)
+            """
+            attempts = message.delivery_attempt
+            if not attempts:
+                with failures_lock:
+                    attempts = failures[message.message_id] = failures.pop(message.message_id, 0) + 1
+                    while len(failures) > 100000:
+                        failures.popitem(last=False)
+            if dead_letter_policy or (not permanent and (writer is None or attempts < max_attempts)):
+                self.logger.error(f"(callback) failed {attempts} time(s) [{describe(error)}] => redelivery")
+                message.nack()
+                return
+            with failures_lock:
+                failures.pop(message.message_id, None)
+            if writer is None:
+                self.logger.error(f"(callback) failed [{describe(error)}] => dropped")
+                message.ack()
+                return
+            self.logger.error(f"(callback) failed {attempts} time(s) [{describe(error)}] => dead letter")
+            meta = metadata(self._topic, error, attempts, subscription=subscription_path, id=message.message_id)
+            writer.put(message.data, {**dict(message.attributes), **meta}, on_sent=message.ack)
+
+        # exec wrapper
+        @connexion(expected_errors=(google_api_core_exceptions.ServiceUnavailable,
+                    MessageProcessingException, google_api_core_exceptions.NotFound,), operation="callback")
+        def exec_callback(message):
+            try:
+                payloads = self._unpack(message.data)
+                if envelope and not batch and len(payloads) == 1:
+                    wrapped = self._envelope(message, payloads[0])
+                    instrumented(wrapped)
+                    if not wrapped.settled:
+                        message.ack()
+                    return
+                if envelope:
+                    # messages of a frame are settled together, by the consume loop
+                    payloads = [self._envelope(message, payload, settle=False) for payload in payloads]
+                else:
+                    payloads = [self._decode(payload) for payload in payloads]
+                if batch:
+                    instrumented(payloads)
+                else:
+                    for payload in payloads:
+                        instrumented(payload)
+                message.ack()
+            except Exception as err:
+                if deadLetter:
+                    failed(message, err)
+                    return
+                self.logger.error(f"{type(err)} {err}")
+                raise MessageProcessingException()
+
+        def lane_key(message) -> str:
+            if key is None:
+                # messages without ordering key have no order to keep: spread by id
+                return message.ordering_key or message.message_id
+            payload = self._unpack(message.data)[0]
+            return key(self._envelope(message, payload, settle=False) if envelope else self._decode(payload))
+
+        router = Lanes(lambda entry: exec_callback(entry[0]), lanes=lanes, key=lambda entry: entry[1],
+                       queue_size=flow_control.max_messages) if lanes else None
+
+        def submit_lanes(message):
+            try:
+                lane = lane_key(message)
+            except Exception as err:
+                # a message without key fails like a failed callback
+                if deadLetter:
+                    failed(message, err)
+                    return
+                self.logger.error(f"(lanes) key failed [{describe(err)}]")
+                message.nack()
+                return
+            router.submit((message, lane))
+
+        def done(message, error: str):
+            # result of a worker process
+            if error and pool.error:
+                # in flight in a dead worker process: redelivered, consume ends
+                message.nack()
+                for future in pulls:
+                    future.cancel()
+            elif error and deadLetter:
+                failed(message, error)
+            elif error:
+                self.logger.error(f"(process) {error}")
+                message.nack()
+            else:
+                message.ack()
+
+        pool = ProcessPool(callback, processes, on_done=done, codec=self.codec, envelope=envelope, batch=batch,
+                           topic=self._topic, ring_bytes=ring_bytes, logger=self.logger) if processes else None
+
+        def submit(message):
+            try:
+                pool.submit(self._decompress(message.data), message)
+            except WorkerProcessException as err:
+                self.logger.error(f"{type(err)} {err}")
+                message.nack()
+                for future in pulls:
+                    future.cancel()
+            except Exception as err:
+                # e.g., larger than the ring, or corrupted: fails again on every redelivery
+                failed(message, err, permanent=True)
+
+        # event loop
+        with contextlib.ExitStack() as stack:
+            subscriber = stack.enter_context(self._subscriber())
+            if writer:
+                # closed once the streams are done: pending dead letters are sent
+                stack.callback(writer.close)
+            # check subscription
+            if dead_letter_policy:
+                self.check_subscription(subscriber_client=subscriber, subscription=subscription_path,
+                                        dead_letter_topic=dead_letter_path, max_delivery_attempts=max_attempts)
+            else:
+                self.check_subscription(subscriber_client=subscriber, subscription=subscription_path)
+            if writer:
+                self.check_topic(dead_letter_path)
+            subscribers = [subscriber] + [
+                stack.enter_context(google_subscriber_client()) if dedicated_channels else subscriber
+                for _ in range(streams - 1)]
+            if router:
+                # the pubsub callback only routes, the next message of an ordering key
+                # is delivered once the previous one is acked by its lane
+                router.start()
+            if pool:
+                # forked before the streaming pull starts
+                pool.start()
+            pulls = []
+            for index, client in enumerate(subscribers):
+                # a scheduler can't be shared between streams
+                scheduler = google_thread_scheduler(executor=futures.ThreadPoolExecutor(
+                    max_workers=stream_workers, thread_name_prefix=f"tesselite-callback-{index}"))
+                pulls.append(client.subscribe(subscription=subscription_path,
+                                              callback=submit_lanes if router else submit if pool else exec_callback,
+                                              flow_control=stream_flow_control,
+                                              scheduler=scheduler,
+                                              use_legacy_flow_control=legacy_flow_control))
+            try:
+                # a stream ending (error, cancel) ends the others
+                ended, _ = futures.wait(pulls, return_when=futures.FIRST_COMPLETED)
+                for future in pulls:
+                    future.cancel()
+                for future in ended:
+                    future.result()
+            except KeyboardInterrupt:
+                for future in pulls:
+                    future.cancel()
+            except Exception:
+                raise
+            finally:
+                if router:
+                    router.stop()
+                if pool:
+                    pool.stop()
+            # a dead worker process cancels the streams
+            if pool and pool.error:
+                raise pool.error
+
+    def _send_dead_letters(self, topic_path: str, records: list):
+        # published together (client batching), then waited for
+        # attributes named after publish arguments (e.g., topic) can't be sent
+        calls = [self._publisher_client.publish(topic_path, raw, **{name: str(value) for name, value in meta.items()
+                                                                    if name not in _PUBLISH_ARGUMENTS})
+                 for raw, meta in records]
+        for call in calls:
+            call.result(timeout=self._spool_timeout)
+
+    def _envelope(self, message, payload: bytes, settle: bool = True) -> Message:
+        """
+        settle: if True, the callback can ack/nack the pubsub message
+        """
+        return Message(payload, id=message.message_id, topic=self._topic, publish_time=message.publish_time,
+                       attributes=dict(message.attributes), ack=message.ack if settle else None,
+                       nack=message.nack if settle else None, codec=self.codec)
+
+    def _subscription_path(self, subscription: str = None) -> str:
+        subscription_name = subscription if subscription else self._env.SUBSCRIPTION_NAME
+        return f"projects/{self._env.GOOGLE_PROJECT}/subscriptions/{subscription_name}"
+
+    @connexion(expected_errors=(google_api_core_exceptions.ServiceUnavailable,
+                                google_api_core_exceptions.RetryError),
+            noisy_errors = (google_api_core_exceptions.AlreadyExists, google_api_core_exceptions.NotFound, TimeoutError)
+    )
+    def consume_batch(self, callback: Callable, subscription: str = None, max_messages: int = 100,
+                      max_wait: float = 10, drain: bool = False, envelope: bool = False, lease: int = 60):
+        """
+        synchronous pull: the next batch is pulled while the callback processes the current one
+        callback: function called with the list of message payloads (frames are unpacked)
+        max_messages: max number of messages per batch
+        max_wait: max time (s) a pull waits for messages
+        drain: if True, returns as soon as the subscription looks empty (e.g., cron jobs)
+        envelope: if True, payloads are tesselite.message.Message (raw payload, id, publish time, attributes)
+        lease: ack deadline (s, max 600) of the batch being processed and of the prefetched one,
+            extended every lease/2 s until they are acked: a callback may run longer than the subscription
+            ack deadline without redeliveries (0: subscription ack deadline only)
+        a batch is acked in a single call if the callback succeeds, otherwise it is redelivered
+        """
+        if not 0 <= lease <= 600:
+            raise ConfigurationException(f"lease must be in [0, 600] seconds, got {lease}")
+        self.logger.debug("consuming (batch) ..")
+        callback = instrument(callback, self._topic, batch=True)
+        with self._subscriber() as subscriber, \
+                futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="tesselite-prefetch") as prefetcher:
+            subscription_path = self._subscription_path(subscription)
+            self.check_subscription(subscriber_client=subscriber, subscription=subscription_path)
+            leases = _Lease(lambda ack_ids, seconds: subscriber.modify_ack_deadline(
+                request={"subscription": subscription_path, "ack_ids": ack_ids, "ack_deadline_seconds": seconds}),
+                lease, self.logger) if lease else None
+
+            def pull() -> list:
+                try:
+                    response = subscriber.pull(request={"subscription": subscription_path,
+                                                        "max_messages": max_messages}, timeout=max_wait)
+                    received_messages = list(response.received_messages)
+                except google_api_core_exceptions.DeadlineExceeded:
+                    return []
+                if leases:
+                    leases.hold([received.ack_id for received in received_messages])
+                return received_messages
+
+            try:
+                with leases if leases else contextlib.nullcontext():
+                    batch = pull()
+                    while True:
+                        if not batch:
+                            if drain:
+                                self.logger.info("drained.")
+                                return
+                            batch = pull()
+                            continue
+                        prefetch = prefetcher.submit(pull)
+                        ack_ids = [received.ack_id for received in batch]
+                        try:
+                            if envelope:
+                                callback([Message(payload, id=received.message.message_id,
+                                                  topic=self._topic, publish_time=received.message.publish_time,
+                                                  attributes=dict(received.message.attributes), codec=self.codec)
+                                          for received in batch for payload in self._unpack(received.message.data)])
+                            else:
+                                callback([self._decode(payload)
+                                          for received in batch for payload in self._unpack(received.message.data)])
+                            subscriber.acknowledge(request={"subscription": subscription_path, "ack_ids": ack_ids})
+                        except Exception as err:
+                            self.logger.error(f"{type(err)} {err}")
+                            # immediate redelivery
+                            subscriber.modify_ack_deadline(request={"subscription": subscription_path,
+                                                                    "ack_ids": ack_ids, "ack_deadline_seconds": 0})
+                        finally:
+                            if leases:
+                                leases.release(ack_ids)
+                        batch = prefetch.result()
+            except KeyboardInterrupt:
+                self.logger.info("graceful exit")
@@ -0,0 +1,239 @@
+"""
+In-memory backend: a process-local broker with the semantics of RedisPubsub (fan-out, no persistence)
+for tests and benchmarks without network
+"""
+import functools
+import queue
+import threading
+from typing import Callable, Iterable, List, Union
+
+from tesselite.codecs import Codec, get_codec
+from tesselite.compression import Compressor, get_compressor
+from tesselite.deadletter import DeadLetterWriter, describe, metadata, unwrap, wrap
+from tesselite.dispatch import BLOCK, Dispatcher
+from tesselite.exceptions import ConfigurationException, connexion
+from tesselite.framing import Framer, FrameSettings
+from tesselite.message import Message
+from tesselite.metrics import PUBLISHED, instrument
+from tesselite.pubsub import Pubsub
+
+_CLOSE = object()
+
+
+class MemoryBroker:
+    """
+    topic => subscriber queues
+    subscriber lists are copy-on-write: publishers read them without locking
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._topics = {}
+
+    def subscribe(self, topic: str, capacity: int) -> queue.Queue:
+        subscriber = queue.Queue(maxsize=capacity)
+        with self._lock:
+            self._topics[topic] = self._topics.get(topic, ()) + (subscriber,)
+        return subscriber
+
+    def unsubscribe(self, topic: str, subscriber: queue.Queue):
+        with self._lock:
+            self._topics[topic] = tuple(s for s in self._topics.get(topic, ()) if s is not subscriber)
+
+    def publish(self, topic: str, data: bytes, timeout: float = None) -> int:
+        """
+        blocks while a subscriber queue is full (backpressure), at most timeout seconds per subscriber
+        returns the number of receivers
+        """
+        receivers = 0
+        for subscriber in self._topics.get(topic, ()):
+            try:
+                subscriber.put(data, timeout=timeout)
+                receivers += 1
+            except queue.Full:
+                pass
+        return receivers
+
+
+broker = MemoryBroker()
+
+
+class InMemoryPubsub(Pubsub):
+
+    def __init__(self, topic: str, log_name: str = "memory-pubsub", capacity: int = 10000,
+                 timeout: float = None, codec: Union[str, Codec] = None, frames: FrameSettings = None,
+                 compression: Union[str, Compressor] = None):
+        """
+        capacity: max number of messages waiting in each subscriber queue
+        timeout: max time (s) a publish waits for a full subscriber queue, then the message is dropped
+            for that subscriber (None = wait forever)
+        codec: serializes published objects and deserializes payloads before callbacks
+            (json, orjson, msgpack, auto or a tesselite.codecs.Codec), None: str/bytes as is
+        frames: if set, published messages are packed into frames (see RedisPubsub)
+        compression: compresses payloads above a size threshold (see RedisPubsub)
+        """
+        from tesselite import Logger
+        self.logger = Logger(log_name)
+        self.log_name = log_name
+        self._topic = topic if topic else 'tesselite-pubsub'
+        self._published = PUBLISHED.labels(self._topic)
+        self._capacity = capacity
+        self._timeout = timeout
+        self.codec = get_codec(codec)
+        self.compressor = get_compressor(compression)
+        self._subscribers = []
+        self._dispatcher = None
+        self.framer = Framer(self._publish_frame, frames, name=f"{log_name}-framer") if frames else None
+
+    @property
+    def topic(self):
+        return self._topic
+
+    def open(self):
+        self.logger.info("ready.")
+
+    def close(self):
+        if self.framer:
+            self.framer.close()
+        # stops consume loops of this instance
+        subscribers, self._subscribers = self._subscribers, []
+        for subscriber in subscribers:
+            broker.unsubscribe(self._topic, subscriber)
+            # never blocks: pending messages are discarded to make room
+            while True:
+                try:
+                    subscriber.put_nowait(_CLOSE)
+                    break
+                except queue.Full:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        pass
+        self.logger.debug("terminated.")
+
+    @connexion(expected_errors=(ConnectionError,))
+    def publish(self, msg: str):
+        if self.framer:
+            self.framer.add(self._bytes(msg))
+            self._published.inc()
+            return None
+        receivers = broker.publish(self._topic, self._payload(msg), timeout=self._timeout)
+        self._published.inc()
+        return receivers
+
+    def publish_many(self, msgs: Iterable, chunk_size: int = 100) -> List[int]:
+        if self.framer:
+            receivers = [self.publish(msg) for msg in msgs]
+            self.framer.flush()
+            return receivers
+        receivers = [broker.publish(self._topic, self._payload(msg), timeout=self._timeout) for msg in msgs]
+        self._published.inc(len(receivers))
+        return receivers
+
+    def flush(self):
+        if self.framer:
+            self.framer.flush()
+
+    def _publish_frame(self, frame: bytes):
+        return broker.publish(self._topic, self._compress(frame), timeout=self._timeout)
+
+    @property
+    def stats(self) -> dict:
+        """
+        worker pool queue depth and counters (consume with workers)
+        """
+        return self._dispatcher.stats() if self._dispatcher else {}
+
+    @connexion(expected_errors=(ConnectionError,))
+    def consume(self, callback: Callable, deadLetter: str = None, workers: int = 0, queue_size: int = 1000,
+                overflow: str = BLOCK, envelope: bool = False, batch: bool = False, max_attempts: int = 1,
+                **kwargs):
+        """
+        same as RedisPubsub.consume
+        """
+        self.logger.debug("consuming ..")
+        if max_attempts < 1:
+            raise ConfigurationException(f"max_attempts must be positive, got {max_attempts}")
+        callback = instrument(callback, self._topic, batch=batch)
+        writer = DeadLetterWriter(functools.partial(self._send_dead_letters, deadLetter), topic=self._topic,
+                                  logger=self.logger) if deadLetter else None
+
+        def dead_letter(data: bytes, count: int, error, attempts: int):
+            if writer:
+                writer.put(data, metadata(self._topic, error, attempts), count)
+
+        def failed(data: bytes, count: int, error, attempts: int):
+            self.logger.error(f"(callback) failed {attempts} time(s) [{describe(error)}]"
+                              f"{' => dead letter' if writer else ''}")
+            dead_letter(data, count, error, attempts)
+
+        # only events happening after subscription are processed
+        subscriber = broker.subscribe(self._topic, self._capacity)
+        self._subscribers.append(subscriber)
+
+        # exec wrapper
+        @connexion(expected_errors=(ConnectionError,), operation="callback")
+        def exec_callback(items: list):
+            callback(items if batch else items[0])
+
+        def decode(data: bytes, payloads: list, attributes: dict) -> Union[list, None]:
+            try:
+                if envelope:
+                    return [Message(payload, topic=self._topic, attributes=attributes, codec=self.codec)
+                            for payload in payloads]
+                return [self._decode(payload) for payload in payloads]
+            except Exception as err:
+                failed(data, len(payloads), err, 1)
+                return None
+
+        def handle(data: bytes):
+            try:
+                payloads = self._unpack(data)
+            except Exception as err:
+                failed(data, 1, err, 1)
+                return
+            groups = [(data, payloads)] if batch else [(payload, [payload]) for payload in payloads]
+            # error metadata of a consumed dead letter
+            attributes = unwrap(data)[1]
+            for raw, group in groups:
+                items = decode(raw, group, attributes)
+                if items is None:
+                    continue
+                # failures are counted per message, dead lettered after max_attempts
+                for attempt in range(1, max_attempts + 1):
+                    try:
+                        exec_callback(items)
+                        break
+                    except Exception as err:
+                        if attempt == max_attempts:
+                            failed(raw, len(group), err, attempt)
+
+        # event loop
+        try:
+            if workers:
+                spill = (lambda data: dead_letter(data, len(self._unpack(data)), "queue full (overflow)", 0)) \
+                    if deadLetter else None
+                self._dispatcher = Dispatcher(handle, workers=workers, queue_size=queue_size,
+                                              overflow=overflow, spill=spill).start()
+                submit = self._dispatcher.submit
+            else:
+                submit = handle
+            while True:
+                data = subscriber.get()
+                if data is _CLOSE:
+                    return
+                submit(data)
+        except KeyboardInterrupt:
+            self.logger.info("graceful exit")
+        finally:
+            broker.unsubscribe(self._topic, subscriber)
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+            if self._dispatcher:
+                self._dispatcher.stop()
+            if writer:
+                writer.close()
+
+    def _send_dead_letters(self, topic: str, records: list):
+        for data, meta in records:
+            broker.publish(topic, wrap(unwrap(data)[0], meta), timeout=self._timeout)
@@ -0,0 +1,854 @@
+"""
+Redis backends (pub/sub, sharded pub/sub on a cluster or on a hash ring of servers, and streams)
+"""
+import functools
+import itertools
+import os
+import queue
+import socket
+import threading
+import time
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Union
+
+import redis
+import redis.cluster
+
+from tesselite.codecs import Codec, get_codec
+from tesselite.compression import Compressor, get_compressor
+from tesselite.deadletter import DeadLetterWriter, describe, metadata, unwrap, wrap
+from tesselite.dispatch import BLOCK, Dispatcher, Lanes
+from tesselite.exceptions import ConfigurationException, WorkerProcessException, connexion
+from tesselite.framing import Framer, FrameSettings, pack, unpack
+from tesselite.hashring import HashRing, partition
+from tesselite.message import Message
+from tesselite.metrics import DEAD_LETTERED, PUBLISHED, instrument
+from tesselite.processes import ProcessPool
+from tesselite.pubsub import Pubsub
+from tesselite.registry import registry
+from tesselite.spool import Spool, Spooler
+
+# broker unavailable: backoff, or spool if enabled
+CONNEXION_ERRORS = (socket.gaierror, redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+
+
+class RedisPubsub(Pubsub):
+
+    # pub/sub message types carrying a payload
+    MESSAGE_TYPES = ("message",)
+
+    def __init__(self, topic: str, log_name: str = "redis-pubsub", codec: Union[str, Codec] = None,
+                 frames: FrameSettings = None, compression: Union[str, Compressor] = None,
+                 spool: Union[str, Spool] = None, partitions: int = 0):
+        """
+        codec: serializes published objects and deserializes payloads before callbacks
+            (json, orjson, msgpack, auto or a tesselite.codecs.Codec), None: str/bytes as is
+        compression: compresses payloads above a size threshold, consumers decompress them automatically
+            (zlib, zstd, lz4, auto or a tesselite.compression.Compressor), None: no compression
+        frames: if set, published messages are packed into frames (one PUBLISH per frame)
+            e.g., frames=FrameSettings(max_bytes=64000, linger=0.005)
+        spool: directory (or tesselite.spool.Spool) where publishes are written while redis is down,
+            then replayed in order once it answers again: publish never blocks in backoff
+        partitions: if positive, the topic is spread over the channels <topic>.0 .. <topic>.N-1,
+            publish(msg, key=...) keeps the order of a key, consume(partitions=[...]) reads a subset
+            (all publishers and consumers of a topic must agree on N)
+        """
+        from tesselite import Logger
+        self.logger = Logger(log_name)
+        self.log_name = log_name
+        from tesselite import RedisEnv
+        self.logger.debug("loading ..")
+        self._pubsub = None
+        self._env = RedisEnv()
+        self._client = None
+        self._dispatcher = None
+        self.codec = get_codec(codec)
+        self.compressor = get_compressor(compression)
+        self._topic = topic if topic else self._env.TOPIC_NAME
+        self._published = PUBLISHED.labels(self._topic)
+        self._partitions = partitions
+        self._round_robin = itertools.count()
+        self._frames = frames
+        self._framers = {}
+        self.framer = self._framer(self._topic) if frames else None
+        if spool:
+            self.spooler = Spooler(Spool(spool) if isinstance(spool, str) else spool, send=self._send,
+                                   ping=lambda: self._client_of(self._topic).ping(), errors=CONNEXION_ERRORS,
+                                   topic=self._topic, logger=self.logger)
+        self.logger.debug("\n"
+                         "detected this config:\n"
+                         f"HOST: {self._env.HOST}\n"
+                         f"PORT: {self._env.PORT}\n"
+                         f"PASSWORD: ( "
+                         f"{ 'hidden' if self._env.PASSWORD else 'empty'} )")
+
+    @property
+    def topic(self):
+        return self._topic
+
+    @connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,))
+    def open(self):
+        self.logger.debug("connecting ..")
+        # one client (and connection pool) per redis server, shared by all topics
+        self._client = registry.acquire(self._registry_key, lambda: redis.Redis(
+            host=self._env.HOST, port=self._env.PORT, db=self._env.DB, password=self._env.PASSWORD))
+        self._ready()
+
+    def _ready(self):
+        """
+        pings the server, then starts the spooler
+        with a spool, open doesn't wait for the server: publishes are spooled until the replay thread's ping answers
+        """
+        self.logger.debug("pinging ..")
+        try:
+            self._client.ping()
+        except CONNEXION_ERRORS as err:
+            if not self.spooler:
+                self.close()
+                raise
+            self.logger.warning(f"(spool) broker unavailable [{err.__class__.__name__}] => spooling")
+        except Exception:
+            self.close()
+            raise
+        if self.spooler:
+            self.spooler.start()
+        self.logger.info("ready.")
+
+    @property
+    def _registry_key(self) -> tuple:
+        return "redis", self._env.HOST, self._env.PORT, self._env.DB, self._env.PASSWORD
+
+    def close(self):
+        for framer in list(self._framers.values()):
+            framer.close()
+        if self.spooler:
+            self.spooler.close()
+        if self._client:
+            registry.release(self._registry_key, lambda client: client.close())
+            self._client = None
+        self.logger.debug("terminated.")
+
+
+    # if standard networks errors, backoff the loop
+    @connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,))
+    def publish(self, msg: str, key: str = None):
+        """
+        key: partitioned topics only, messages of a same key go to the same partition, in order
+            (round robin over partitions without key)
+        returns the number of receivers (None if framed: the message is sent with its frame, or spooled)
+        """
+        channel = self._channel(key)
+        if self.framer:
+            self._framer(channel).add(self._bytes(msg))
+            self._published.inc()
+            return None
+        if self.spooler:
+            receivers = self.spooler.publish([self._record(channel, self._payload(msg))])
+            self._published.inc()
+            return receivers[0] if receivers else None
+        receivers = self._publish(self._client_of(channel), channel, self._payload(msg))
+        self._published.inc()
+        return receivers
+
+    def _publish(self, client, channel: str, payload: bytes):
+        return client.publish(channel, payload)
+
+    def _client_of(self, channel: str):
+        """client of the server holding channel"""
+        return self._client
+
+    @property
+    def channels(self) -> List[str]:
+        """
+        channels of the topic: <topic>.0 .. <topic>.N-1 if partitioned
+        """
+        if not self._partitions:
+            return [self._topic]
+        return [f"{self._topic}.{index}" for index in range(self._partitions)]
+
+    def _channel(self, key: str = None) -> str:
+        if not self._partitions:
+            return self._topic
+        index = partition(key, self._partitions) if key is not None else next(self._round_robin) % self._partitions
+        return f"{self._topic}.{index}"
+
+    def _record(self, channel: str, payload: bytes) -> bytes:
+        # spooled/sent payload, carrying its partition channel if partitioned
+        return pack([channel.encode(), payload]) if self._partitions else payload
+
+    def flush(self):
+        """
+        sends the pending frames (framed mode)
+        """
+        for framer in list(self._framers.values()):
+            framer.flush()
+
+    def _framer(self, channel: str) -> Framer:
+        framer = self._framers.get(channel)
+        if framer is None:
+            framer = self._framers.setdefault(channel, Framer(functools.partial(self._publish_frame, channel=channel),
+                                                              self._frames, name=f"{self.log_name}-framer"))
+        return framer
+
+    @connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,), operation="publish")
+    def _publish_frame(self, frame: bytes, channel: str = None):
+        channel = channel if channel else self._topic
+        if self.spooler:
+            return self.spooler.publish([self._record(channel, self._compress(frame))])
+        return self._publish(self._client_of(channel), channel, self._compress(frame))
+
+    def publish_many(self, msgs: Iterable, chunk_size: int = 100, key: Union[str, Callable] = None) -> List[int]:
+        """
+        msgs: iterable of messages (str|bytes)
+        chunk_size: number of messages sent per pipeline round trip
+        key: partitioned topics only, a key for all messages or a function msg => key
+        returns the number of receivers of each message
+        """
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+        if self.framer:
+            # frames already group messages, the last ones are sent right away
+            counts = [self.publish(msg, key(msg) if callable(key) else key) for msg in msgs]
+            self.flush()
+            return counts
+        counts = []
+        msgs = iter(msgs)
+        while True:
+            chunk = list(islice(msgs, chunk_size))
+            if not chunk:
+                return counts
+            counts.extend(self._publish_chunk(chunk, key))
+
+    # a failing chunk is retried alone, chunks already sent are not replayed
+    @connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,), operation="publish")
+    def _publish_chunk(self, chunk: list, key: Union[str, Callable] = None) -> List[int]:
+        records = [self._record(self._channel(key(msg) if callable(key) else key), self._payload(msg))
+                   for msg in chunk]
+        receivers = self.spooler.publish(records) if self.spooler else self._send(records)
+        self._published.inc(len(chunk))
+        return receivers if receivers is not None else [None] * len(chunk)
+
+    def _send(self, records: List[bytes]) -> List[int]:
+        # no MULTI/EXEC: messages are only grouped into a single round trip (per server)
+        pipes, servers = {}, []
+        for record in records:
+            if self._partitions:
+                channel, payload = unpack(record)
+                channel = channel.decode()
+            else:
+                channel, payload = self._topic, record
+            client = self._client_of(channel)
+            if id(client) not in pipes:
+                pipes[id(client)] = client.pipeline(transaction=False)
+            self._publish(pipes[id(client)], channel, payload)
+            servers.append(id(client))
+        # counts back in the order of records
+        counts = {server: iter(pipe.execute()) for server, pipe in pipes.items()}
+        return [next(counts[server]) for server in servers]
+
+    @property
+    def stats(self) -> dict:
+        """
+        worker pool (lanes, processes) queue depth and counters (consume with workers, lanes or processes)
+        """
+        return self._dispatcher.stats() if self._dispatcher else {}
+
+    # consume loop
+    # if standard networks errors, backoff the loop
+    @connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,))
+    def consume(self, callback: Callable, deadLetter: str = None, workers: int = 0, queue_size: int = 1000,
+                overflow: str = BLOCK, envelope: bool = False, batch: bool = False, partitions: List[int] = None,
+                lanes: int = 0, key: Callable = None, processes: int = 0, max_attempts: int = 1,
+                ring_bytes: int = 4 << 20, **kwargs):
+        self.logger.debug("consuming ..")
+
+        """
+        callback: function called with message payload
+        e.g.,
+            def callback(message: str):
+                print(message)
+        deadLetter: a backup topic where messages whose callback failed max_attempts times are pushed,
+            prefixed with the error metadata (see tesselite.deadletter), by a background writer
+        max_attempts: callback attempts per message before it is dead lettered
+            (pub/sub has no redelivery: attempts are immediate retries), the loop goes on in any case
+        workers: if positive, callbacks run in a pool of threads fed by the reader
+        queue_size: max number of messages waiting for a worker
+        overflow: what the reader does when the queue is full
+            - block: wait for a free slot
+            - drop-oldest: discard the oldest waiting message
+            - dead-letter: push the message to deadLetter
+        envelope: if True, callback receives a tesselite.message.Message (raw payload, channel)
+        batch: if True, callback receives the list of messages of a frame (a list of one if not framed)
+        frames are unpacked: the callback is called once per message otherwise
+        partitions: partitioned topics only, partitions to read (default: all), e.g., split among processes
+            with partitions=[i for i in range(N) if i % processes == process]
+        lanes: if positive, callbacks run in serial lanes (threads) picked by key:
+            messages of a same key are processed in order, different keys in parallel
+            (queue_size and overflow apply to each lane)
+        key: function called with what the callback receives (the first message if batch) => key, lanes only
+            e.g., key=lambda order: order["customer"]
+        processes: if positive, callbacks run in worker processes fed by the reader through shared memory
+            (CPU-bound callbacks: one GIL per process), the callback must be defined at module level,
+            attempts run in the worker processes
+        ring_bytes: processes only, shared memory per worker process: a larger message fails (dead lettered)
+        """
+        if lanes and key is None:
+            raise ConfigurationException("lanes require a key function")
+        if sum(map(bool, (workers, lanes, processes))) > 1:
+            raise ConfigurationException("workers, lanes and processes are exclusive")
+        if max_attempts < 1:
+            raise ConfigurationException(f"max_attempts must be positive, got {max_attempts}")
+        channels = self._subscriptions(partitions)
+        instrumented = instrument(callback, self._topic, batch=batch)
+        writer = DeadLetterWriter(functools.partial(self._send_dead_letters, deadLetter), topic=self._topic,
+                                  logger=self.logger) if deadLetter else None
+
+        def dead_letter(raw: bytes, count: int, channel: str, error, attempts: int):
+            if writer:
+                writer.put(raw, metadata(channel, error, attempts), count)
+
+        def failed(raw: bytes, count: int, channel: str, error, attempts: int):
+            self.logger.error(f"(callback) failed {attempts} time(s) [{describe(error)}]"
+                              f"{' => dead letter' if writer else ''}")
+            dead_letter(raw, count, channel, error, attempts)
+
+        def decode(raw: bytes, payloads: list, channel: str, attributes: dict) -> Union[list, None]:
+            """
+            what the callback receives, None if payloads can't be decoded (dead lettered)
+            attributes: error metadata of a consumed dead letter
+            """
+            try:
+                if envelope:
+                    return [Message(payload, topic=channel, attributes=attributes, codec=self.codec)
+                            for payload in payloads]
+                return [self._decode(payload) for payload in payloads]
+            except Exception as err:
+                failed(raw, len(payloads), channel, err, 1)
+                return None
+
+        # exec wrapper
+        @connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,), operation="callback")
+        def exec_callback(items: list):
+            instrumented(items if batch else items[0])
+
+        def groups(message) -> list:
+            """
+            (raw, payloads) processed (and dead lettered) as a whole: the frame if batch, each payload otherwise
+            a message that can't be unpacked is dead lettered
+            """
+            channel = message['channel'].decode()
+            try:
+                payloads = self._unpack(message['data'])
+            except Exception as err:
+                failed(message['data'], 1, channel, err, 1)
+                return []
+            return [(message['data'], payloads)] if batch else [(payload, [payload]) for payload in payloads]
+
+        def process(raw: bytes, items: list, channel: str):
+            # failures are counted per message, dead lettered after max_attempts
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    exec_callback(items)
+                    return
+                except Exception as err:
+                    if attempt == max_attempts:
+                        failed(raw, len(items), channel, err, attempt)
+
+        def handle(message):
+            if message['type'] not in self.MESSAGE_TYPES:
+                return
+            channel, attributes = message['channel'].decode(), unwrap(message['data'])[1]
+            for raw, group in groups(message):
+                items = decode(raw, group, channel, attributes)
+                if items is not None:
+                    process(raw, items, channel)
+
+        def submit_lanes(message):
+            # decoded by the reader: the key is computed on what the callback receives
+            channel, attributes = message['channel'].decode(), unwrap(message['data'])[1]
+            for raw, group in groups(message):
+                items = decode(raw, group, channel, attributes)
+                if items is None:
+                    continue
+                try:
+                    lane = key(items[0])
+                except Exception as err:
+                    # a message without key fails like a failed callback
+                    failed(raw, len(items), channel, err, 1)
+                    continue
+                self._dispatcher.submit((raw, items, channel, lane))
+
+        def done(context: tuple, error: str):
+            # result of a worker process
+            if error:
+                raw, channel, count = context
+                failed(raw, count, channel, error, max_attempts)
+
+        def overflowed(raw: bytes, channel: str):
+            dead_letter(raw, len(self._unpack(raw)), channel, "queue full (overflow)", 0)
+
+        def submit_process(raw: bytes, channel: str, count: int):
+            # a frame (batch) is unpacked by the worker process
+            try:
+                self._dispatcher.submit(self._decompress(raw) if batch else raw, (raw, channel, count), topic=channel)
+            except WorkerProcessException:
+                raise
+            except Exception as err:
+                # e.g., larger than the ring: the callback never runs
+                failed(raw, count, channel, err, 0)
+
+        # subscribed on first read, closed (connections released) on exit
+        messages = self._listen(channels)
+
+        # event loop
+        try:
+            if processes:
+                # forked before subscribing
+                self._dispatcher = ProcessPool(callback, processes, on_done=done, codec=self.codec,
+                                               envelope=envelope, batch=batch, topic=self._topic,
+                                               attempts=max_attempts, ring_bytes=ring_bytes,
+                                               logger=self.logger).start()
+                for msg in messages:
+                    if msg['type'] not in self.MESSAGE_TYPES:
+                        continue
+                    channel = msg['channel'].decode()
+                    # a frame the reader doesn't unpack counts as one message
+                    entries = [(msg['data'], 1)] if batch else [(raw, len(group)) for raw, group in groups(msg)]
+                    for raw, count in entries:
+                        submit_process(raw, channel, count)
+            elif lanes:
+                spill = (lambda entry: dead_letter(entry[0], len(entry[1]), entry[2], "queue full (overflow)", 0)) \
+                    if deadLetter else None
+                self._dispatcher = Lanes(lambda entry: process(*entry[:3]), lanes=lanes, key=lambda entry: entry[3],
+                                         queue_size=queue_size, overflow=overflow, spill=spill).start()
+                for msg in messages:
+                    if msg['type'] in self.MESSAGE_TYPES:
+                        submit_lanes(msg)
+            elif workers:
+                spill = (lambda message: overflowed(message['data'], message['channel'].decode())) \
+                    if deadLetter else None
+                self._dispatcher = Dispatcher(handle, workers=workers, queue_size=queue_size,
+                                              overflow=overflow, spill=spill).start()
+                for msg in messages:
+                    if msg['type'] in self.MESSAGE_TYPES:
+                        self._dispatcher.submit(msg)
+            else:
+                for msg in messages:
+                    handle(msg)
+        except KeyboardInterrupt:
+            self.logger.info("graceful exit")
+        except Exception:
+            raise
+        finally:
+            messages.close()
+            if self._dispatcher:
+                self._dispatcher.stop()
+            if writer:
+                writer.close()
+
+    def _send_dead_letters(self, channel: str, records: list):
+        # one pipeline per batch, a dead letter consumed again is dead lettered with its new error only
+        pipe = self._client_of(channel).pipeline(transaction=False)
+        for raw, meta in records:
+            self._publish(pipe, channel, wrap(unwrap(raw)[0], meta))
+        pipe.execute()
+
+    def _subscriptions(self, partitions: List[int] = None) -> List[str]:
+        if partitions is None:
+            return self.channels
+        if not self._partitions:
+            raise ConfigurationException(f"topic <{self._topic}> is not partitioned")
+        invalid = [index for index in partitions if not 0 <= index < self._partitions]
+        if invalid:
+            raise ConfigurationException(f"partitions {invalid} not in [0, {self._partitions})")
+        return [f"{self._topic}.{index}" for index in partitions]
+
+    def _listen(self, channels: List[str]):
+        """
+        subscribes to the channels, then yields pub/sub messages
+        only events happening after subscription are processed
+        """
+        self._pubsub: redis.client.PubSub = self._client.pubsub(ignore_subscribe_messages=False)
+        self._pubsub.subscribe(*channels)
+        yield from self._pubsub.listen()
+
+
+class RedisClusterPubsub(RedisPubsub):
+    """
+    Redis Cluster flavor: sharded pub/sub (SPUBLISH/SSUBSCRIBE),
+    a channel's traffic stays on the node owning its slot instead of being broadcast to the whole cluster
+    """
+
+    MESSAGE_TYPES = ("smessage",)
+
+    def __init__(self, topic: str, log_name: str = "redis-cluster", **kwargs):
+        """
+        cluster nodes are discovered from RedisEnv.CLUSTER_NODES (host:port,host:port,...)
+        other arguments: see RedisPubsub
+        """
+        super().__init__(topic=topic, log_name=log_name, **kwargs)
+        self._connecting = threading.Lock()
+
+    @connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,))
+    def open(self):
+        self.logger.debug("connecting ..")
+        try:
+            self._client = self._acquire()
+        except (redis.exceptions.RedisClusterException, *CONNEXION_ERRORS) as err:
+            if not self.spooler:
+                raise
+            # the cluster is connected on first use (publish or replay)
+            self.logger.warning(f"(spool) broker unavailable [{err.__class__.__name__}] => spooling")
+            self.spooler.start()
+            self.logger.info("ready.")
+            return
+        self._ready()
+
+    def _acquire(self) -> redis.cluster.RedisCluster:
+        # one client (and connection pool per node) per cluster, shared by all topics
+        return registry.acquire(self._registry_key, lambda: redis.cluster.RedisCluster(
+            startup_nodes=[redis.cluster.ClusterNode(host, port) for host, port in self._nodes],
+            password=self._env.PASSWORD))
+
+    def _client_of(self, channel: str) -> redis.cluster.RedisCluster:
+        if self._client is None:
+            # opened while the cluster was down (spool)
+            with self._connecting:
+                if self._client is None:
+                    try:
+                        self._client = self._acquire()
+                    except redis.exceptions.RedisClusterException as err:
+                        raise redis.exceptions.ConnectionError(str(err)) from err
+        return self._client
+
+    @property
+    def _nodes(self) -> List[tuple]:
+        nodes = self._env.CLUSTER_NODES or f"{self._env.HOST}:{self._env.PORT}"
+        return [(node.rsplit(":", 1)[0], int(node.rsplit(":", 1)[1])) for node in nodes.split(",")]
+
+    @property
+    def _registry_key(self) -> tuple:
+        return "redis-cluster", tuple(self._nodes), self._env.PASSWORD
+
+    def _publish(self, client, channel: str, payload: bytes):
+        return client.spublish(channel, payload)
+
+    def _listen(self, channels: List[str]):
+        # one connection per slot owner of the channels, polled in turn without waiting,
+        # the reader only sleeps (backing off up to 50ms) once a whole round is empty
+        self._pubsub: redis.cluster.ClusterPubSub = self._client_of(self._topic).pubsub()
+        self._pubsub.ssubscribe(*channels)
+        nodes = self._owners(channels)
+        idle = 0.001
+        while True:
+            received = False
+            for node in nodes:
+                # a single node: block on it
+                message = self._pubsub.get_sharded_message(target_node=node, timeout=1.0 if len(nodes) == 1 else 0)
+                if message is None:
+                    continue
+                received = True
+                if message['type'] == 'sunsubscribe':
+                    # slot migrated to another node: follow it
+                    channel = message['channel'].decode()
+                    self.logger.info(f"slot moved, resubscribing .. {channel}")
+                    self._client.nodes_manager.initialize()
+                    self._pubsub.ssubscribe(channel)
+                    nodes = self._owners(channels)
+                    break
+                yield message
+            if received or len(nodes) == 1:
+                idle = 0.001
+            else:
+                time.sleep(idle)
+                idle = min(idle * 2, 0.05)
+
+    def _owners(self, channels: List[str]) -> list:
+        return list({node.name: node for node in map(self._client.get_node_from_key, channels)}.values())
+
+
+class RedisShardedPubsub(RedisPubsub):
+    """
+    client-side sharding over independent redis servers: each channel lives on one server,
+    picked by a consistent hash ring (adding a server only moves ~1/N of the channels)
+    consumers only connect to the servers owning their channels
+    """
+
+    def __init__(self, topic: str, log_name: str = "redis-sharded", endpoints: List[str] = None,
+                 vnodes: int = 160, **kwargs):
+        """
+        endpoints: host:port or redis:// urls, defaults to RedisEnv.ENDPOINTS
+            host:port endpoints use RedisEnv DB and PASSWORD
+        vnodes: virtual nodes per endpoint on the hash ring
+        other arguments: see RedisPubsub
+        """
+        super().__init__(topic=topic, log_name=log_name, **kwargs)
+        if endpoints is None:
+            endpoints = (self._env.ENDPOINTS or f"{self._env.HOST}:{self._env.PORT}").split(",")
+        self._ring = HashRing([endpoint.strip() for endpoint in endpoints], vnodes=vnodes)
+        self._clients = {}
+        # publishing threads may connect a same endpoint at once: a single registry reference each
+        self._connecting = threading.Lock()
+
+    @property
+    def shard(self) -> str:
+        """endpoint owning the topic"""
+        return self._ring.get(self._topic)
+
+    @connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,))
+    def open(self):
+        self.logger.debug(f"connecting .. {self.shard}")
+        self._client = self._connect(self.shard)
+        self._ready()
+
+    def _connect(self, endpoint: str) -> redis.Redis:
+        """shared client of an endpoint, connected on first use"""
+        client = self._clients.get(endpoint)
+        if client is None:
+            with self._connecting:
+                if endpoint not in self._clients:
+                    self._clients[endpoint] = registry.acquire(self._endpoint_key(endpoint),
+                                                               lambda: self._client_factory(endpoint))
+                client = self._clients[endpoint]
+        return client
+
+    def _client_factory(self, endpoint: str) -> redis.Redis:
+        if "://" in endpoint:
+            return redis.Redis.from_url(endpoint)
+        host, port = endpoint.rsplit(":", 1)
+        return redis.Redis(host=host, port=int(port), db=self._env.DB, password=self._env.PASSWORD)
+
+    def _endpoint_key(self, endpoint: str) -> tuple:
+        return "redis", endpoint, self._env.DB, self._env.PASSWORD
+
+    def close(self):
+        for framer in list(self._framers.values()):
+            framer.close()
+        if self.spooler:
+            self.spooler.close()
+        with self._connecting:
+            clients, self._clients = self._clients, {}
+        for endpoint in clients:
+            registry.release(self._endpoint_key(endpoint), lambda client: client.close())
+        self._client = None
+        self.logger.debug("terminated.")
+
+    def _client_of(self, channel: str) -> redis.Redis:
+        # other channels (e.g., partitions, dead letters) may live on another server
+        return self._client if channel == self._topic else self._connect(self._ring.get(channel))
+
+    def _listen(self, channels: List[str]):
+        shards = {}
+        for channel in channels:
+            shards.setdefault(self._ring.get(channel), []).append(channel)
+        if list(shards) == [self.shard]:
+            yield from super()._listen(channels)
+            return
+        # one reader thread per server, merged into a single stream
+        # readers (and their connections) are stopped when the stream is closed, e.g., consume exits or retries
+        merged = queue.Queue(maxsize=1000)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    merged.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+        def read(pubsub: redis.client.PubSub):
+            try:
+                while not stop.is_set():
+                    message = pubsub.get_message(timeout=0.5)
+                    if message is not None:
+                        put(message)
+            except Exception as err:
+                put(err)
+
+        pubsubs, readers = [], []
+        try:
+            for shard, subscriptions in shards.items():
+                self.logger.debug(f"subscribing .. {shard} => {subscriptions}")
+                pubsub = self._connect(shard).pubsub(ignore_subscribe_messages=True)
+                pubsubs.append(pubsub)
+                pubsub.subscribe(*subscriptions)
+                readers.append(threading.Thread(target=read, args=(pubsub,), name=f"{self.log_name}-{shard}",
+                                                daemon=True))
+            for reader in readers:
+                reader.start()
+            while True:
+                message = merged.get()
+                if isinstance(message, Exception):
+                    raise message
+                yield message
+        finally:
+            stop.set()
+            for reader in readers:
+                if reader.is_alive():
+                    reader.join(timeout=2)
+            for pubsub in pubsubs:
+                pubsub.close()
+
+
+class RedisStreamsPubsub(RedisPubsub):
+    """
+    Redis Streams flavor: messages are persisted in a stream (XADD)
+    and consumers of a same group share the load (XREADGROUP/XACK)
+    """
+
+    # stream entry field holding the payload
+    FIELD = b"data"
+
+    def __init__(self, topic: str, log_name: str = "redis-streams", consumer: str = None,
+                 count: int = 100, block: int = 5000, maxlen: int = None, codec: Union[str, Codec] = None,
+                 compression: Union[str, Compressor] = None, spool: Union[str, Spool] = None,
+                 min_idle: int = 60000):
+        """
+        consumer: consumer name inside the group, defaults to <hostname>-<pid>
+        count: max number of messages read per XREADGROUP
+        block: max time (ms) a XREADGROUP waits for new messages
+        maxlen: approximate stream length cap on publish, defaults to RedisEnv (0 = unbounded)
+        min_idle: pending entries of the group idle for min_idle ms (e.g., of a consumer that restarted
+            under a new name, or crashed) are claimed (XAUTOCLAIM) at start then every min_idle ms, 0: never
+        """
+        super().__init__(topic=topic, log_name=log_name, codec=codec, compression=compression, spool=spool)
+        self._consumer = consumer if consumer else f"{socket.gethostname()}-{os.getpid()}"
+        self._count = count
+        self._block = block
+        self._min_idle = min_idle
+        self._maxlen = maxlen if maxlen is not None else self._env.STREAM_MAXLEN
+
+    def _xadd(self, client, stream: str, msg):
+        return client.xadd(stream, {self.FIELD: msg},
+                           maxlen=self._maxlen if self._maxlen else None, approximate=True)
+
+    @connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,))
+    def publish(self, msg: str):
+        if self.spooler:
+            entry_ids = self.spooler.publish([self._payload(msg)])
+            self._published.inc()
+            return entry_ids[0] if entry_ids else None
+        entry_id = self._xadd(self._client, self._topic, self._payload(msg))
+        self._published.inc()
+        return entry_id
+
+    def _send(self, payloads: List[bytes]) -> List[bytes]:
+        pipe = self._client.pipeline(transaction=False)
+        for payload in payloads:
+            self._xadd(pipe, self._topic, payload)
+        return pipe.execute()
+
+    @connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,), operation="admin")
+    def check_group(self, group: str):
+        """
+        creates the consumer group (and the stream) if it doesn't exist
+        new groups only see messages published after their creation
+        """
+        try:
+            self._client.xgroup_create(self._topic, group, id="$", mkstream=True)
+            self.logger.info(f"registering new group .. {group}")
+        except redis.exceptions.ResponseError as err:
+            if "BUSYGROUP" not in str(err):
+                raise
+
+    @connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,))
+    def consume(self, callback: Callable, deadLetter: str = None, subscription: str = None,
+                batch: bool = False, envelope: bool = False, **kwargs):
+        """
+        callback: function called with message payload
+            (or with the list of payloads if batch=True)
+        deadLetter: a backup stream where unconsumed events are pushed
+        subscription: consumer group name
+        envelope: if True, payloads are tesselite.message.Message (raw payload, entry id)
+        """
+        self.logger.debug("consuming ..")
+        group = subscription if subscription else self._env.SUBSCRIPTION_NAME
+        self.check_group(group)
+        callback = instrument(callback, self._topic, batch=batch)
+
+        # messages delivered to this consumer but never acked are replayed first
+        cursor = "0"
+        claimed_at = None
+        try:
+            while True:
+                if self._min_idle and (claimed_at is None or time.monotonic() - claimed_at >= self._min_idle / 1000):
+                    for entries in self._claim(group):
+                        acks = self._dispatch(callback, entries, batch, deadLetter, envelope)
+                        if acks:
+                            self._client.xack(self._topic, group, *acks)
+                    claimed_at = time.monotonic()
+                response = self._client.xreadgroup(group, self._consumer, {self._topic: cursor},
+                                                   count=self._count, block=self._block)
+                entries = response[0][1] if response else []
+                if cursor != ">":
+                    # history read once, past the last returned id (failed entries are left to the claim)
+                    cursor = entries[-1][0] if entries else ">"
+                if not entries:
+                    continue
+                acks = self._dispatch(callback, entries, batch, deadLetter, envelope)
+                if acks:
+                    self._client.xack(self._topic, group, *acks)
+        except KeyboardInterrupt:
+            self.logger.info("graceful exit")
+
+    def _claim(self, group: str) -> Iterator[list]:
+        """
+        pending entries of the group idle for min_idle ms, claimed by this consumer, count by count
+        """
+        start = "0-0"
+        while True:
+            response = self._client.xautoclaim(self._topic, group, self._consumer, self._min_idle,
+                                               start_id=start, count=self._count)
+            start, entries = response[0], response[1]
+            if entries:
+                self.logger.info(f"claiming {len(entries)} idle pending message(s) ..")
+                yield entries
+            if start in (b"0-0", "0-0"):
+                return
+
+    def _dispatch(self, callback: Callable, entries: list, batch: bool, deadLetter: str = None,
+                  envelope: bool = False) -> list:
+        """
+        runs the callback over a batch of entries
+        returns the ids to ack
+        """
+        # replayed entries may have been trimmed from the stream (empty fields)
+        ids = [entry_id for entry_id, fields in entries]
+        raws = {entry_id: fields[self.FIELD] for entry_id, fields in entries if fields}
+        # entries that can't be decoded would fail on every replay: dead lettered (or dropped), acked
+        payloads, broken = [], set()
+        for entry_id, raw in raws.items():
+            try:
+                if envelope:
+                    data = Message(self._decompress(raw), id=entry_id.decode(), topic=self._topic, codec=self.codec)
+                else:
+                    data = self._decode(self._decompress(raw))
+                payloads.append((entry_id, data))
+            except Exception as err:
+                self.logger.error(f"(decode) failed [{describe(err)}] => {'dead letter' if deadLetter else 'dropped'}")
+                broken.add(entry_id)
+        failed = set()
+        if batch and payloads:
+            try:
+                callback([data for _, data in payloads])
+            except Exception as err:
+                self.logger.error(err, stack_info=True)
+                failed = {entry_id for entry_id, _ in payloads}
+        elif not batch:
+            for entry_id, data in payloads:
+                try:
+                    callback(data)
+                except Exception as err:
+                    self.logger.error(err, stack_info=True)
+                    failed.add(entry_id)
+        if failed and not deadLetter:
+            # left pending, replayed on next start (or claimed by another consumer once idle)
+            return [entry_id for entry_id in ids if entry_id not in failed]
+        if deadLetter and (failed or broken):
+            pipe = self._client.pipeline(transaction=False)
+            for entry_id in failed | broken:
+                self._xadd(pipe, deadLetter, raws[entry_id])
+            pipe.execute()
+            DEAD_LETTERED.labels(self._topic).inc(len(failed | broken))
+        return ids
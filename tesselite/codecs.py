@@ -0,0 +1,75 @@
+"""
+Codecs: serialize objects on publish, deserialize payloads before callbacks
+"""
+import json
+from typing import Any, Union
+
+from tesselite.exceptions import ConfigurationException
+
+
+class Codec:
+    name = None
+
+    def encode(self, obj: Any) -> bytes:
+        raise NotImplementedError()
+
+    def decode(self, raw: bytes) -> Any:
+        raise NotImplementedError()
+
+
+class JsonCodec(Codec):
+    """stdlib json, always available"""
+    name = "json"
+
+    def encode(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    def decode(self, raw: bytes) -> Any:
+        return json.loads(raw)
+
+
+class OrjsonCodec(Codec):
+    """orjson (optional dependency), wire compatible with json"""
+    name = "orjson"
+
+    def __init__(self):
+        try:
+            import orjson
+        except ImportError:
+            raise ConfigurationException("codec <orjson> requires the orjson package (pip install orjson)")
+        self.encode = orjson.dumps
+        self.decode = orjson.loads
+
+
+class MsgpackCodec(Codec):
+    """msgpack (optional dependency), binary"""
+    name = "msgpack"
+
+    def __init__(self):
+        try:
+            import msgpack
+        except ImportError:
+            raise ConfigurationException("codec <msgpack> requires the msgpack package (pip install msgpack)")
+        self.encode = msgpack.packb
+        self.decode = msgpack.unpackb
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec, OrjsonCodec, MsgpackCodec)}
+
+
+def get_codec(codec: Union[str, Codec, None]) -> Union[Codec, None]:
+    """
+    codec: name (json, orjson, msgpack, auto) or Codec instance
+        auto: the fastest json codec installed (orjson, else json)
+    """
+    if codec is None or isinstance(codec, Codec):
+        return codec
+    if codec == "auto":
+        try:
+            return OrjsonCodec()
+        except ConfigurationException:
+            return JsonCodec()
+    try:
+        return CODECS[codec]()
+    except KeyError:
+        raise ConfigurationException(f"codec <{codec}> not in {list(CODECS) + ['auto']}")
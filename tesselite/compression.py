@@ -0,0 +1,210 @@
+"""
+Transparent compression of payloads above a size threshold
+
+compressed payloads are prefixed with a 4 bytes header (MAGIC + compressor id),
+consumers decompress them automatically, whatever the compressor configured on their side
+(zstd payloads compressed with a dictionary require the same dictionary on the consumer)
+
+e.g., train a zstd dictionary from sampled messages (one per line):
+    python -m tesselite.compression train --input samples.jsonl --output tesselite.dict
+"""
+import threading
+import zlib
+from typing import Iterable, Union
+
+from tesselite.exceptions import ConfigurationException
+
+MAGIC = b"\xffTZ"
+
+HEADER_SIZE = len(MAGIC) + 1
+
+
+class Compressor:
+    name = None
+    # marker byte written in the header
+    id = None
+
+    def __init__(self, threshold: int = 1024):
+        """
+        threshold: payloads smaller than this (bytes) are sent uncompressed
+        """
+        self.threshold = threshold
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+    def decompress(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+
+class ZlibCompressor(Compressor):
+    """stdlib zlib, always available"""
+    name = "zlib"
+    id = 1
+
+    def __init__(self, threshold: int = 1024, level: int = 6):
+        super().__init__(threshold)
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class ZstdCompressor(Compressor):
+    """zstandard (optional dependency), best ratio/speed, optional dictionary for small payloads"""
+    name = "zstd"
+    id = 2
+
+    def __init__(self, threshold: int = 1024, level: int = 3, dictionary: Union[bytes, str] = None):
+        """
+        dictionary: trained dictionary (bytes) or path to a dictionary file
+        """
+        super().__init__(threshold)
+        try:
+            import zstandard
+        except ImportError:
+            raise ConfigurationException("compressor <zstd> requires the zstandard package (pip install zstandard)")
+        if isinstance(dictionary, str):
+            with open(dictionary, "rb") as file:
+                dictionary = file.read()
+        self._zstd = zstandard
+        self._dictionary = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        self.level = level
+        # zstandard (de)compressors are not thread safe
+        self._local = threading.local()
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = self._zstd.ZstdCompressor(level=self.level,
+                                                                             dict_data=self._dictionary)
+        return compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = self._zstd.ZstdDecompressor(dict_data=self._dictionary)
+        return decompressor.decompress(data)
+
+
+class Lz4Compressor(Compressor):
+    """lz4 (optional dependency), fastest"""
+    name = "lz4"
+    id = 3
+
+    def __init__(self, threshold: int = 1024):
+        super().__init__(threshold)
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ConfigurationException("compressor <lz4> requires the lz4 package (pip install lz4)")
+        self.compress = lz4.frame.compress
+        self.decompress = lz4.frame.decompress
+
+
+COMPRESSORS = {compressor.name: compressor for compressor in (ZlibCompressor, ZstdCompressor, Lz4Compressor)}
+
+# id => compressor with default settings, created on first compressed payload
+_decompressors = {}
+
+
+def get_compressor(compressor: Union[str, Compressor, None]) -> Union[Compressor, None]:
+    """
+    compressor: name (zlib, zstd, lz4, auto) or Compressor instance
+        auto: the best compressor installed (zstd, else lz4, else zlib)
+    """
+    if compressor is None or isinstance(compressor, Compressor):
+        return compressor
+    if compressor == "auto":
+        for candidate in (ZstdCompressor, Lz4Compressor):
+            try:
+                return candidate()
+            except ConfigurationException:
+                pass
+        return ZlibCompressor()
+    try:
+        return COMPRESSORS[compressor]()
+    except KeyError:
+        raise ConfigurationException(f"compressor <{compressor}> not in {list(COMPRESSORS) + ['auto']}")
+
+
+def is_compressed(raw: Union[bytes, memoryview]) -> bool:
+    return raw[:len(MAGIC)] == MAGIC
+
+
+def compress(data: bytes, compressor: Compressor) -> bytes:
+    """
+    header + compressed data, data as is if below the threshold or incompressible
+    """
+    if len(data) < compressor.threshold:
+        return data
+    compressed = compressor.compress(data)
+    if len(compressed) + HEADER_SIZE >= len(data):
+        return data
+    return MAGIC + bytes((compressor.id,)) + compressed
+
+
+def decompress(raw: bytes, compressor: Compressor = None) -> bytes:
+    """
+    original data, raw as is if not compressed
+    compressor: used if it matches the header (e.g., zstd with a dictionary), defaults otherwise
+    """
+    if not is_compressed(raw):
+        return raw
+    marker = raw[len(MAGIC)]
+    if compressor is None or compressor.id != marker:
+        compressor = _decompressors.get(marker)
+        if compressor is None:
+            for candidate in COMPRESSORS.values():
+                if candidate.id == marker:
+                    compressor = _decompressors.setdefault(marker, candidate())
+                    break
+            else:
+                raise ValueError(f"unknown compressor id: {marker}")
+    return compressor.decompress(raw[HEADER_SIZE:])
+
+
+def train_dictionary(samples: Iterable[bytes], size: int = 16384) -> bytes:
+    """
+    zstd dictionary trained on sample payloads (a few thousands samples for small payloads)
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise ConfigurationException("dictionary training requires the zstandard package (pip install zstandard)")
+    return zstandard.train_dictionary(size, list(samples)).as_bytes()
+
+
+def main():
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    train = commands.add_parser("train", help="trains a zstd dictionary")
+    train.add_argument("--input", help="sampled messages, one per line (default: stdin)")
+    train.add_argument("--output", required=True, help="dictionary file")
+    train.add_argument("--size", type=int, default=16384, help="dictionary size (bytes)")
+    train.add_argument("--level", type=int, default=3, help="zstd level used for the ratio report")
+    args = parser.parse_args()
+
+    source = open(args.input, "rb") if args.input else sys.stdin.buffer
+    with source:
+        samples = [line.rstrip(b"\n") for line in source if line.strip()]
+    dictionary = train_dictionary(samples, size=args.size)
+    with open(args.output, "wb") as file:
+        file.write(dictionary)
+
+    plain = ZstdCompressor(level=args.level)
+    trained = ZstdCompressor(level=args.level, dictionary=dictionary)
+    total = sum(map(len, samples))
+    print(f"{len(samples)} samples, {total} bytes => {args.output} ({len(dictionary)} bytes)")
+    for label, compressor in (("zstd", plain), ("zstd+dictionary", trained)):
+        compressed = sum(len(compressor.compress(sample)) for sample in samples)
+        print(f"  {label:16} ratio {total / compressed:6.2f}")
+
+
+if __name__ == '__main__':
+    main()
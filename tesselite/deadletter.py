@@ -0,0 +1,159 @@
+"""
+Dead letters: messages whose callback kept failing, with the error metadata, written by a background thread
+in batches (one pipeline / publish round per batch), the consume loop never waits on the dead letter topic
+
+on brokers without message attributes (redis), a dead letter is prefixed with a header:
+MAGIC + 4 bytes metadata size + metadata (json) + original message, consumers strip it automatically
+"""
+import json
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable, List, Tuple, Union
+
+from tesselite.metrics import DEAD_LETTERED
+
+MAGIC = b"\xffTD\x01"
+
+_LENGTH = struct.Struct(">I")
+
+
+def describe(error: Union[Exception, str]) -> str:
+    return error if isinstance(error, str) else f"{error.__class__.__name__}: {error}"
+
+
+def metadata(origin: str, error: Union[Exception, str], attempts: int, **extra) -> dict:
+    """
+    error metadata sent along a dead letter
+    origin: topic (or channel) the message was consumed from
+    attempts: number of times the callback failed (0: never run, e.g., queue overflow)
+    """
+    return dict(origin=origin, error=describe(error), attempts=attempts,
+                time=datetime.now(timezone.utc).isoformat(), **extra)
+
+
+def is_dead_letter(raw: bytes) -> bool:
+    return raw[:len(MAGIC)] == MAGIC
+
+
+def wrap(payload: bytes, meta: dict) -> bytes:
+    encoded = json.dumps(meta, separators=(",", ":")).encode()
+    return MAGIC + _LENGTH.pack(len(encoded)) + encoded + payload
+
+
+def unwrap(raw: bytes) -> Tuple[bytes, dict]:
+    """
+    original message and metadata, (raw, {}) if raw is not a dead letter
+    """
+    if not is_dead_letter(raw):
+        return raw, {}
+    start = len(MAGIC) + _LENGTH.size
+    size, = _LENGTH.unpack_from(raw, len(MAGIC))
+    return raw[start + size:], json.loads(raw[start:start + size])
+
+
+class DeadLetterWriter:
+    """
+    bounded buffer of dead letters drained by a background thread,
+    a failed send is retried (with backoff) until it succeeds or the writer is closed
+    """
+
+    def __init__(self, send: Callable[[List[Tuple[bytes, dict]]], Any], topic: str, max_messages: int = 100,
+                 linger: float = 0.05, capacity: int = 10000, delay: float = 1, max_delay: float = 20,
+                 logger=None):
+        """
+        send: writes a list of (payload, metadata) on the dead letter topic, raises on failure
+        topic: consumed topic (metrics)
+        max_messages: max number of dead letters per send
+        linger: max time (s) a dead letter waits for others before being sent
+        capacity: max number of buffered dead letters, put blocks beyond
+        delay, max_delay: retry backoff while sends fail (s)
+        """
+        self._send = send
+        self._max_messages = max_messages
+        self._linger = linger
+        self._capacity = capacity
+        self._delay = delay
+        self._max_delay = max_delay
+        # (payload, metadata, count, on_sent)
+        self._buffer = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._dead_lettered = DEAD_LETTERED.labels(topic)
+        if logger is None:
+            from tesselite import root_logger as logger
+        self.logger = logger
+        self._thread = threading.Thread(target=self._run, name="tesselite-dead-letter", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        """buffered dead letters"""
+        return len(self._buffer)
+
+    def put(self, payload: bytes, meta: dict, count: int = 1, on_sent: Callable = None):
+        """
+        count: number of messages carried by the payload (frames), for metrics
+        on_sent: called once the dead letter is written (e.g., acks the original message)
+        """
+        with self._condition:
+            while len(self._buffer) >= self._capacity and not self._closed:
+                self._condition.wait()
+            self._buffer.append((payload, meta, count, on_sent))
+            self._condition.notify_all()
+
+    def close(self, timeout: float = 10):
+        """
+        sends buffered dead letters (gives up after timeout), then stops the writer
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout=timeout)
+        if self._buffer:
+            self.logger.error(f"(dead letter) {len(self._buffer)} message(s) lost")
+
+    def _batch(self) -> list:
+        with self._condition:
+            while not self._buffer and not self._closed:
+                self._condition.wait()
+            # linger: let a burst of failures fill the batch
+            deadline = time.monotonic() + self._linger
+            while len(self._buffer) < self._max_messages and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return [self._buffer[index] for index in range(min(len(self._buffer), self._max_messages))]
+
+    def _run(self):
+        delay = self._delay
+        while True:
+            batch = self._batch()
+            if not batch:
+                return
+            try:
+                self._send([(payload, meta) for payload, meta, _, _ in batch])
+            except Exception as err:
+                self.logger.error(f"(dead letter) send failed [{err.__class__.__name__}] => {err}, "
+                                  f"next attempt in {delay}s")
+                with self._condition:
+                    if self._closed:
+                        return
+                    self._condition.wait(delay)
+                delay = min(delay * 2, self._max_delay)
+                continue
+            delay = self._delay
+            with self._condition:
+                for _ in batch:
+                    self._buffer.popleft()
+                self._condition.notify_all()
+            for payload, meta, count, on_sent in batch:
+                self._dead_lettered.inc(count)
+                if on_sent:
+                    try:
+                        on_sent()
+                    except Exception as err:
+                        self.logger.error(f"(dead letter) [{err.__class__.__name__}] => {err}")
@@ -0,0 +1,174 @@
+"""
+Dispatch messages from a reader to a pool of callback threads, or to key-ordered serial lanes
+"""
+import queue
+import threading
+from typing import Callable
+
+from tesselite.exceptions import ConfigurationException
+from tesselite.hashring import partition
+
+# overflow policies, i.e., what the reader does when the queue is full
+BLOCK = "block"
+DROP_OLDEST = "drop-oldest"
+DEAD_LETTER = "dead-letter"
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, DEAD_LETTER)
+
+_STOP = object()
+
+
+class Dispatcher:
+    """
+    bounded queue drained by a pool of worker threads
+    the reader only enqueues, workers run the handler
+    """
+
+    def __init__(self, handler: Callable, workers: int, queue_size: int = 1000, overflow: str = BLOCK,
+                 spill: Callable = None, name: str = "tesselite-worker"):
+        """
+        handler: function called by workers with each message
+        workers: number of worker threads
+        queue_size: max number of messages waiting for a worker
+        overflow: policy when the queue is full (block, drop-oldest, dead-letter)
+        spill: function called with the overflowing message (dead-letter policy)
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ConfigurationException(f"overflow policy <{overflow}> not in {OVERFLOW_POLICIES}")
+        if overflow == DEAD_LETTER and spill is None:
+            raise ConfigurationException("overflow policy <dead-letter> requires a dead letter topic")
+        if workers < 1:
+            raise ConfigurationException(f"workers must be positive, got {workers}")
+        self._handler = handler
+        self._overflow = overflow
+        self._spill = spill
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._counters = dict(enqueued=0, processed=0, failed=0, dropped=0, spilled=0, max_depth=0)
+        self._threads = [threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True)
+                         for i in range(workers)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        """
+        waits for queued messages to be handled then stops workers
+        """
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def submit(self, message):
+        """
+        enqueues a message, applying the overflow policy if the queue is full
+        """
+        if self._overflow == BLOCK:
+            self._queue.put(message)
+        else:
+            try:
+                self._queue.put_nowait(message)
+            except queue.Full:
+                if self._overflow == DEAD_LETTER:
+                    self._spill(message)
+                    self._count("spilled")
+                    return
+                # drop-oldest: make room then retry (other readers may race us)
+                while True:
+                    try:
+                        self._queue.get_nowait()
+                        self._count("dropped")
+                    except queue.Empty:
+                        pass
+                    try:
+                        self._queue.put_nowait(message)
+                        break
+                    except queue.Full:
+                        continue
+        with self._lock:
+            self._counters["enqueued"] += 1
+            self._counters["max_depth"] = max(self._counters["max_depth"], self._queue.qsize())
+
+    def _work(self):
+        while True:
+            message = self._queue.get()
+            if message is _STOP:
+                return
+            try:
+                self._handler(message)
+                self._count("processed")
+            except Exception:
+                self._count("failed")
+
+    def stats(self) -> dict:
+        """
+        queue depth and message counters
+        """
+        with self._lock:
+            return dict(depth=self._queue.qsize(), capacity=self._queue.maxsize, **self._counters)
+
+
+class Lanes:
+    """
+    key-ordered dispatch: messages are hashed by key onto serial lanes (one thread each),
+    messages of a same key are handled in order, different keys run in parallel
+    """
+
+    def __init__(self, handler: Callable, lanes: int, key: Callable, queue_size: int = 1000, overflow: str = BLOCK,
+                 spill: Callable = None, name: str = "tesselite-lane"):
+        """
+        handler: function called by lanes with each message
+        lanes: number of lanes (threads)
+        key: function message => key
+        queue_size: max number of messages waiting in each lane
+        overflow, spill: see Dispatcher
+        """
+        if lanes < 1:
+            raise ConfigurationException(f"lanes must be positive, got {lanes}")
+        self._key = key
+        self._lanes = [Dispatcher(handler, workers=1, queue_size=queue_size, overflow=overflow, spill=spill,
+                                  name=f"{name}-{i}") for i in range(lanes)]
+
+    def start(self):
+        for lane in self._lanes:
+            lane.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        """
+        waits for queued messages to be handled then stops lanes
+        """
+        for lane in self._lanes:
+            lane.stop(timeout=timeout)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def submit(self, message):
+        self._lanes[partition(self._key(message), len(self._lanes))].submit(message)
+
+    def stats(self) -> dict:
+        """
+        counters summed over lanes, depth of each lane
+        """
+        lanes = [lane.stats() for lane in self._lanes]
+        stats = {counter: sum(lane[counter] for lane in lanes)
+                 for counter in ("depth", "capacity", "enqueued", "processed", "failed", "dropped", "spilled")}
+        stats["max_depth"] = max(lane["max_depth"] for lane in lanes)
+        stats["lanes"] = [lane["depth"] for lane in lanes]
+        return stats
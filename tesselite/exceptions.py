@@ -1,7 +1,7 @@
+import functools
+import time
 from typing import Callable, Type
 
-from retry import retry
-
 
 def graceful(action: Callable):
 
@@ -21,27 +21,141 @@ def graceful(action: Callable):
 
 
 
-def connexion(expected_errors:tuple, noisy_errors:tuple=()):
+def connexion(expected_errors:tuple, noisy_errors:tuple=(), operation:str=None):
+    """
+    backoff the action on connexion errors, following the retry policy of its operation
+    operation: key in tesselite.retry.policies, defaults to the action's name
+    """
 
-    from tesselite import root_logger
+    from tesselite.retry import DEFAULT_POLICY, policies
+
+    retryable = expected_errors + noisy_errors
 
     def run(action:Callable):
 
-        @retry(expected_errors+noisy_errors, delay=2, backoff=2, max_delay=20)
+        name = action.__name__
+        key = operation if operation else name
+
+        @functools.wraps(action)
         def inner(*args, **kwargs):
+            policy = policies.get(key, DEFAULT_POLICY)
+            breaker = policy.breaker
+            if breaker is not None and not breaker.allow():
+                raise _circuit_open(name, key)
             try:
-                return action(*args, **kwargs)
-            except expected_errors as err:
-                root_logger.error(f"({action.__name__}) connexion error [{err.__class__.__name__}] => backoff.")
-                raise
-            except noisy_errors as err:
-                root_logger.warning(f"({action.__name__}) connexion error [{err.__class__.__name__}] => backoff.")
-                raise
-            except KeyboardInterrupt:
-                raise
+                result = action(*args, **kwargs)
+            except retryable as err:
+                return _backoff(action, key, args, kwargs, err, policy, expected_errors, noisy_errors)
             except Exception as err:
-                root_logger.error(f"({action.__name__}) unknown error => {err}")
+                _log(name, err, expected_errors, noisy_errors)
                 raise
+            # success path
+            if breaker is not None:
+                breaker.success()
+            if policy.budget is not None:
+                policy.budget.deposit()
+            return result
+
+        return inner
+
+    return run
+
+
+def _log(name: str, err: Exception, expected_errors: tuple, noisy_errors: tuple):
+    from tesselite import root_logger
+    if isinstance(err, expected_errors):
+        root_logger.error(f"({name}) connexion error [{err.__class__.__name__}] => backoff.")
+    elif isinstance(err, noisy_errors):
+        root_logger.warning(f"({name}) connexion error [{err.__class__.__name__}] => backoff.")
+    else:
+        root_logger.error(f"({name}) unknown error => {err}")
+
+
+def _circuit_open(name: str, key: str) -> Exception:
+    from tesselite.metrics import CIRCUIT_OPEN
+    from tesselite.retry import CircuitOpenException
+    CIRCUIT_OPEN.labels(key).inc()
+    return CircuitOpenException(f"({name}) circuit open => fail fast.")
+
+
+def _backoff(action: Callable, key: str, args, kwargs, err: Exception, policy, expected_errors: tuple,
+             noisy_errors: tuple):
+    """retry loop (slow path)"""
+    from tesselite.metrics import RETRIES
+    name = action.__name__
+    breaker = policy.breaker
+    started = time.monotonic()
+    attempt = 1
+    while True:
+        _log(name, err, expected_errors, noisy_errors)
+        if breaker is not None and breaker.failure():
+            raise _circuit_open(name, key) from err
+        delay = policy.next_delay(attempt, started)
+        if delay is None:
+            raise err
+        time.sleep(delay)
+        if breaker is not None and not breaker.allow():
+            raise _circuit_open(name, key) from err
+        RETRIES.labels(key).inc()
+        try:
+            result = action(*args, **kwargs)
+        except expected_errors + noisy_errors as _err:
+            err = _err
+            attempt += 1
+            continue
+        except Exception as _err:
+            _log(name, _err, expected_errors, noisy_errors)
+            raise
+        if breaker is not None:
+            breaker.success()
+        return result
+
+
+def async_connexion(expected_errors:tuple, noisy_errors:tuple=(), operation:str=None):
+    """connexion for coroutines: backoff sleeps don't block the event loop"""
+
+    import asyncio
+    from tesselite.metrics import RETRIES
+    from tesselite.retry import DEFAULT_POLICY, policies
+
+    retryable = expected_errors + noisy_errors
+
+    def run(action:Callable):
+
+        name = action.__name__
+        key = operation if operation else name
+
+        @functools.wraps(action)
+        async def inner(*args, **kwargs):
+            policy = policies.get(key, DEFAULT_POLICY)
+            breaker = policy.breaker
+            started = None
+            attempt = 0
+            while True:
+                if breaker is not None and not breaker.allow():
+                    raise _circuit_open(name, key)
+                try:
+                    result = await action(*args, **kwargs)
+                except retryable as err:
+                    _log(name, err, expected_errors, noisy_errors)
+                    if breaker is not None and breaker.failure():
+                        raise _circuit_open(name, key) from err
+                    attempt += 1
+                    started = started if started else time.monotonic()
+                    delay = policy.next_delay(attempt, started)
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+                    RETRIES.labels(key).inc()
+                    continue
+                except Exception as err:
+                    _log(name, err, expected_errors, noisy_errors)
+                    raise
+                if breaker is not None:
+                    breaker.success()
+                if policy.budget is not None and not attempt:
+                    policy.budget.deposit()
+                return result
 
         return inner
 
@@ -53,4 +167,16 @@ class MessageProcessingException(Exception):
 
 
 class ConfigurationException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class SpoolFullException(Exception):
+    pass
+
+
+class WorkerProcessException(Exception):
+    pass
+
+
+class OrderingKeyPausedException(Exception):
+    pass
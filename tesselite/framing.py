@@ -0,0 +1,144 @@
+"""
+Producer-side micro-batching: many small messages are packed into one broker message (frame)
+
+frame layout: MAGIC, then for each message a 4 bytes big-endian length followed by the payload
+consumers detect frames by their MAGIC prefix and unpack them transparently,
+unframed payloads are delivered as is (0xff never starts utf-8 text nor a single msgpack object)
+"""
+import struct
+import threading
+from time import monotonic
+from typing import Any, Callable, List, NamedTuple, Union
+
+MAGIC = b"\xffTF\x01"
+
+_LENGTH = struct.Struct(">I")
+
+
+class FrameSettings(NamedTuple):
+    """
+    a frame is sent as soon as one threshold is reached
+    max_bytes: max frame size
+    max_messages: max number of messages per frame
+    linger: max time (s) the first message of a frame waits for the next ones
+    """
+    max_bytes: int = 64000
+    max_messages: int = 1000
+    linger: float = 0.005
+
+
+def is_frame(raw: Union[bytes, memoryview]) -> bool:
+    return raw[:len(MAGIC)] == MAGIC
+
+
+def pack(payloads: List[bytes]) -> bytes:
+    parts = [MAGIC]
+    for payload in payloads:
+        parts.append(_LENGTH.pack(len(payload)))
+        parts.append(payload)
+    return b"".join(parts)
+
+
+def unpack(raw: bytes) -> List[bytes]:
+    """
+    payloads of a frame, [raw] if raw is not a frame
+    """
+    if not is_frame(raw):
+        return [raw]
+    payloads = []
+    offset, end = len(MAGIC), len(raw)
+    while offset < end:
+        if offset + _LENGTH.size > end:
+            raise ValueError(f"truncated frame: {end} bytes")
+        size, = _LENGTH.unpack_from(raw, offset)
+        offset += _LENGTH.size
+        if offset + size > end:
+            raise ValueError(f"truncated frame: {end} bytes")
+        payloads.append(raw[offset:offset + size])
+        offset += size
+    return payloads
+
+
+class Framer:
+    """
+    buffers payloads and sends them as frames (on thresholds, flush or close)
+    frames are sent in order, by the publishing thread or by a linger thread
+    """
+
+    def __init__(self, send: Callable[[bytes], Any], settings: FrameSettings = FrameSettings(),
+                 name: str = "tesselite-framer"):
+        """
+        send: publishes a frame (bytes) on the broker
+        """
+        self._send = send
+        self._settings = settings
+        self._name = name
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._buffer = []
+        self._size = len(MAGIC)
+        self._deadline = None
+        self._thread = None
+        self._stopped = False
+
+    def add(self, payload: bytes):
+        with self._lock:
+            framed = _LENGTH.size + len(payload)
+            if self._buffer and self._size + framed > self._settings.max_bytes:
+                self._flush()
+            self._buffer.append(payload)
+            self._size += framed
+            if len(self._buffer) >= self._settings.max_messages or self._size >= self._settings.max_bytes \
+                    or self._settings.linger <= 0:
+                self._flush()
+            elif len(self._buffer) == 1:
+                self._deadline = monotonic() + self._settings.linger
+                self._linger()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """
+        sends the pending frame and stops the linger thread
+        """
+        with self._lock:
+            self._flush()
+            self._stopped = True
+            self._wakeup.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _flush(self):
+        # lock held
+        if not self._buffer:
+            return
+        payloads = self._buffer
+        self._buffer, self._size, self._deadline = [], len(MAGIC), None
+        self._send(pack(payloads))
+
+    def _linger(self):
+        # lock held: starts the linger thread or wakes it up for the new deadline
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+        self._wakeup.notify()
+
+    def _run(self):
+        from tesselite import root_logger
+        with self._lock:
+            while not self._stopped:
+                if self._deadline is None:
+                    self._wakeup.wait()
+                    continue
+                remaining = self._deadline - monotonic()
+                if remaining > 0:
+                    self._wakeup.wait(remaining)
+                    continue
+                try:
+                    self._flush()
+                except Exception as err:
+                    root_logger.error(f"(framer) frame lost [{err.__class__.__name__}] => {err}")
@@ -0,0 +1,59 @@
+"""
+Consistent hashing: keys (topics, channels) => nodes (redis endpoints)
+each node owns many virtual points on the ring, adding or removing a node only moves ~1/N of the keys
+"""
+import bisect
+import hashlib
+import zlib
+from typing import Dict, Iterable, List
+
+
+def _hash(key: str) -> int:
+    # stable across processes (unlike hash())
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def partition(key, partitions: int) -> int:
+    """
+    partition of key in [0, partitions), stable across processes
+    """
+    return zlib.crc32(key if isinstance(key, bytes) else str(key).encode()) % partitions
+
+
+class HashRing:
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 160):
+        """
+        vnodes: virtual points per node, more points spread keys more evenly
+        """
+        self.vnodes = vnodes
+        self._hashes: List[int] = []
+        self._owners: Dict[int, str] = {}
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(set(self._owners.values()))
+
+    def add(self, node: str):
+        for replica in range(self.vnodes):
+            point = _hash(f"{node}#{replica}")
+            if point not in self._owners:
+                bisect.insort(self._hashes, point)
+            self._owners[point] = node
+
+    def remove(self, node: str):
+        points = [point for point, owner in self._owners.items() if owner == node]
+        for point in points:
+            del self._owners[point]
+        self._hashes = [point for point in self._hashes if point in self._owners]
+
+    def get(self, key: str) -> str:
+        """
+        node owning key: the first point clockwise from the key's hash
+        """
+        if not self._hashes:
+            raise KeyError("empty hash ring")
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[self._hashes[index]]
@@ -0,0 +1,64 @@
+"""
+Message envelope handed to callbacks consuming with envelope=True
+"""
+from typing import Callable, Optional, Union
+
+
+class Message:
+    """
+    raw payload plus broker metadata, the payload is only decoded on access
+    ack/nack are no-ops on brokers without per-message acknowledgement (e.g., redis pub/sub)
+    """
+
+    __slots__ = ("raw", "id", "topic", "publish_time", "attributes", "codec", "_text", "_ack", "_nack", "settled")
+
+    def __init__(self, raw: Union[bytes, memoryview], id: str = None, topic: str = None, publish_time=None,
+                 attributes: dict = None, ack: Callable = None, nack: Callable = None, codec=None):
+        self.raw = raw
+        self.id = id
+        self.topic = topic
+        self.publish_time = publish_time
+        self.attributes = attributes if attributes is not None else {}
+        self.codec = codec
+        self._text = None
+        self._ack = ack
+        self._nack = nack
+        # True once the callback acked/nacked itself, the consume loop then leaves the message alone
+        self.settled = False
+
+    @property
+    def data(self) -> str:
+        """utf-8 decoded payload (cached)"""
+        if self._text is None:
+            self._text = str(self.raw, "utf-8")
+        return self._text
+
+    @property
+    def value(self):
+        """payload deserialized with the consumer's codec (decoded text without codec)"""
+        return self.codec.decode(self.raw) if self.codec else self.data
+
+    def __bytes__(self) -> bytes:
+        return bytes(self.raw)
+
+    def __str__(self) -> str:
+        return self.data
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def __repr__(self) -> str:
+        return f"Message(id={self.id!r}, topic={self.topic!r}, size={len(self.raw)}, attributes={self.attributes!r})"
+
+    def ack(self):
+        self.settled = True
+        if self._ack:
+            self._ack()
+
+    def nack(self):
+        self.settled = True
+        if self._nack:
+            self._nack()
+
+    def get(self, attribute: str, default: Optional[str] = None) -> Optional[str]:
+        return self.attributes.get(attribute, default)
@@ -0,0 +1,249 @@
+"""
+Built-in metrics (counters, gauges, fixed-bucket histograms) with Prometheus text exposition
+
+e.g.,
+    from tesselite.metrics import start_http_server
+    start_http_server(9100)  # GET http://localhost:9100/metrics
+"""
+import bisect
+import threading
+from typing import Callable, Dict, Sequence, Tuple
+
+# callback durations (s)
+DEFAULT_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """child metric for these label values (keep a reference in hot paths)"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _child(self):
+        raise NotImplementedError()
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def render(self, name, labelnames, values):
+        yield f"{name}{_labels(labelnames, values)} {_number(self._value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _child(self):
+        return _CounterChild()
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ("function",)
+
+    def __init__(self):
+        super().__init__()
+        self.function = None
+
+    def set(self, value: float):
+        self._value = value
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set_function(self, function: Callable[[], float]):
+        """value computed at scrape time"""
+        self.function = function
+
+    @property
+    def value(self) -> float:
+        return self.function() if self.function else self._value
+
+    def render(self, name, labelnames, values):
+        yield f"{name}{_labels(labelnames, values)} {_number(self.value)}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _child(self):
+        return _GaugeChild()
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_counts", "_sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    def render(self, name, labelnames, values):
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative = 0
+        for bound, count in zip(self._bounds + (float("inf"),), counts):
+            cumulative += count
+            le = 'le="' + _number(bound) + '"'
+            yield f"{name}_bucket{_labels(labelnames, values, le)} {cumulative}"
+        yield f"{name}_sum{_labels(labelnames, values)} {_number(total)}"
+        yield f"{name}_count{_labels(labelnames, values)} {cumulative}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+PUBLISHED = registry.counter("tesselite_published_total", "Messages published.", ("topic",))
+CONSUMED = registry.counter("tesselite_consumed_total", "Messages processed by the callback.", ("topic",))
+FAILED = registry.counter("tesselite_failed_total", "Messages whose callback failed.", ("topic",))
+DEAD_LETTERED = registry.counter("tesselite_dead_lettered_total", "Messages routed to a dead letter topic.",
+                                 ("topic",))
+CALLBACK_SECONDS = registry.histogram("tesselite_callback_duration_seconds", "Callback duration.", ("topic",))
+RETRIES = registry.counter("tesselite_retries_total", "Connexion errors retried (backoff).", ("operation",))
+CIRCUIT_OPEN = registry.counter("tesselite_circuit_open_total", "Calls rejected by an open circuit breaker.",
+                                ("operation",))
+SPOOLED = registry.counter("tesselite_spooled_total", "Messages written to the disk spool.", ("topic",))
+SPOOL_DEPTH = registry.gauge("tesselite_spool_depth", "Messages waiting in the disk spool.", ("topic",))
+SPOOL_BYTES = registry.gauge("tesselite_spool_bytes", "Payload bytes waiting in the disk spool.", ("topic",))
+
+
+def start_http_server(port: int, addr: str = "0.0.0.0", metrics: MetricsRegistry = registry):
+    """serves GET /metrics from a daemon thread, returns the server (server.shutdown() to stop)"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    threading.Thread(target=server.serve_forever, name="tesselite-metrics", daemon=True).start()
+    return server
+
+
+def instrument(callback: Callable, topic: str, batch: bool = False) -> Callable:
+    """
+    wraps a consume callback: duration histogram, consumed/failed counters
+    batch: the callback receives a list of messages, counted one by one
+    """
+    from time import perf_counter
+    consumed, failed, seconds = CONSUMED.labels(topic), FAILED.labels(topic), CALLBACK_SECONDS.labels(topic)
+
+    def run(message):
+        started = perf_counter()
+        try:
+            result = callback(message)
+        except Exception:
+            failed.inc(len(message) if batch else 1)
+            raise
+        seconds.observe(perf_counter() - started)
+        consumed.inc(len(message) if batch else 1)
+        return result
+
+    return run
@@ -0,0 +1,321 @@
+"""
+Process pool for CPU-bound callbacks: a single reader feeds worker processes through shared memory rings,
+results (success or error) come back through a second ring per worker, no pickling per message
+
+ring layout: 64 bytes header (read position, written by the consumer), then records
+(4 bytes length, data) padded to 8 bytes, a length of 0xFFFFFFFF wraps to the start of the ring
+a ring has one producer and one consumer, a semaphore counts its records
+"""
+import itertools
+import multiprocessing
+import signal
+import struct
+import threading
+import time
+from typing import Callable, Optional
+
+from tesselite.exceptions import ConfigurationException, WorkerProcessException
+from tesselite.framing import unpack
+from tesselite.message import Message
+from tesselite.metrics import CALLBACK_SECONDS, CONSUMED, FAILED
+
+_POSITION = struct.Struct("<Q")
+_LENGTH = struct.Struct("<I")
+_WRAP = 0xFFFFFFFF
+_DATA = 64
+# task: sequence, topic size, then topic and payload (or frame)
+_TASK = struct.Struct("<QH")
+# result: sequence, failed, number of messages, callback duration (s), then the error
+_RESULT = struct.Struct("<QBId")
+_MAX_ERROR = 1000
+
+
+class Ring:
+    """
+    bounded FIFO of byte strings in shared memory, between two threads or processes
+    """
+
+    def __init__(self, size: int = 4 << 20, context=None):
+        """
+        size: ring capacity (bytes), a record can't be larger
+        context: multiprocessing context
+        """
+        context = context if context else multiprocessing.get_context()
+        self.capacity = size - size % 8
+        self._array = context.RawArray("B", _DATA + self.capacity)
+        self._records = context.Semaphore(0)
+        self._attach()
+
+    def _attach(self):
+        self._buffer = memoryview(self._array).cast("B")
+        # local positions: the head is only used by the producer, the tail by the consumer
+        self._head = self._tail = 0
+
+    def __getstate__(self):
+        # sent once, to the worker process at start
+        return {"capacity": self.capacity, "_array": self._array, "_records": self._records}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+
+    def put(self, *chunks: bytes, alive: Callable = None):
+        """
+        appends one record made of chunks, blocks while the ring is full
+        alive: called while waiting, raises to give up (e.g., the consumer is dead)
+        """
+        length = sum(map(len, chunks))
+        size = _LENGTH.size + length
+        size += -size % 8
+        if size > self.capacity:
+            raise ValueError(f"record of {length} bytes exceeds the ring capacity ({self.capacity} bytes)")
+        offset = self._head % self.capacity
+        padding = self.capacity - offset if offset + size > self.capacity else 0
+        delay = 0.00005
+        while self._head + padding + size - _POSITION.unpack_from(self._buffer, 0)[0] > self.capacity:
+            if alive:
+                alive()
+            time.sleep(delay)
+            delay = min(delay * 2, 0.01)
+        if padding:
+            _LENGTH.pack_into(self._buffer, _DATA + offset, _WRAP)
+            self._head += padding
+            offset = 0
+        start = _DATA + offset + _LENGTH.size
+        for chunk in chunks:
+            self._buffer[start:start + len(chunk)] = chunk
+            start += len(chunk)
+        _LENGTH.pack_into(self._buffer, _DATA + offset, length)
+        self._head += size
+        self._records.release()
+
+    def get(self, timeout: float = None) -> Optional[bytes]:
+        """
+        next record, None on timeout
+        """
+        if not self._records.acquire(timeout=timeout):
+            return None
+        offset = self._tail % self.capacity
+        length, = _LENGTH.unpack_from(self._buffer, _DATA + offset)
+        if length == _WRAP:
+            self._tail += self.capacity - offset
+            offset = 0
+            length, = _LENGTH.unpack_from(self._buffer, _DATA)
+        start = _DATA + offset + _LENGTH.size
+        data = bytes(self._buffer[start:start + length])
+        size = _LENGTH.size + length
+        self._tail += size + -size % 8
+        # the slot is free for the producer once the position is written
+        _POSITION.pack_into(self._buffer, 0, self._tail)
+        return data
+
+
+def _work(tasks: Ring, results: Ring, callback: Callable, codec, envelope: bool, batch: bool, attempts: int):
+    # worker process: ctrl-c is handled by the reader, which stops workers once their rings are drained
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        record = tasks.get()
+        if not record:
+            results.put(b"")
+            return
+        sequence, topic_size = _TASK.unpack_from(record)
+        topic = record[_TASK.size:_TASK.size + topic_size].decode()
+        payloads = []
+        started = time.perf_counter()
+        try:
+            payloads = unpack(record[_TASK.size + topic_size:])
+            if envelope:
+                items = [Message(payload, topic=topic, codec=codec) for payload in payloads]
+            else:
+                items = [codec.decode(payload) if codec else payload.decode() for payload in payloads]
+        except Exception as err:
+            items, error = None, _error(err)
+        # retried in place, the reader only sees the last error
+        for _ in range(attempts if items is not None else 0):
+            try:
+                if batch:
+                    callback(items)
+                else:
+                    for item in items:
+                        callback(item)
+                error = b""
+                break
+            except Exception as err:
+                error = _error(err)
+        results.put(_RESULT.pack(sequence, bool(error), len(payloads), time.perf_counter() - started), error)
+
+
+def _error(err: Exception) -> bytes:
+    return f"{err.__class__.__name__}: {err}"[:_MAX_ERROR].encode()
+
+
+class _Worker:
+
+    def __init__(self, process, tasks: Ring, results: Ring):
+        self.process = process
+        self.tasks = tasks
+        self.results = results
+        # the task ring has a single producer: concurrent submitters take turns
+        self.lock = threading.Lock()
+        # sequence => context, waiting for a result
+        self.pending = {}
+        self.collector = None
+
+
+class ProcessPool:
+    """
+    the reader submits payloads (or frames), worker processes decode them and run the callback,
+    on_done is called with the context of each submission once its result is back
+    callbacks run with their own interpreter (and GIL): CPU-bound callbacks scale with processes
+    """
+
+    def __init__(self, callback: Callable, processes: int, on_done: Callable, codec=None, envelope: bool = False,
+                 batch: bool = False, topic: str = None, attempts: int = 1, ring_bytes: int = 4 << 20,
+                 context=None, logger=None, name: str = "tesselite-process"):
+        """
+        callback: function called in worker processes, defined at module level
+            (pickled with the spawn and forkserver start methods)
+        processes: number of worker processes
+        on_done: function (context, error) called from a collector thread, error: None or the error text
+        codec, envelope, batch: how payloads are handed to the callback, see consume
+        topic: topic of envelopes (default), and of metrics
+        attempts: callback attempts per submission, error reported after the last one
+        ring_bytes: capacity of each task ring, the reader blocks while the ring of the chosen worker is full
+        context: multiprocessing context (default start method otherwise)
+        """
+        if processes < 1:
+            raise ConfigurationException(f"processes must be positive, got {processes}")
+        context = context if context else multiprocessing.get_context()
+        self._on_done = on_done
+        self._topic = topic if topic else ""
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._error = None
+        self._counters = dict(submitted=0, processed=0, failed=0)
+        self._consumed, self._failed = CONSUMED.labels(self._topic), FAILED.labels(self._topic)
+        self._seconds = CALLBACK_SECONDS.labels(self._topic)
+        if logger is None:
+            from tesselite import root_logger as logger
+        self.logger = logger
+        self._workers = []
+        for i in range(processes):
+            tasks, results = Ring(ring_bytes, context), Ring(1 << 20, context)
+            process = context.Process(target=_work, name=f"{name}-{i}", daemon=True,
+                                      args=(tasks, results, callback, codec, envelope, batch, attempts))
+            self._workers.append(_Worker(process, tasks, results))
+
+    def start(self):
+        for worker in self._workers:
+            worker.process.start()
+            worker.collector = threading.Thread(target=self._collect, args=(worker,),
+                                                name=f"{worker.process.name}-collector", daemon=True)
+            worker.collector.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        """
+        waits for submitted payloads to be processed then stops workers
+        """
+        for worker in self._workers:
+            if worker.process.is_alive():
+                try:
+                    with worker.lock:
+                        worker.tasks.put(b"", alive=lambda: self._check(worker, pool=False))
+                except WorkerProcessException:
+                    pass
+        for worker in self._workers:
+            worker.process.join(timeout=timeout)
+            worker.collector.join(timeout=timeout)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def error(self) -> Optional[WorkerProcessException]:
+        """set once a worker process died, the pool accepts no more submissions"""
+        return self._error
+
+    def _check(self, worker: _Worker, pool: bool = True):
+        if pool and self._error:
+            raise self._error
+        if not worker.process.is_alive():
+            raise WorkerProcessException(f"worker process {worker.process.name} died "
+                                         f"(exit code {worker.process.exitcode})")
+
+    def submit(self, data: bytes, context=None, topic: str = None):
+        """
+        data: a payload, or a frame of payloads (tesselite.framing), uncompressed
+        context: handed back to on_done
+        topic: of envelopes, defaults to the pool topic
+        """
+        if self._error:
+            raise self._error
+        topic = (topic if topic else self._topic).encode()
+        with self._lock:
+            # least busy worker
+            worker = min(self._workers, key=lambda candidate: len(candidate.pending))
+            sequence = next(self._sequence)
+            worker.pending[sequence] = context
+            self._counters["submitted"] += 1
+        try:
+            with worker.lock:
+                worker.tasks.put(_TASK.pack(sequence, len(topic)), topic, data, alive=lambda: self._check(worker))
+        except Exception:
+            with self._lock:
+                worker.pending.pop(sequence, None)
+                self._counters["submitted"] -= 1
+            raise
+
+    def _collect(self, worker: _Worker):
+        # results of a worker => on_done
+        while True:
+            record = worker.results.get(timeout=1)
+            if record is None:
+                if worker.process.is_alive():
+                    continue
+                # results written before dying are still in the ring
+                record = worker.results.get(timeout=0)
+                if record is None:
+                    self._died(worker)
+                    return
+            if not record:
+                return
+            sequence, failed, count, seconds = _RESULT.unpack_from(record)
+            error = record[_RESULT.size:].decode() if failed else None
+            with self._lock:
+                context = worker.pending.pop(sequence)
+                self._counters["failed" if failed else "processed"] += 1
+            if failed:
+                self._failed.inc(count)
+            else:
+                self._consumed.inc(count)
+                self._seconds.observe(seconds)
+            self._done(context, error)
+
+    def _done(self, context, error: Optional[str]):
+        try:
+            self._on_done(context, error)
+        except Exception as err:
+            self.logger.error(f"(process) result handling failed [{err.__class__.__name__}] => {err}")
+
+    def _died(self, worker: _Worker):
+        error = WorkerProcessException(f"worker process {worker.process.name} died "
+                                       f"(exit code {worker.process.exitcode})")
+        self.logger.critical(f"(process) {error}, {len(worker.pending)} message(s) in flight failed")
+        self._error = error
+        with self._lock:
+            pending, worker.pending = worker.pending, {}
+            self._counters["failed"] += len(pending)
+        for context in pending.values():
+            self._done(context, str(error))
+
+    def stats(self) -> dict:
+        """
+        message counters, in-flight messages of each worker process
+        """
+        with self._lock:
+            return dict(processes=len(self._workers), in_flight=[len(worker.pending) for worker in self._workers],
+                        **self._counters)
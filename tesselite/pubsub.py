@@ -2,25 +2,24 @@
 Handle messaging (publish/consume)
 """
 import abc
+import importlib
 import os
-from typing import Union
-import google
-import redis
-from dotenv import load_dotenv
-from typing import Callable
+from typing import Callable, Iterable, List, Type
 
-from google.api_core import exceptions as google_api_core_exceptions
-from google.cloud.pubsub_v1 import PublisherClient as google_publisher_client
-from google.cloud.pubsub_v1 import SubscriberClient as google_subscriber_client
-import socket
+from tesselite import dotenv
+from tesselite.compression import compress, decompress
+from tesselite.deadletter import unwrap
+from tesselite.framing import unpack
 
-from tesselite import GCPEnv, root_logger
-from tesselite.exceptions import connexion
-from tesselite.exceptions import MessageProcessingException
-
-# Select broker's type
-load_dotenv()
-BROKER = os.environ.get("BROKER", "GCP_PUBSUB")
+# backends are imported on demand: broker => (module, class)
+BACKENDS = {
+    "REDIS": ("tesselite.brokers.redis", "RedisPubsub"),
+    "REDIS-STREAMS": ("tesselite.brokers.redis", "RedisStreamsPubsub"),
+    "REDIS-CLUSTER": ("tesselite.brokers.redis", "RedisClusterPubsub"),
+    "REDIS-SHARDED": ("tesselite.brokers.redis", "RedisShardedPubsub"),
+    "GCP-PUBSUB": ("tesselite.brokers.gcp", "GCPPubSub"),
+    "MEMORY": ("tesselite.brokers.memory", "InMemoryPubsub"),
+}
 
 
 class Pubsub(abc.ABC):
@@ -28,6 +27,15 @@ class Pubsub(abc.ABC):
     Publish messages into a Broker
     """
 
+    # tesselite.codecs.Codec, set by backends from their `codec` argument
+    codec = None
+    # tesselite.framing.Framer, set by backends from their `frames` argument
+    framer = None
+    # tesselite.compression.Compressor, set by backends from their `compression` argument
+    compressor = None
+    # tesselite.spool.Spooler, set by backends from their `spool` argument
+    spooler = None
+
     def __enter__(self):
         self.open()
         return self
@@ -47,227 +55,87 @@ class Pubsub(abc.ABC):
     def publish(self, msg: str):
         raise NotImplementedError()
 
+    def publish_many(self, msgs: Iterable, chunk_size: int = 100) -> List:
+        """
+        publish a bunch of messages
+        default: one publish per message, backends may override with a batched path
+        """
+        return [self.publish(msg) for msg in msgs]
+
     @abc.abstractmethod
     def consume(self, callback: Callable, deadLetter: str, **kwargs):
         raise NotImplementedError()
 
+    def _encode(self, msg):
+        """serializes msg with the codec, if any"""
+        return self.codec.encode(msg) if self.codec else msg
 
-class RedisPubsub(Pubsub):
-
-
-    def __init__(self, topic: str, log_name: str = "redis-pubsub"):
-        from tesselite import Logger
-        self.logger = Logger(log_name)
-        self.log_name = log_name
-        from tesselite import RedisEnv
-        self.logger.debug("loading ..")
-        self._pubsub = None
-        self._env = RedisEnv()
-        self._client = None
-        self._topic = topic if topic else self._env.TOPIC_NAME
-        self.logger.debug("\n"
-                         "detected this config:\n"
-                         f"HOST: {self._env.HOST}\n"
-                         f"PORT: {self._env.PORT}\n"
-                         f"PASSWORD: ( "
-                         f"{ 'hidden' if self._env.PASSWORD else 'empty'} )")
-
-    @property
-    def topic(self):
-        return self._topic
+    def _bytes(self, msg) -> bytes:
+        data = self._encode(msg)
+        return data.encode() if isinstance(data, str) else data
 
-    @connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,))
-    def open(self):
-        self.logger.debug("connecting ..")
-        self._client = redis.Redis(host=self._env.HOST, port=self._env.PORT,
-                                   db=self._env.DB, password=self._env.PASSWORD)
-        self.logger.debug("pinging ..")
-        self._client.ping()
-        self.logger.info("ready.")
-
-
-    def close(self):
-        self._client.close()
-        self.logger.debug("terminated.")
+    def _compress(self, data: bytes) -> bytes:
+        """compresses data above the compressor threshold, if any"""
+        return compress(data, self.compressor) if self.compressor else data
 
+    def _payload(self, msg) -> bytes:
+        """broker message: serialized then compressed"""
+        return self._compress(self._bytes(msg))
 
-    # if standard networks errors, backoff the loop
-    @connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,))
-    def publish(self, msg: str):
-        self._client.publish(self._topic, msg)
-
-    # consume loop
-    # if standard networks errors, backoff the loop
-    @connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,))
-    def consume(self, callback: Callable, deadLetter: str = None, **kwargs):
-        self.logger.debug("consuming ..")
-
+    def _decompress(self, raw: bytes) -> bytes:
         """
-        callback: function called with message payload
-        e.g.,
-            def callback(message: str):
-                print(message)
-        deadLetter: a backup topic where unconsumed events are pushed
+        compressed payloads are detected by their header, whatever the compressor of this instance
+        the header of dead letters (tesselite.deadletter) is stripped
         """
-        # only events happening after subscription are processed
-        self._pubsub: redis.client.PubSub = self._client.pubsub(ignore_subscribe_messages=False)
-        self._pubsub.subscribe(self._topic)
-
-        # exec wrapper
-        @connexion(expected_errors=(socket.gaierror, redis.exceptions.ConnectionError,))
-        def exec_callback(message):
-            if message['type'] == 'message':
-                data = msg['data'].decode()
-                callback(data)
+        return decompress(unwrap(raw)[0], self.compressor)
 
-        # event loop
-        try:
-            for msg in self._pubsub.listen():
-                try:
-                    exec_callback(msg)
-                except Exception as err:
-                    self.logger.error(err, stack_info=True)
-                    if deadLetter:
-                        self._client.publish(deadLetter, msg)
-                    raise
-        except KeyboardInterrupt:
-            self.logger.info("graceful exit")
-        except Exception:
-            raise
+    def _unpack(self, raw: bytes) -> list:
+        """payloads carried by a broker message (decompressed, frames unpacked)"""
+        return unpack(self._decompress(raw))
 
+    def _decode(self, raw: bytes):
+        """deserializes a payload with the codec, utf-8 decodes it otherwise"""
+        return self.codec.decode(raw) if self.codec else raw.decode()
 
-class GCPPubSub(Pubsub):
 
-    def __init__(self, topic: str, log_name: str = "pubsub-gcp"):
-        from tesselite import Logger
-        self.logger = Logger(log_name)
-        self._topic_path = None
-        self.logger.debug("loading ..")
-        self._env = GCPEnv()
-        self._topic = topic if topic else self._env.TOPIC_NAME
-        self._publisher_client = None
-        self.logger.debug("\n"
-                         "detected this config:\n"
-                         f" - PROJECT: {self._env.GOOGLE_PROJECT}\n"
-                         f" - TOPIC: {self._topic}\n"
-                         f" - CREDENTIALS: ( "
-                         f"{ 'hidden' if self._env.GOOGLE_APPLICATION_CREDENTIALS else 'empty'} )")
+def _backend(broker: str) -> Type[Pubsub]:
+    module, name = BACKENDS[broker.upper().replace("_", "-")]
+    return getattr(importlib.import_module(module), name)
 
-    @property
-    def topic(self):
-        return self._topic
 
-    def open(self):
-        self._publisher_client = google_publisher_client()
-        # set topic location
-        self._topic_path = self._publisher_client.topic_path(self._env.GOOGLE_PROJECT, self.topic)
-        # check topic
-        self.check_topic()
-        self.logger.info("ready.")
-
-
-    def close(self):
-        self.logger.debug("terminated.")
-
-    @connexion(
-        expected_errors=(google_api_core_exceptions.ServiceUnavailable,),
-        noisy_errors=(google_api_core_exceptions.AlreadyExists,)
-    )
-    def check_topic(self):
-        """
-        creates a new topic if it doesn't exist
-        in production, Terraform must create topics
-        """
-        try:
-            self.logger.debug(f"checking  .. topic={self._topic_path}")
-            self._publisher_client.get_topic(topic=self._topic_path, retry=None)
-        except google_api_core_exceptions.NotFound:
-            self.logger.info(f"creating new topic .. {self._topic_path}")
-            self._publisher_client.create_topic(name=self._topic_path)
-        except:
-            raise
-
-    @connexion(
-        expected_errors=(google_api_core_exceptions.ServiceUnavailable,),
-        noisy_errors=(google_api_core_exceptions.AlreadyExists,)
-    )
-    def check_subscription(self, subscriber_client: google_subscriber_client, subscription: str):
-        """
-        creates a new subscription if it doesn't exist
-        in production, Terraform must create subscriptions for better retention
-        """
-        # check topic
-        self.check_topic()
-        try:
-            self.logger.debug(f"checking subscription .. {subscription}")
-            resource = subscriber_client.get_subscription(subscription=subscription)
-            self.logger.debug(f"name={resource.name}, topic={resource.topic}")
-            return
-        except (google_api_core_exceptions.NotFound, google_api_core_exceptions.InvalidArgument):
-            self.logger.info(f"registering new subscription .. {subscription}")
-            subscriber_client.create_subscription(name=subscription, topic=self._topic_path)
-        except Exception as err:
-            self.logger.error(err, stack_info=True)
-            raise
-
-    @connexion(
-        expected_errors=(google_api_core_exceptions.ServiceUnavailable,),
-        noisy_errors=(google_api_core_exceptions.AlreadyExists,)
-    )
-    def publish(self, msg: str):
-        call = self._publisher_client.publish(self._topic_path, msg.encode() if isinstance(msg, str) else msg)
-        return call.result()
-
-    @connexion(expected_errors=(google_api_core_exceptions.ServiceUnavailable,
-                                google_api_core_exceptions.RetryError),
-            noisy_errors = (google_api_core_exceptions.AlreadyExists, google_api_core_exceptions.NotFound, TimeoutError)
-    )
-    def consume(self, callback: Callable, subscription: str = None, deadLetter: str = None):
-        """
-        callback: function called with message payload
-        deadLetter: is a backup topic where unconsumed events are pushed
-        """
-        self.logger.debug("consuming ..")
+def _default_broker() -> str:
+    # Select broker's type
+    dotenv()
+    return os.environ.get("BROKER", "GCP_PUBSUB")
 
-        # exec wrapper
-        @connexion(expected_errors=(google_api_core_exceptions.ServiceUnavailable,
-                    MessageProcessingException, google_api_core_exceptions.NotFound,))
-        def exec_callback(message):
-            try:
-                callback(message.data.decode())
-                message.ack()
-            except Exception as err:
-                self.logger.error(f"{type(err)} {err}")
-                raise MessageProcessingException()
 
-        # event loop
-        with google_subscriber_client() as subscriber:
-            # check subscription
-            subscription_name = subscription if subscription else self._env.SUBSCRIPTION_NAME
-            subscription_path = f"projects/{os.environ['GOOGLE_PROJECT']}/subscriptions/{subscription_name}"
-            self.check_subscription(subscriber_client=subscriber, subscription=subscription_path)
-            future = subscriber.subscribe(subscription=subscription_path,
-                                          callback=exec_callback,
-                                          use_legacy_flow_control=True)
-            try:
-                future.result()
-            except KeyboardInterrupt:
-                future.cancel()
-            except Exception:
-                raise
+def __getattr__(name):
+    # backward compatibility: `from tesselite.pubsub import RedisPubsub, BROKER`
+    # BROKER is resolved on access (environment and .env at that time)
+    if name == "BROKER":
+        return _default_broker()
+    for module, backend in BACKENDS.values():
+        if backend == name:
+            return getattr(importlib.import_module(module), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-def pubsubFactory(broker:str = BROKER) -> Union[type(RedisPubsub), type(GCPPubSub)]:
+def pubsubFactory(broker:str = None) -> Type[Pubsub]:
     """creates a publisher object
-    :type broker: str: broker backend.
+    :type broker: str: broker backend, defaults to $BROKER.
         supported:
           - redis
+          - redis-streams
+          - redis-cluster (sharded pub/sub)
+          - redis-sharded (consistent hashing over independent servers)
           - gcp-pubsub
+          - memory (process-local, for tests and benchmarks)
     """
-    if broker.upper() == "REDIS":
-        return RedisPubsub
-    elif broker.upper() == "GCP-PUBSUB":
-        return GCPPubSub
-    else:
-        root_logger.fatal(f"Broker type <{BROKER}> not available yet.")
+    if broker is None:
+        broker = _default_broker()
+    try:
+        return _backend(broker)
+    except KeyError:
+        from tesselite import root_logger
+        root_logger.fatal(f"Broker type <{broker}> not available yet.")
         exit(1)
@@ -0,0 +1,59 @@
+"""
+Process-wide registry of broker clients shared by pubsub instances
+"""
+import contextlib
+import threading
+from typing import Callable, Hashable
+
+
+class Registry:
+    """
+    reference-counted resources, keyed by backend config
+    a resource is created by its first user and closed by its last one
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resources = {}
+        self._counts = {}
+
+    def acquire(self, key: Hashable, factory: Callable):
+        """
+        returns the resource registered under key, created with factory() if missing
+        """
+        with self._lock:
+            if key not in self._resources:
+                self._resources[key] = factory()
+                self._counts[key] = 0
+            self._counts[key] += 1
+            return self._resources[key]
+
+    def release(self, key: Hashable, closer: Callable = None):
+        """
+        drops a reference, closer(resource) is called when the last one is gone
+        """
+        with self._lock:
+            if key not in self._resources:
+                return
+            self._counts[key] -= 1
+            if self._counts[key] > 0:
+                return
+            resource = self._resources.pop(key)
+            del self._counts[key]
+        if closer:
+            closer(resource)
+
+    @contextlib.contextmanager
+    def shared(self, key: Hashable, factory: Callable, closer: Callable = None):
+        resource = self.acquire(key, factory)
+        try:
+            yield resource
+        finally:
+            self.release(key, closer)
+
+    def count(self, key: Hashable) -> int:
+        with self._lock:
+            return self._counts.get(key, 0)
+
+
+registry = Registry()
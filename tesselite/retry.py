@@ -0,0 +1,128 @@
+"""
+Retry policies and circuit breakers used by the connexion decorators
+"""
+import random
+import threading
+import time
+
+
+class CircuitOpenException(Exception):
+    pass
+
+
+class RetryBudget:
+    """
+    caps retries to a ratio of successful calls (token bucket)
+    e.g., ratio=0.1: at most one retry per ten successes, on top of `reserve` tokens
+    """
+
+    def __init__(self, ratio: float = 0.1, reserve: float = 10):
+        self.ratio = ratio
+        self.reserve = reserve
+        self._tokens = reserve
+
+    def deposit(self):
+        # unlocked: a lost update only skews the budget by one success
+        if self._tokens < self.reserve:
+            self._tokens += self.ratio
+
+    def withdraw(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class CircuitBreaker:
+    """
+    opens after `threshold` consecutive failures: calls fail fast for `cooldown` seconds,
+    then a single trial call decides to close it again
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._open_until = 0.
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._failures < self.threshold:
+            return "closed"
+        return "open" if time.monotonic() < self._open_until else "half-open"
+
+    def allow(self) -> bool:
+        if self._failures < self.threshold:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if now < self._open_until:
+                return False
+            # half-open: one trial, the others wait for its outcome
+            self._open_until = now + self.cooldown
+            return True
+
+    def success(self):
+        if self._failures:
+            with self._lock:
+                self._failures = 0
+                self._open_until = 0.
+
+    def failure(self) -> bool:
+        """returns True if the circuit is open"""
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold:
+                self._open_until = time.monotonic() + self.cooldown
+                return True
+            return False
+
+
+class RetryPolicy:
+    """
+    when and how long to backoff a failing operation
+    max_attempts: total number of calls (None = unbounded)
+    deadline: max time (s) spent retrying (None = unbounded)
+    delay, backoff, max_delay: exponential backoff, capped
+    jitter: full jitter, i.e., sleep uniform(0, backoff delay), spreads reconnect storms across clients
+    budget: optional RetryBudget shared by the operations using this policy
+    breaker: optional CircuitBreaker shared by the operations using this policy
+    """
+
+    def __init__(self, max_attempts: int = None, deadline: float = None, delay: float = 2, backoff: float = 2,
+                 max_delay: float = 20, jitter: bool = True, budget: RetryBudget = None,
+                 breaker: CircuitBreaker = None):
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.budget = budget
+        self.breaker = breaker
+
+    def next_delay(self, attempt: int, started: float):
+        """
+        attempt: number of failed calls so far
+        started: time.monotonic() of the first call
+        returns the backoff delay (s) or None to give up
+        """
+        if self.max_attempts is not None and attempt >= self.max_attempts:
+            return None
+        delay = min(self.delay * self.backoff ** (attempt - 1), self.max_delay)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        if self.deadline is not None and time.monotonic() - started + delay > self.deadline:
+            return None
+        if self.budget is not None and not self.budget.withdraw():
+            return None
+        return delay
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+# policies by operation, override to tune
+# operations: open, publish, consume, consume_batch, callback (per message), admin (topic/subscription checks)
+# e.g., policies["publish"] = RetryPolicy(max_attempts=5, deadline=10, breaker=CircuitBreaker())
+policies = {}
@@ -1,3 +1,4 @@
+import queue
 import threading
 from typing import Callable
 
@@ -5,12 +6,48 @@ from tesselite.exceptions import graceful
 from tesselite.pubsub import pubsubFactory
 
 
+_END = object()
+
+
+def _drain(encoder: Callable, buffer: queue.Queue):
+    """feeds the buffer with the encoder's messages"""
+    try:
+        for msg in encoder():
+            buffer.put(msg)
+    except Exception as err:
+        buffer.put(err)
+        return
+    buffer.put(_END)
+
 
 @graceful
-def publish(broker:str, encoder:Callable, topic=None):
+def publish(broker:str, encoder:Callable, topic=None, chunk_size:int=100):
+    """
+    publish loop
+    messages piling up while the previous publish is in flight (i.e., encoder is faster than one message per
+    round trip) are sent together with publish_many, otherwise messages are published one by one.
+    """
+    buffer = queue.Queue(maxsize=chunk_size * 4)
+    threading.Thread(target=_drain, args=(encoder, buffer), daemon=True).start()
     with pubsubFactory(broker=broker)(topic=topic, log_name="publisher") as pubsub:
-        for msg in encoder():
-            pubsub.publish(msg)
+        while True:
+            batch = [buffer.get()]
+            while len(batch) < chunk_size and batch[-1] is not _END and not isinstance(batch[-1], Exception):
+                try:
+                    batch.append(buffer.get_nowait())
+                except queue.Empty:
+                    break
+            tail = batch[-1]
+            if tail is _END or isinstance(tail, Exception):
+                batch.pop()
+            if len(batch) == 1:
+                pubsub.publish(batch[0])
+            elif batch:
+                pubsub.publish_many(batch, chunk_size=chunk_size)
+            if isinstance(tail, Exception):
+                raise tail
+            if tail is _END:
+                return
 
 @graceful
 def consume(broker:str, callback:Callable, topic=None, subscription=None):
@@ -30,6 +67,3 @@ def main(broker:str=None, callback:Callable=None, encoder:Callable=None, timeout
 
     consume_thread.join(timeout=timeout)
     publish_thread.join(timeout=timeout)
-
-
-
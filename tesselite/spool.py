@@ -0,0 +1,320 @@
+"""
+Write-ahead spool: publishes that fail (broker down) or arrive while a backlog exists are appended
+to memory-mapped segment files, a background thread replays them in order, in batches, once the broker is back
+
+segment layout: 8 bytes read offset, then records (4 bytes length + 1, payload), a zero length ends the segment
+a record is visible once its length is written, replayed records may be sent twice after a crash (at least once)
+"""
+import mmap
+import os
+import struct
+import threading
+from typing import Any, Callable, Iterable, List
+
+from tesselite.exceptions import SpoolFullException
+from tesselite.metrics import SPOOL_BYTES, SPOOL_DEPTH, SPOOLED
+
+_HEADER = struct.Struct("<Q")
+_LENGTH = struct.Struct("<I")
+
+
+class Segment:
+
+    def __init__(self, path: str, size: int = 0):
+        """
+        size: file size of a new segment (existing segments are reopened as is)
+        """
+        self.path = path
+        created = not os.path.exists(path)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        try:
+            if created:
+                os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, 0)
+        finally:
+            os.close(fd)
+        if created:
+            _HEADER.pack_into(self._mm, 0, _HEADER.size)
+        self.read_offset, = _HEADER.unpack_from(self._mm, 0)
+        self.write_offset = self.read_offset
+        self.depth = self.size = 0
+        for payload_size, _ in self._scan(self.read_offset):
+            self.depth += 1
+            self.size += payload_size
+            self.write_offset += _LENGTH.size + payload_size
+
+    def _scan(self, offset: int):
+        # (payload size, payload offset) of the records starting at offset
+        end = len(self._mm)
+        while offset + _LENGTH.size <= end:
+            length, = _LENGTH.unpack_from(self._mm, offset)
+            if not length or offset + _LENGTH.size + length - 1 > end:
+                return
+            yield length - 1, offset + _LENGTH.size
+            offset += _LENGTH.size + length - 1
+
+    def append(self, payload: bytes) -> bool:
+        """
+        False if the segment is full
+        """
+        start = self.write_offset + _LENGTH.size
+        if start + len(payload) > len(self._mm):
+            return False
+        self._mm[start:start + len(payload)] = payload
+        # the length is written last: a torn write is not replayed
+        _LENGTH.pack_into(self._mm, self.write_offset, len(payload) + 1)
+        self.write_offset = start + len(payload)
+        self.depth += 1
+        self.size += len(payload)
+        return True
+
+    def peek(self, count: int) -> List[bytes]:
+        payloads = []
+        for payload_size, offset in self._scan(self.read_offset):
+            if len(payloads) == count:
+                break
+            payloads.append(self._mm[offset:offset + payload_size])
+        return payloads
+
+    def commit(self, count: int):
+        """
+        forgets the first count records
+        """
+        for payload_size, offset in self._scan(self.read_offset):
+            if not count:
+                break
+            self.read_offset = offset + payload_size
+            self.depth -= 1
+            self.size -= payload_size
+            count -= 1
+        _HEADER.pack_into(self._mm, 0, self.read_offset)
+
+    def flush(self):
+        self._mm.flush()
+
+    def close(self):
+        self._mm.close()
+
+    def remove(self):
+        self.close()
+        os.remove(self.path)
+
+
+class Spool:
+    """
+    FIFO of payloads on local disk, capped to max_bytes of pending payloads
+    a directory belongs to a single publisher
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1 << 30, segment_bytes: int = 16 << 20):
+        """
+        directory: where segment files live, pending payloads of a previous run are replayed
+        max_bytes: max size of pending payloads, appends beyond raise SpoolFullException
+        segment_bytes: segment file size (larger payloads get their own segment)
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._segments = [Segment(os.path.join(directory, name))
+                          for name in sorted(os.listdir(directory)) if name.endswith(".spool")]
+        self._sequence = int(self._segments[-1].path[-26:-6]) + 1 if self._segments else 0
+
+    @property
+    def depth(self) -> int:
+        return sum(segment.depth for segment in self._segments)
+
+    @property
+    def size(self) -> int:
+        return sum(segment.size for segment in self._segments)
+
+    def append(self, payloads: Iterable[bytes]):
+        with self._lock:
+            payloads = list(payloads)
+            if self.size + sum(map(len, payloads)) > self.max_bytes:
+                raise SpoolFullException(f"spool {self.directory} is full ({self.max_bytes} bytes)")
+            for payload in payloads:
+                if not self._segments or not self._segments[-1].append(payload):
+                    self._rotate(len(payload))
+                    self._segments[-1].append(payload)
+
+    def _rotate(self, payload_size: int):
+        # lock held
+        if self._segments and not self._segments[-1].depth:
+            self._segments.pop().remove()
+        path = os.path.join(self.directory, f"{self._sequence:020d}.spool")
+        self._sequence += 1
+        size = max(self.segment_bytes, _HEADER.size + _LENGTH.size + payload_size)
+        self._segments.append(Segment(path, size))
+
+    def peek(self, count: int) -> List[bytes]:
+        """
+        the first count payloads, still pending until commit
+        """
+        with self._lock:
+            payloads = []
+            for segment in self._segments:
+                payloads.extend(segment.peek(count - len(payloads)))
+                if len(payloads) == count:
+                    break
+            return payloads
+
+    def commit(self, count: int):
+        with self._lock:
+            while count and self._segments:
+                segment = self._segments[0]
+                committed = min(count, segment.depth)
+                segment.commit(committed)
+                count -= committed
+                # consumed segments are deleted, but the tail one keeps receiving appends
+                if not segment.depth and len(self._segments) > 1:
+                    self._segments.pop(0).remove()
+                elif not segment.depth:
+                    break
+
+    def flush(self):
+        with self._lock:
+            for segment in self._segments:
+                segment.flush()
+
+    def close(self):
+        with self._lock:
+            for segment in self._segments:
+                segment.flush()
+                segment.close()
+            self._segments = []
+
+
+class Spooler:
+    """
+    publishes directly while the broker answers and nothing is spooled,
+    spools otherwise and replays from a background thread
+    """
+
+    def __init__(self, spool: Spool, send: Callable[[List[bytes]], Any], ping: Callable[[], Any],
+                 errors: tuple, topic: str, batch: int = 100, delay: float = 1, max_delay: float = 20,
+                 quarantine: Spool = None, logger=None):
+        """
+        send: publishes a list of payloads on the broker, once (no retry)
+        ping: raises one of errors while the broker is down
+        errors: connexion errors leading to the spool, replays are only retried on them
+        batch: max number of payloads per replayed send
+        delay, max_delay: replay backoff while the broker is down (s)
+        quarantine: where payloads rejected by the broker (other errors, e.g., too large) are moved,
+            defaults to <spool directory>/quarantine
+        """
+        self._spool = spool
+        self._send = send
+        self._ping = ping
+        self._errors = errors
+        self._batch = batch
+        self._delay = delay
+        self._max_delay = max_delay
+        self._quarantine = quarantine
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        if logger is None:
+            from tesselite import root_logger as logger
+        self.logger = logger
+        self._spooled = SPOOLED.labels(topic)
+        SPOOL_DEPTH.labels(topic).set_function(lambda: spool.depth)
+        SPOOL_BYTES.labels(topic).set_function(lambda: spool.size)
+
+    @property
+    def depth(self) -> int:
+        return self._spool.depth
+
+    def publish(self, payloads: List[bytes]):
+        """
+        returns the send result, None if spooled
+        raises SpoolFullException if the broker is down and the spool full
+        """
+        if not self._spool.depth:
+            try:
+                return self._send(payloads)
+            except self._errors as err:
+                self.logger.warning(f"(spool) broker unavailable [{err.__class__.__name__}] => spooling")
+        self._spool.append(payloads)
+        self._spooled.inc(len(payloads))
+        self._wakeup.set()
+        return None
+
+    def start(self):
+        """
+        starts replaying (pending payloads of a previous run first)
+        """
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="tesselite-spool", daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+
+    def close(self):
+        """
+        stops replaying, pending payloads stay on disk
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._spool.depth:
+            self.logger.warning(f"(spool) {self._spool.depth} message(s) left in {self._spool.directory}")
+        self._spool.flush()
+
+    def _run(self):
+        delay = self._delay
+        while not self._stopped.is_set():
+            if not self._spool.depth:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            try:
+                self._ping()
+                while not self._stopped.is_set():
+                    payloads = self._spool.peek(self._batch)
+                    if not payloads:
+                        break
+                    try:
+                        self._send(payloads)
+                    except self._errors:
+                        raise
+                    except Exception as err:
+                        # retrying would block the spool forever: the rejected payloads are set aside
+                        self.logger.error(f"(spool) batch rejected [{err.__class__.__name__}] => {err}, "
+                                          f"sending one by one")
+                        self._isolate(payloads)
+                        continue
+                    self._spool.commit(len(payloads))
+                self.logger.info("(spool) replayed.")
+                delay = self._delay
+            except Exception as err:
+                level = self.logger.warning if isinstance(err, self._errors) else self.logger.error
+                level(f"(spool) replay failed [{err.__class__.__name__}] => {err}, next attempt in {delay}s")
+                self._stopped.wait(delay)
+                delay = min(delay * 2, self._max_delay)
+
+    def _isolate(self, payloads: List[bytes]):
+        # payloads of a rejected batch, sent alone: the rejected ones are quarantined
+        for payload in payloads:
+            try:
+                self._send([payload])
+            except self._errors:
+                raise
+            except Exception as err:
+                self._reject(payload, err)
+            self._spool.commit(1)
+
+    def _reject(self, payload: bytes, err: Exception):
+        try:
+            if self._quarantine is None:
+                self._quarantine = Spool(os.path.join(self._spool.directory, "quarantine"))
+            self._quarantine.append([bytes(payload)])
+            self._quarantine.flush()
+            self.logger.error(f"(spool) message rejected [{err.__class__.__name__}] => {err}, "
+                              f"quarantined in {self._quarantine.directory}")
+        except Exception as _err:
+            self.logger.error(f"(spool) message rejected [{err.__class__.__name__}] => {err}, "
+                              f"dropped [{_err.__class__.__name__}] => {_err}")
@@ -0,0 +1,65 @@
+import threading
+import time
+import unittest
+import unittest.mock
+
+from tesselite.brokers.memory import InMemoryPubsub, broker
+
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.005)
+
+
+class MemoryTestCase(unittest.TestCase):
+    """
+    consumers on the in-memory broker, closed on tear down
+    """
+
+    def setUp(self):
+        self.topic = self.id()
+        self.consumers = []
+
+    def tearDown(self):
+        for pubsub, thread in self.consumers:
+            pubsub.close()
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+
+    def consume(self, callback, topic: str = None, **kwargs) -> InMemoryPubsub:
+        """starts a consumer, returns once it is subscribed"""
+        topic = topic if topic else self.topic
+        pubsub = InMemoryPubsub(topic, **{name: kwargs.pop(name) for name in ("codec", "capacity") if name in kwargs})
+        subscribers = len(broker._topics.get(topic, ()))
+        thread = threading.Thread(target=pubsub.consume, args=(callback,), kwargs=kwargs, daemon=True)
+        thread.start()
+        self.consumers.append((pubsub, thread))
+        wait_for(lambda: len(broker._topics.get(topic, ())) > subscribers)
+        return pubsub
+
+
+class FakeRedisTestCase(unittest.TestCase):
+    """
+    redis clients connected to fakeredis, a fake server per port
+    consumers run in daemon threads until the end of the tests
+    """
+    servers = {}
+
+    def setUp(self):
+        import fakeredis
+        servers = self.servers
+        patch = unittest.mock.patch("redis.Redis", lambda host=None, port=None, **kwargs: fakeredis.FakeRedis(
+            server=servers.setdefault(port, fakeredis.FakeServer())))
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.topic = self.id().rsplit(".", 1)[-1]
+
+    def consume(self, pubsub, callback, **kwargs):
+        """starts a consumer, returns once it is subscribed"""
+        pubsub.open()
+        threading.Thread(target=pubsub.consume, args=(callback,), kwargs=kwargs, daemon=True).start()
+        time.sleep(0.2)
+        return pubsub
@@ -0,0 +1,68 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from tesselite.framing import MAGIC, pack
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class AsyncRedisTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        patch = mock.patch("redis.asyncio.Redis", lambda **kwargs: fakeredis.FakeAsyncRedis(server=server))
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.topic = self.id().rsplit(".", 1)[-1]
+
+    async def receive(self, pubsub, count: int, **kwargs) -> asyncio.Task:
+        """collects count messages in a task, returns once subscribed"""
+        async def collect():
+            received = []
+            async for message in pubsub.subscribe(**kwargs):
+                received.append(message)
+                if len(received) == count:
+                    return received
+
+        task = asyncio.create_task(collect())
+        while not (await pubsub._client.pubsub_numsub(self.topic))[0][1]:
+            await asyncio.sleep(0.01)
+        return task
+
+    async def test_publish_subscribe(self):
+        from tesselite.aio import asyncPubsubFactory
+        async with asyncPubsubFactory("redis")(self.topic, codec="json") as pubsub:
+            task = await self.receive(pubsub, 4)
+            self.assertEqual(await pubsub.publish({"i": 0}), 1)
+            self.assertEqual(await pubsub.publish_many([{"i": i} for i in range(1, 4)], chunk_size=2), [1, 1, 1])
+            received = await asyncio.wait_for(task, 5)
+        self.assertEqual(received, [{"i": i} for i in range(4)])
+
+    async def test_frames_and_envelope(self):
+        from tesselite.aio import AsyncRedisPubsub
+        async with AsyncRedisPubsub(self.topic) as pubsub:
+            task = await self.receive(pubsub, 2, envelope=True)
+            await pubsub._client.publish(self.topic, pack([b"a", b"b"]))
+            received = await asyncio.wait_for(task, 5)
+        self.assertEqual([(message.data, message.topic) for message in received],
+                         [("a", self.topic), ("b", self.topic)])
+
+    async def test_undecodable_payloads_are_skipped(self):
+        from tesselite.aio import AsyncRedisPubsub
+        async with AsyncRedisPubsub(self.topic, codec="json") as pubsub:
+            task = await self.receive(pubsub, 1)
+            # not json, then a truncated frame: logged, the subscription goes on
+            await pubsub._client.publish(self.topic, b"{not json")
+            await pubsub._client.publish(self.topic, MAGIC + b"\x00\x00\x00\x09abc")
+            await pubsub.publish({"ok": 1})
+            received = await asyncio.wait_for(task, 5)
+        self.assertEqual(received, [{"ok": 1}])
+
+
+if __name__ == "__main__":
+    unittest.main()
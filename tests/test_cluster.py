@@ -0,0 +1,126 @@
+import os
+import socket
+import threading
+import time
+import unittest
+from collections import deque
+
+from tesselite.brokers.redis import RedisClusterPubsub
+from tests.helpers import wait_for
+
+
+class Node:
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class StubClusterClient:
+    """
+    slots of a cluster: channel => node, messages queued per node
+    """
+
+    def __init__(self, owners: dict):
+        self.owners = owners
+        self.messages = {}
+        self.subscribed = []
+        self.initialized = 0
+        # applied on the next slots refresh
+        self.migrations = {}
+        self.nodes_manager = self
+        self.timeouts = set()
+
+    def get_node_from_key(self, channel: str) -> Node:
+        return self.owners[channel]
+
+    def initialize(self):
+        self.initialized += 1
+        self.owners.update(self.migrations)
+
+    def pubsub(self):
+        return self
+
+    def ssubscribe(self, *channels):
+        self.subscribed.extend(channels)
+
+    def get_sharded_message(self, target_node: Node, timeout: float = 0):
+        self.timeouts.add(timeout)
+        messages = self.messages.get(target_node.name)
+        return messages.popleft() if messages else None
+
+    def send(self, node: Node, channel: str, data: bytes = b"", kind: str = "smessage"):
+        self.messages.setdefault(node.name, deque()).append(dict(type=kind, channel=channel.encode(), data=data))
+
+
+class ClusterStubTest(unittest.TestCase):
+
+    def setUp(self):
+        self.a, self.b = Node("a:7000"), Node("b:7001")
+        self.pubsub = RedisClusterPubsub("events", partitions=3)
+        self.client = StubClusterClient({"events.0": self.a, "events.1": self.b, "events.2": self.a})
+        self.pubsub._client = self.client
+
+    def test_owners(self):
+        owners = self.pubsub._owners(self.pubsub.channels)
+        self.assertEqual(sorted(node.name for node in owners), ["a:7000", "b:7001"])
+
+    def test_listen_polls_every_owner(self):
+        self.client.send(self.a, "events.0", b"0")
+        self.client.send(self.b, "events.1", b"1")
+        self.client.send(self.a, "events.2", b"2")
+        messages = self.pubsub._listen(self.pubsub.channels)
+        received = sorted(next(messages)["data"] for _ in range(3))
+        self.assertEqual(received, [b"0", b"1", b"2"])
+        self.assertEqual(self.client.subscribed, ["events.0", "events.1", "events.2"])
+        # several owners: none of them is waited on
+        self.assertEqual(self.client.timeouts, {0})
+
+    def test_slot_moved(self):
+        messages = self.pubsub._listen(self.pubsub.channels)
+        # events.1 migrates from b to a: b unsubscribes it, a owns it once the slots are refreshed
+        self.client.migrations["events.1"] = self.a
+        self.client.send(self.a, "events.0", b"0")
+        self.client.send(self.b, "events.1", kind="sunsubscribe")
+        self.assertEqual(next(messages)["data"], b"0")
+        self.client.timeouts.clear()
+        self.client.send(self.a, "events.1", b"moved")
+        self.assertEqual(next(messages)["data"], b"moved")
+        self.assertEqual(self.client.initialized, 1)
+        self.assertEqual(self.client.subscribed[-1], "events.1")
+        # a single owner left: blocks on it
+        self.assertEqual(self.client.timeouts, {0, 1.0})
+
+
+def reachable(nodes: str) -> bool:
+    try:
+        for node in nodes.split(","):
+            host, port = node.rsplit(":", 1)
+            socket.create_connection((host, int(port)), timeout=0.5).close()
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+CLUSTER_NODES = os.environ.get("REDIS_CLUSTER_NODES", "")
+
+
+@unittest.skipUnless(CLUSTER_NODES and reachable(CLUSTER_NODES),
+                     "REDIS_CLUSTER_NODES unreachable (docker compose up redis-cluster)")
+class ClusterTest(unittest.TestCase):
+
+    def test_partitions_over_nodes(self):
+        topic = f"tesselite-test-{time.time_ns()}"
+        received = []
+        consumer = RedisClusterPubsub(topic, partitions=6)
+        consumer.open()
+        threading.Thread(target=consumer.consume, args=(received.append,), daemon=True).start()
+        time.sleep(0.5)
+        with RedisClusterPubsub(topic, partitions=6) as publisher:
+            self.assertGreater(len(publisher._owners(publisher.channels)), 1)
+            publisher.publish_many([f"m{i}" for i in range(60)], key=lambda message: message)
+        wait_for(lambda: len(received) == 60, timeout=10)
+        self.assertEqual(sorted(received), sorted(f"m{i}" for i in range(60)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from tesselite.compression import HEADER_SIZE, MAGIC, ZlibCompressor, compress, decompress, get_compressor
+from tesselite.exceptions import ConfigurationException
+
+
+class CompressionTest(unittest.TestCase):
+
+    def test_header(self):
+        data = b"a" * 5000
+        compressed = compress(data, ZlibCompressor(threshold=100))
+        self.assertEqual(compressed[:HEADER_SIZE], MAGIC + bytes((ZlibCompressor.id,)))
+        self.assertLess(len(compressed), len(data))
+        self.assertEqual(decompress(compressed), data)
+
+    def test_below_threshold(self):
+        self.assertEqual(compress(b"a" * 99, ZlibCompressor(threshold=100)), b"a" * 99)
+
+    def test_incompressible(self):
+        data = bytes(range(256))
+        self.assertEqual(compress(data, ZlibCompressor(threshold=10)), data)
+
+    def test_uncompressed_passthrough(self):
+        self.assertEqual(decompress(b"plain"), b"plain")
+
+    def test_unknown_compressor(self):
+        with self.assertRaises(ValueError):
+            decompress(MAGIC + b"\xee" + b"data")
+        with self.assertRaises(ConfigurationException):
+            get_compressor("rot13")
+
+
+if __name__ == "__main__":
+    unittest.main()
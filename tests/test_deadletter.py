@@ -0,0 +1,106 @@
+import time
+import unittest
+
+from tesselite.brokers.memory import InMemoryPubsub
+from tesselite.compression import ZlibCompressor, compress
+from tesselite.deadletter import MAGIC, DeadLetterWriter, is_dead_letter, metadata, unwrap, wrap
+from tesselite.framing import pack
+from tests.helpers import MemoryTestCase, wait_for
+
+
+class DeadLetterHeaderTest(unittest.TestCase):
+
+    def test_wire_format(self):
+        raw = wrap(b"payload", {"error": "boom"})
+        self.assertTrue(raw.startswith(MAGIC))
+        self.assertEqual(raw[len(MAGIC):len(MAGIC) + 4], len(b'{"error":"boom"}').to_bytes(4, "big"))
+        self.assertEqual(unwrap(raw), (b"payload", {"error": "boom"}))
+
+    def test_plain_payload(self):
+        self.assertFalse(is_dead_letter(b"payload"))
+        self.assertEqual(unwrap(b"payload"), (b"payload", {}))
+
+    def test_metadata(self):
+        meta = metadata("orders", ValueError("boom"), 3, id="1")
+        self.assertEqual((meta["origin"], meta["error"], meta["attempts"], meta["id"]),
+                         ("orders", "ValueError: boom", 3, "1"))
+
+    def test_consumer_strips_headers(self):
+        # dead letter of a compressed frame: header, then compression, then frame
+        frame = pack([b"a" * 2000, b"b"])
+        raw = wrap(compress(frame, ZlibCompressor(threshold=100)), metadata("t", "boom", 1))
+        self.assertEqual(InMemoryPubsub("compression")._unpack(raw), [b"a" * 2000, b"b"])
+
+
+class DeadLetterTest(MemoryTestCase):
+
+    def test_dead_letter(self):
+        attempts, dead_letters = {}, []
+
+        def callback(message: str):
+            attempts[message] = attempts.get(message, 0) + 1
+            if message.startswith("bad"):
+                raise ValueError(f"cannot handle {message}")
+
+        self.consume(lambda message: dead_letters.append(message), topic=f"{self.topic}-dlq", envelope=True)
+        self.consume(callback, deadLetter=f"{self.topic}-dlq", max_attempts=3)
+        with InMemoryPubsub(self.topic) as pubsub:
+            pubsub.publish_many(["ok", "bad", "ok2"])
+        wait_for(lambda: dead_letters)
+        self.assertEqual(attempts, {"ok": 1, "bad": 3, "ok2": 1})
+        self.assertEqual(dead_letters[0].data, "bad")
+        self.assertEqual(dead_letters[0].attributes["attempts"], 3)
+        self.assertEqual(dead_letters[0].attributes["error"], "ValueError: cannot handle bad")
+
+    def test_undecodable_payload(self):
+        received, dead_letters = [], []
+        self.consume(dead_letters.append, topic=f"{self.topic}-dlq")
+        self.consume(received.append, codec="json", deadLetter=f"{self.topic}-dlq")
+        with InMemoryPubsub(self.topic) as pubsub:
+            pubsub.publish_many(["{not json", '{"ok": 1}'])
+        wait_for(lambda: received and dead_letters)
+        self.assertEqual((received, dead_letters), ([{"ok": 1}], ["{not json"]))
+
+    def test_dead_letters_are_unwrapped(self):
+        raw = []
+        self.consume(lambda message: raw.append(message), topic=f"{self.topic}-dlq")
+        self.consume(lambda message: 1 / 0, deadLetter=f"{self.topic}-dlq")
+        with InMemoryPubsub(self.topic) as pubsub:
+            pubsub.publish("payload")
+        wait_for(lambda: raw)
+        # consumers strip the dead letter header
+        self.assertEqual(raw, ["payload"])
+
+
+class DeadLetterWriterTest(unittest.TestCase):
+
+    def test_batches(self):
+        batches, sent = [], []
+        writer = DeadLetterWriter(batches.append, topic="writer-test", max_messages=10, linger=0.05)
+        for i in range(25):
+            writer.put(str(i).encode(), {"attempts": 1}, on_sent=lambda i=i: sent.append(i))
+        writer.close()
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+        self.assertEqual(sent, list(range(25)))
+        self.assertEqual(writer.depth, 0)
+
+    def test_retries_failed_sends(self):
+        batches, failures = [], [2]
+
+        def send(batch):
+            if failures[0]:
+                failures[0] -= 1
+                raise ConnectionError("down")
+            batches.append(batch)
+
+        writer = DeadLetterWriter(send, topic="writer-test", linger=0, delay=0.01, max_delay=0.02)
+        writer.put(b"a", {})
+        deadline = time.monotonic() + 5
+        while not batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+        writer.close()
+        self.assertEqual(batches, [[(b"a", {})]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import threading
+import time
+import unittest
+
+from tesselite.dispatch import DEAD_LETTER, DROP_OLDEST, Dispatcher
+from tesselite.exceptions import ConfigurationException
+
+
+class DispatcherTest(unittest.TestCase):
+
+    def test_handles_all(self):
+        handled = []
+        with Dispatcher(handled.append, workers=4) as dispatcher:
+            for i in range(100):
+                dispatcher.submit(i)
+        self.assertEqual(sorted(handled), list(range(100)))
+        self.assertEqual(dispatcher.stats()["processed"], 100)
+
+    def test_failures_are_counted(self):
+        with Dispatcher(lambda message: 1 / message, workers=1) as dispatcher:
+            dispatcher.submit(0)
+            dispatcher.submit(1)
+        self.assertEqual((dispatcher.stats()["processed"], dispatcher.stats()["failed"]), (1, 1))
+
+    def test_overflow(self):
+        release = threading.Event()
+        spilled = []
+        for overflow, spill in ((DROP_OLDEST, None), (DEAD_LETTER, spilled.append)):
+            dispatcher = Dispatcher(lambda message: release.wait(), workers=1, queue_size=2, overflow=overflow,
+                                    spill=spill).start()
+            dispatcher.submit("busy")
+            time.sleep(0.05)
+            for i in range(5):
+                dispatcher.submit(i)
+            release.set()
+            dispatcher.stop()
+            release.clear()
+            stats = dispatcher.stats()
+            self.assertEqual(stats["dropped"] + stats["spilled"], 3)
+        self.assertEqual(spilled, [2, 3, 4])
+
+    def test_configuration(self):
+        with self.assertRaises(ConfigurationException):
+            Dispatcher(print, workers=1, overflow="explode")
+        with self.assertRaises(ConfigurationException):
+            Dispatcher(print, workers=1, overflow=DEAD_LETTER)
+
+
+if __name__ == "__main__":
+    unittest.main()
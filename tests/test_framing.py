@@ -0,0 +1,58 @@
+import struct
+import time
+import unittest
+
+from tesselite.framing import MAGIC, Framer, FrameSettings, is_frame, pack, unpack
+
+
+class FramingTest(unittest.TestCase):
+
+    def test_wire_format(self):
+        frame = pack([b"ab", b""])
+        self.assertEqual(frame, MAGIC + struct.pack(">I", 2) + b"ab" + struct.pack(">I", 0))
+        self.assertTrue(is_frame(frame))
+
+    def test_round_trip(self):
+        payloads = [b"", b"x", b"\xff" * 300, "é".encode()]
+        self.assertEqual(unpack(pack(payloads)), payloads)
+
+    def test_unframed_payload(self):
+        self.assertEqual(unpack(b"hello"), [b"hello"])
+
+    def test_truncated_frame(self):
+        with self.assertRaises(ValueError):
+            unpack(pack([b"abcdef"])[:-1])
+        with self.assertRaises(ValueError):
+            unpack(MAGIC + b"\x00\x00")
+
+    def test_framer_thresholds(self):
+        frames = []
+        framer = Framer(frames.append, FrameSettings(max_bytes=10 ** 6, max_messages=3, linger=60))
+        for payload in (b"a", b"b", b"c", b"d"):
+            framer.add(payload)
+        self.assertEqual([unpack(frame) for frame in frames], [[b"a", b"b", b"c"]])
+        framer.close()
+        self.assertEqual(unpack(frames[-1]), [b"d"])
+
+    def test_framer_max_bytes(self):
+        frames = []
+        framer = Framer(frames.append, FrameSettings(max_bytes=len(MAGIC) + 2 * (4 + 4), linger=60))
+        for payload in (b"aaaa", b"bbbb", b"cccc"):
+            framer.add(payload)
+        framer.close()
+        self.assertEqual([unpack(frame) for frame in frames], [[b"aaaa", b"bbbb"], [b"cccc"]])
+
+    def test_framer_linger(self):
+        frames = []
+        framer = Framer(frames.append, FrameSettings(linger=0.01))
+        framer.add(b"a")
+        for _ in range(200):
+            if frames:
+                break
+            time.sleep(0.01)
+        framer.close()
+        self.assertEqual([unpack(frame) for frame in frames], [[b"a"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from tesselite.hashring import HashRing, partition
+from tesselite.registry import registry
+
+
+class HashRingTest(unittest.TestCase):
+
+    def test_stable(self):
+        ring, other = HashRing(["a:1", "b:2", "c:3"]), HashRing(["c:3", "a:1", "b:2"])
+        keys = [f"topic-{i}" for i in range(200)]
+        self.assertEqual([ring.get(key) for key in keys], [other.get(key) for key in keys])
+        self.assertEqual(ring.nodes, ["a:1", "b:2", "c:3"])
+
+    def test_spread(self):
+        ring = HashRing(["a:1", "b:2", "c:3"])
+        owners = [ring.get(f"topic-{i}") for i in range(3000)]
+        for node in ring.nodes:
+            self.assertGreater(owners.count(node), 600)
+
+    def test_adding_a_node_moves_few_keys(self):
+        keys = [f"topic-{i}" for i in range(3000)]
+        ring = HashRing(["a:1", "b:2", "c:3"])
+        before = {key: ring.get(key) for key in keys}
+        ring.add("d:4")
+        moved = [key for key in keys if ring.get(key) != before[key]]
+        # ~1/4 of the keys, all of them to the new node
+        self.assertLess(len(moved), len(keys) * 0.35)
+        self.assertTrue(all(ring.get(key) == "d:4" for key in moved))
+        ring.remove("d:4")
+        self.assertEqual({key: ring.get(key) for key in keys}, before)
+
+    def test_empty(self):
+        with self.assertRaises(KeyError):
+            HashRing().get("topic")
+
+    def test_partition(self):
+        self.assertEqual(partition("user-1", 8), partition(b"user-1", 8))
+        self.assertEqual({partition(f"user-{i}", 4) for i in range(100)}, {0, 1, 2, 3})
+
+
+
+class ShardedClientsTest(unittest.TestCase):
+
+    def test_concurrent_connect(self):
+        from tesselite.brokers.redis import RedisShardedPubsub
+        pubsub = RedisShardedPubsub("sharded-clients", endpoints=["a:1", "b:2"])
+
+        def factory(endpoint: str):
+            # slow enough for every thread to miss the client
+            time.sleep(0.05)
+            return mock.Mock()
+
+        pubsub._client_factory = factory
+        threads = [threading.Thread(target=pubsub._connect, args=("b:2",)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(registry.count(pubsub._endpoint_key("b:2")), 1)
+        pubsub.close()
+        self.assertEqual(registry.count(pubsub._endpoint_key("b:2")), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,21 @@
+import subprocess
+import sys
+import unittest
+
+
+def imported(statement: str) -> set:
+    """modules imported by statement, in a fresh interpreter"""
+    code = f"import sys; {statement}; print(' '.join(sys.modules))"
+    return set(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.split())
+
+
+class LazyImportTest(unittest.TestCase):
+
+    def test_cold_import(self):
+        # backends, and the .env file, are loaded on first use
+        modules = imported("import tesselite.pubsub")
+        self.assertFalse(modules & {"redis", "google.cloud.pubsub_v1", "grpc", "dotenv"})
+
+
+if __name__ == "__main__":
+    unittest.main()
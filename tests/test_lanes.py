@@ -0,0 +1,54 @@
+import time
+import unittest
+
+from tesselite.dispatch import Lanes
+from tesselite.exceptions import ConfigurationException
+from tests.helpers import FakeRedisTestCase, wait_for
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class LanesTest(unittest.TestCase):
+
+    def test_order_per_key(self):
+        handled = {}
+
+        def handler(message):
+            key, value = message
+            handled.setdefault(key, []).append(value)
+            time.sleep(0.001)
+
+        with Lanes(handler, lanes=4, key=lambda message: message[0]) as lanes:
+            for i in range(200):
+                lanes.submit((f"key-{i % 7}", i))
+        self.assertEqual(sum(map(len, handled.values())), 200)
+        self.assertTrue(all(values == sorted(values) for values in handled.values()))
+        self.assertEqual(len(lanes.stats()["lanes"]), 4)
+
+    def test_configuration(self):
+        with self.assertRaises(ConfigurationException):
+            Lanes(print, lanes=0, key=str)
+
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class RedisLanesTest(FakeRedisTestCase):
+
+    def test_key_errors_are_dead_lettered(self):
+        from tesselite.brokers.redis import RedisPubsub
+        received, dead_letters = [], []
+        self.consume(RedisPubsub(f"{self.topic}-dlq"), dead_letters.append, envelope=True)
+        self.consume(RedisPubsub(self.topic, codec="json"), received.append, lanes=2,
+                     key=lambda order: order["customer"], deadLetter=f"{self.topic}-dlq")
+        with RedisPubsub(self.topic, codec="json") as pubsub:
+            pubsub.publish_many([{"customer": 1}, {"nobody": 2}, {"customer": 3}])
+        wait_for(lambda: len(received) == 2 and dead_letters)
+        self.assertEqual(dead_letters[0].data, '{"nobody":2}')
+        self.assertEqual(dead_letters[0].attributes["error"], "KeyError: 'customer'")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import threading
+import time
+import unittest
+
+from tesselite.brokers.memory import InMemoryPubsub
+from tesselite.framing import FrameSettings
+from tesselite.pubsub import pubsubFactory
+from tests.helpers import MemoryTestCase, wait_for
+
+
+class MemoryPubsubTest(MemoryTestCase):
+
+    def test_factory(self):
+        self.assertIs(pubsubFactory("memory"), InMemoryPubsub)
+
+    def test_fan_out(self):
+        first, second = [], []
+        self.consume(first.append)
+        self.consume(second.append)
+        with InMemoryPubsub(self.topic) as pubsub:
+            self.assertEqual(pubsub.publish("hello"), 2)
+            self.assertEqual(pubsub.publish_many(["a", "b"]), [2, 2])
+        wait_for(lambda: len(first) == len(second) == 3)
+        self.assertEqual(first, ["hello", "a", "b"])
+
+    def test_codec_frames_compression(self):
+        received = []
+        self.consume(received.append, codec="json", batch=False)
+        with InMemoryPubsub(self.topic, codec="json", frames=FrameSettings(linger=60),
+                            compression="zlib") as pubsub:
+            pubsub.publish_many([{"i": i, "pad": "x" * 100} for i in range(20)])
+        wait_for(lambda: len(received) == 20)
+        self.assertEqual([message["i"] for message in received], list(range(20)))
+
+    def test_batch_envelope(self):
+        received = []
+        self.consume(received.append, batch=True, envelope=True)
+        with InMemoryPubsub(self.topic, frames=FrameSettings(linger=60)) as pubsub:
+            pubsub.publish_many(["a", "b", "c"])
+        wait_for(lambda: received)
+        self.assertEqual([message.data for message in received[0]], ["a", "b", "c"])
+        self.assertEqual(received[0][0].topic, self.topic)
+
+    def test_workers(self):
+        received = []
+        lock = threading.Lock()
+
+        def callback(message: str):
+            with lock:
+                received.append(message)
+
+        pubsub = self.consume(callback, workers=4)
+        with InMemoryPubsub(self.topic) as publisher:
+            publisher.publish_many([str(i) for i in range(100)])
+        wait_for(lambda: len(received) == 100)
+        self.assertEqual(sorted(received, key=int), [str(i) for i in range(100)])
+        self.assertEqual(pubsub.stats["processed"], 100)
+
+    def test_close_never_blocks(self):
+        # a full queue, and a queue whose consumer exited
+        release = threading.Event()
+        pubsub = self.consume(lambda message: release.wait(), capacity=2)
+        with InMemoryPubsub(self.topic, timeout=0.01) as publisher:
+            for i in range(5):
+                publisher.publish(str(i))
+        started = time.monotonic()
+        pubsub.close()
+        self.assertLess(time.monotonic() - started, 1)
+        release.set()
+
+
+if __name__ == "__main__":
+    unittest.main()
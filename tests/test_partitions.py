@@ -0,0 +1,29 @@
+import unittest
+
+from tests.helpers import FakeRedisTestCase, wait_for
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class PartitionsTest(FakeRedisTestCase):
+
+    def test_sharded_partitions(self):
+        from tesselite.brokers.redis import RedisShardedPubsub
+        endpoints = ["a:1", "b:2", "c:3"]
+        received = []
+        self.consume(RedisShardedPubsub(self.topic, partitions=4, endpoints=endpoints), received.append)
+        with RedisShardedPubsub(self.topic, partitions=4, endpoints=endpoints) as pubsub:
+            counts = pubsub.publish_many([f"m{i}" for i in range(12)], key=lambda message: message)
+        self.assertEqual(counts, [1] * 12)
+        wait_for(lambda: len(received) == 12)
+        # partitions are spread over more than one server
+        servers = [fakeredis.FakeRedis(server=self.servers[port]) for port in (1, 2, 3) if port in self.servers]
+        self.assertGreater(len([server for server in servers if server.pubsub_channels(f"{self.topic}*")]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import struct
+import threading
+import unittest
+
+from tesselite.exceptions import ConfigurationException, WorkerProcessException
+from tesselite.framing import MAGIC, pack
+from tesselite.processes import ProcessPool, Ring
+from tests.helpers import FakeRedisTestCase, wait_for
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+def callback(message: str):
+    if message == "bad":
+        raise ValueError("bad message")
+
+
+def flaky(message: str, attempts={}):
+    # fails on the first attempt of each message (per worker process)
+    attempts[message] = attempts.get(message, 0) + 1
+    if attempts[message] == 1:
+        raise ValueError("first attempt")
+
+
+def die(message: str):
+    os._exit(3)
+
+
+class RingTest(unittest.TestCase):
+
+    def test_wire_format(self):
+        ring = Ring(128)
+        ring.put(b"abc", b"de")
+        buffer = bytes(ring._array)
+        # 64 bytes header, then length + data padded to 8 bytes
+        self.assertEqual(struct.unpack_from("<I", buffer, 64)[0], 5)
+        self.assertEqual(buffer[68:73], b"abcde")
+        self.assertEqual(ring.get(timeout=0), b"abcde")
+        # read position, written by the consumer
+        self.assertEqual(struct.unpack_from("<Q", bytes(ring._array), 0)[0], 16)
+
+    def test_wrap_around(self):
+        ring = Ring(256)
+        received = []
+        reader = threading.Thread(target=lambda: received.extend(ring.get() for _ in range(500)))
+        reader.start()
+        for i in range(500):
+            ring.put(b"x" * (i % 90), str(i).encode())
+        reader.join()
+        self.assertEqual(received, [b"x" * (i % 90) + str(i).encode() for i in range(500)])
+
+    def test_empty(self):
+        self.assertIsNone(Ring(64).get(timeout=0))
+
+    def test_oversized_record(self):
+        with self.assertRaises(ValueError):
+            Ring(64).put(b"x" * 64)
+
+
+class ProcessPoolTest(unittest.TestCase):
+
+    def test_results(self):
+        results = []
+        pool = ProcessPool(callback, 2, on_done=lambda context, error: results.append((context, error)))
+        with pool:
+            for i, payload in enumerate([b"ok", b"bad", pack([b"ok", b"ok"])]):
+                pool.submit(payload, i)
+        self.assertEqual(sorted(results), [(0, None), (1, "ValueError: bad message"), (2, None)])
+        self.assertEqual(pool.stats()["processed"], 2)
+        self.assertEqual(pool.stats()["failed"], 1)
+
+    def test_attempts(self):
+        results = []
+        with ProcessPool(flaky, 1, on_done=lambda context, error: results.append(error), attempts=2) as pool:
+            pool.submit(b"a")
+        self.assertEqual(results, [None])
+
+    def test_malformed_frame(self):
+        # frame MAGIC, truncated record: a failed result, the worker keeps going
+        results = []
+        with ProcessPool(callback, 1, on_done=lambda context, error: results.append((context, error))) as pool:
+            pool.submit(MAGIC + b"\x00\x00\x00\x09abc", 0)
+            pool.submit(b"ok", 1)
+        self.assertIsNone(pool.error)
+        self.assertEqual(results[1], (1, None))
+        self.assertIn("ValueError: truncated frame", results[0][1])
+
+    def test_dead_worker(self):
+        results = []
+        done = threading.Event()
+        pool = ProcessPool(die, 1, on_done=lambda context, error: (results.append(error), done.set()))
+        with pool:
+            pool.submit(b"x")
+            self.assertTrue(done.wait(10))
+            self.assertIsInstance(pool.error, WorkerProcessException)
+            with self.assertRaises(WorkerProcessException):
+                pool.submit(b"y")
+        self.assertIn("died", results[0])
+
+    def test_configuration(self):
+        with self.assertRaises(ConfigurationException):
+            ProcessPool(callback, 0, on_done=print)
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class RedisProcessesTest(FakeRedisTestCase):
+
+    def test_malformed_frame_is_dead_lettered(self):
+        from tesselite.brokers.redis import RedisPubsub
+        from tesselite.deadletter import unwrap
+        with RedisPubsub(self.topic) as pubsub:
+            # still malformed once dead lettered: read raw
+            dead_letters = pubsub._client.pubsub(ignore_subscribe_messages=True)
+            dead_letters.subscribe(f"{self.topic}-dlq")
+            self.consume(RedisPubsub(self.topic), callback, processes=1, batch=True, deadLetter=f"{self.topic}-dlq")
+            for _ in range(2):
+                pubsub._client.publish(self.topic, MAGIC + b"\x00\x00\x00\x09abc")
+            # the worker process survives: both are dead lettered
+            received = []
+
+            def read() -> bool:
+                message = dead_letters.get_message()
+                if message:
+                    received.append(message["data"])
+                return len(received) == 2
+
+            wait_for(read, timeout=10)
+            payload, attributes = unwrap(received[0])
+            self.assertEqual(payload, MAGIC + b"\x00\x00\x00\x09abc")
+            self.assertIn("truncated frame", attributes["error"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import time
+import unittest
+
+from tesselite.exceptions import connexion
+from tesselite.retry import CircuitBreaker, CircuitOpenException, RetryBudget, RetryPolicy, policies
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_exponential_backoff(self):
+        policy = RetryPolicy(delay=1, backoff=2, max_delay=5, jitter=False)
+        started = time.monotonic()
+        self.assertEqual([policy.next_delay(attempt, started) for attempt in range(1, 6)], [1, 2, 4, 5, 5])
+
+    def test_jitter(self):
+        policy = RetryPolicy(delay=1, backoff=2, jitter=True)
+        self.assertTrue(all(0 <= policy.next_delay(3, time.monotonic()) <= 4 for _ in range(100)))
+
+    def test_max_attempts(self):
+        policy = RetryPolicy(max_attempts=3, delay=0, jitter=False)
+        self.assertEqual(policy.next_delay(2, time.monotonic()), 0)
+        self.assertIsNone(policy.next_delay(3, time.monotonic()))
+
+    def test_deadline(self):
+        policy = RetryPolicy(deadline=10, delay=4, backoff=1, jitter=False)
+        self.assertEqual(policy.next_delay(1, time.monotonic()), 4)
+        self.assertIsNone(policy.next_delay(1, time.monotonic() - 7))
+
+    def test_budget(self):
+        budget = RetryBudget(ratio=0.5, reserve=2)
+        policy = RetryPolicy(delay=0, jitter=False, budget=budget)
+        self.assertEqual([policy.next_delay(1, time.monotonic()) for _ in range(3)], [0, 0, None])
+        budget.deposit()
+        budget.deposit()
+        self.assertEqual(policy.next_delay(1, time.monotonic()), 0)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_open_half_open_closed(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+        self.assertFalse(breaker.failure())
+        self.assertTrue(breaker.failure())
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, "half-open")
+        # a single trial call
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+
+class ConnexionTest(unittest.TestCase):
+
+    def tearDown(self):
+        policies.pop("test-retry", None)
+
+    def test_retries_expected_errors(self):
+        policies["test-retry"] = RetryPolicy(max_attempts=5, delay=0, jitter=False)
+        calls = []
+
+        @connexion(expected_errors=(ConnectionError,), operation="test-retry")
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise ConnectionError("down")
+            return "ok"
+
+        self.assertEqual(flaky(), "ok")
+        self.assertEqual(len(calls), 3)
+
+    def test_gives_up(self):
+        policies["test-retry"] = RetryPolicy(max_attempts=2, delay=0, jitter=False)
+
+        @connexion(expected_errors=(ConnectionError,), operation="test-retry")
+        def down():
+            raise ConnectionError("down")
+
+        with self.assertRaises(ConnectionError):
+            down()
+
+    def test_unexpected_errors_are_raised(self):
+        calls = []
+
+        @connexion(expected_errors=(ConnectionError,), operation="test-retry")
+        def broken():
+            calls.append(1)
+            raise ValueError("bug")
+
+        with self.assertRaises(ValueError):
+            broken()
+        self.assertEqual(len(calls), 1)
+
+    def test_breaker_fails_fast(self):
+        policies["test-retry"] = RetryPolicy(max_attempts=1, breaker=CircuitBreaker(threshold=1, cooldown=60))
+
+        @connexion(expected_errors=(ConnectionError,), operation="test-retry")
+        def down():
+            raise ConnectionError("down")
+
+        with self.assertRaises(CircuitOpenException):
+            down()
+        with self.assertRaises(CircuitOpenException):
+            down()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import unittest
+
+from tesselite.exceptions import SpoolFullException
+from tesselite.spool import Segment, Spool, Spooler
+from tests.helpers import FakeRedisTestCase, wait_for
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class SpoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="tesselite-spool-")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_segment_wire_format(self):
+        path = os.path.join(self.directory, "segment")
+        segment = Segment(path, 64)
+        self.assertTrue(segment.append(b"abc"))
+        segment.flush()
+        with open(path, "rb") as file:
+            data = file.read()
+        # read offset, then length + 1 and payload, a zero length ends the segment
+        self.assertEqual(struct.unpack_from("<Q", data)[0], 8)
+        self.assertEqual(struct.unpack_from("<I", data, 8)[0], 4)
+        self.assertEqual(data[12:15], b"abc")
+        self.assertEqual(struct.unpack_from("<I", data, 15)[0], 0)
+        self.assertFalse(segment.append(b"x" * 64))
+        segment.close()
+
+    def test_fifo(self):
+        spool = Spool(self.directory, segment_bytes=64)
+        spool.append([b"a" * 20, b"b" * 20, b"c" * 20, b""])
+        self.assertEqual((spool.depth, spool.size), (4, 60))
+        self.assertEqual(spool.peek(2), [b"a" * 20, b"b" * 20])
+        spool.commit(3)
+        self.assertEqual(spool.peek(10), [b""])
+        spool.commit(1)
+        self.assertEqual(spool.depth, 0)
+        spool.close()
+
+    def test_reopen(self):
+        spool = Spool(self.directory, segment_bytes=64)
+        spool.append([b"a" * 30, b"b" * 30, b"c" * 30])
+        spool.commit(1)
+        spool.close()
+        spool = Spool(self.directory, segment_bytes=64)
+        self.assertEqual(spool.peek(10), [b"b" * 30, b"c" * 30])
+        spool.append([b"d"])
+        self.assertEqual(spool.peek(10)[-1], b"d")
+        spool.close()
+
+    def test_torn_write(self):
+        spool = Spool(self.directory)
+        spool.append([b"ok"])
+        spool.close()
+        # a record whose length was never written is not replayed
+        path = os.path.join(self.directory, sorted(os.listdir(self.directory))[0])
+        with open(path, "r+b") as file:
+            file.seek(8 + 4 + 2 + 4)
+            file.write(b"garbage")
+        self.assertEqual(Spool(self.directory).peek(10), [b"ok"])
+
+    def test_full(self):
+        spool = Spool(self.directory, max_bytes=10)
+        spool.append([b"x" * 10])
+        with self.assertRaises(SpoolFullException):
+            spool.append([b"y"])
+        spool.close()
+
+
+class SpoolerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="tesselite-spooler-")
+        self.sent, self.down = [], True
+        self.replayed = threading.Event()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def send(self, payloads):
+        if self.down:
+            raise ConnectionError("broker down")
+        if b"rejected" in map(bytes, payloads):
+            raise ValueError("too large")
+        self.sent.extend(map(bytes, payloads))
+        if b"last" in self.sent:
+            self.replayed.set()
+        return [1] * len(payloads)
+
+    def ping(self):
+        if self.down:
+            raise ConnectionError("broker down")
+
+    def spooler(self) -> Spooler:
+        return Spooler(Spool(self.directory), send=self.send, ping=self.ping, errors=(ConnectionError,),
+                       topic="spooler-test", delay=0.01, max_delay=0.02)
+
+    def test_direct(self):
+        self.down = False
+        spooler = self.spooler()
+        self.assertEqual(spooler.publish([b"a"]), [1])
+        self.assertEqual(spooler.depth, 0)
+
+    def test_replay_in_order(self):
+        spooler = self.spooler()
+        spooler.start()
+        self.assertIsNone(spooler.publish([b"a", b"b"]))
+        self.down = False
+        # a backlog exists: spooled behind it, not sent directly
+        self.assertIsNone(spooler.publish([b"last"]))
+        self.assertTrue(self.replayed.wait(10))
+        spooler.close()
+        self.assertEqual(self.sent, [b"a", b"b", b"last"])
+        self.assertEqual(spooler.depth, 0)
+
+    def test_quarantine(self):
+        spooler = self.spooler()
+        spooler.start()
+        spooler.publish([b"a", b"rejected", b"b"])
+        self.down = False
+        spooler.publish([b"last"])
+        self.assertTrue(self.replayed.wait(10))
+        spooler.close()
+        self.assertEqual(self.sent, [b"a", b"b", b"last"])
+        self.assertEqual(Spool(os.path.join(self.directory, "quarantine")).peek(10), [b"rejected"])
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class RedisSpoolTest(FakeRedisTestCase):
+
+    def test_open_while_down(self):
+        from tesselite.brokers.redis import RedisStreamsPubsub
+        directory = tempfile.mkdtemp(prefix="tesselite-spool-")
+        self.addCleanup(shutil.rmtree, directory, True)
+        with RedisStreamsPubsub(self.topic) as pubsub:
+            server = self.servers[pubsub._env.PORT]
+            server.connected = False
+            started = time.monotonic()
+            with RedisStreamsPubsub(self.topic, spool=directory) as publisher:
+                # opened without waiting for redis
+                self.assertLess(time.monotonic() - started, 1)
+                self.assertIsNone(publisher.publish("hello"))
+                self.assertEqual(publisher.spooler.depth, 1)
+                server.connected = True
+                wait_for(lambda: not publisher.spooler.depth, timeout=10)
+            self.assertEqual(pubsub._client.xrange(self.topic)[0][1][b"data"], b"hello")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import threading
+import time
+import unittest
+
+from tests.helpers import FakeRedisTestCase, wait_for
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+def pending(pubsub, group: str = "tesselite") -> int:
+    return pubsub._client.xpending(pubsub.topic, group)["pending"]
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class StreamsTest(FakeRedisTestCase):
+
+    def test_claim_idle_entries(self):
+        from tesselite.brokers.redis import RedisStreamsPubsub
+        received = []
+        with RedisStreamsPubsub(self.topic, codec="json") as pubsub:
+            pubsub.check_group("tesselite")
+            pubsub.publish({"job": 1})
+            pubsub._client.xadd(self.topic, {b"data": b"{not json"})
+            # delivered to a consumer that crashed before acking
+            pubsub._client.xreadgroup("tesselite", "crashed", {self.topic: ">"})
+            self.assertEqual(pending(pubsub), 2)
+            consumer = RedisStreamsPubsub(self.topic, consumer="alive", block=50, codec="json", min_idle=50)
+            consumer.open()
+            threading.Thread(target=consumer.consume, args=(received.append,),
+                             kwargs={"subscription": "tesselite", "deadLetter": f"{self.topic}-dlq"},
+                             daemon=True).start()
+            wait_for(lambda: received == [{"job": 1}] and pending(pubsub) == 0)
+            self.assertEqual(pubsub._client.xlen(f"{self.topic}-dlq"), 1)
+
+    def test_pending_entries_are_read_once(self):
+        from tesselite.brokers.redis import RedisStreamsPubsub
+        calls, received = [], []
+
+        def callback(job: dict):
+            calls.append(job)
+            if job == {"poison": True}:
+                raise ValueError("poison")
+            received.append(job)
+
+        with RedisStreamsPubsub(self.topic, codec="json") as pubsub:
+            pubsub.check_group("tesselite")
+            pubsub.publish({"poison": True})
+            # pending, delivered to this consumer before a restart
+            pubsub._client.xreadgroup("tesselite", "worker", {self.topic: ">"})
+            consumer = RedisStreamsPubsub(self.topic, consumer="worker", block=50, codec="json", min_idle=60000)
+            consumer.open()
+            threading.Thread(target=consumer.consume, args=(callback,), kwargs={"subscription": "tesselite"},
+                             daemon=True).start()
+            time.sleep(0.2)
+            pubsub.publish({"job": 1})
+            wait_for(lambda: received == [{"job": 1}])
+            # left pending for the claim, not replayed in a loop
+            self.assertEqual(calls.count({"poison": True}), 1)
+            self.assertEqual(pending(pubsub), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()